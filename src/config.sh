@@ -62,4 +62,12 @@ PCA_COUNT=10
 
 ###### PRS option
 POPULATION_PRS="ASN" # population: ASN, EUR, AFR
-TOOLS="CandT,Lassosum,LDpred2" # CandT,PRSice2,Lassosum,LDpred2,PRScs,GenEpi
\ No newline at end of file
+TOOLS="CandT,Lassosum,LDpred2" # CandT,PRSice2,Lassosum,LDpred2,PRScs,GenEpi
+BETA_BUNDLE="true" # save the binary beta bundle (beta.bundle) next to beta.tsv for faster scoring
+CACHE_DIR="" # cache of the trained algorithms, reused when the data, summary statistics, and options are unchanged, and of the parsed bim files ([CACHE_DIR]/bim, not counted in CACHE_SIZE); empty to disable
+CACHE_SIZE=50000 #MB, least recently used results are evicted
+EXACT_RANK="false" # rank by the sorted scores of the target cohort (rank_ref.npz) for exact tail percentiles, instead of the 104 percentiles of rank_ref.csv
+REF_STATE="" # rank_ref.npz of an existing reference cohort (e.g. a previous OUTDIR), which the target is merged into; empty to build the reference from the target only
+ROC_POINTS=0 # the maximum number of points of each ROC curve in roc.json; 0 to keep all thresholds
+BOOTSTRAP=0 # the number of bootstrap replicates of the 95% confidence intervals of the metrics (bootstrap.json); 0 to skip
+CHUNK_SIZE=0 # stream prediction.csv in chunks of this number of samples with bounded memory for large cohorts; the file is read three times, and covariates, bootstrap, or EXACT_RANK/REF_STATE of the target fall back to loading the whole file; 0 to load the whole file
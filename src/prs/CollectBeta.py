@@ -1,8 +1,10 @@
 import json
 import os
+import shutil
 from unittest import main
 
 from utils import *
+from beta_store import bundle_path, SaveBetaBundle
 
 def ArgumentsParser():
     ### define arguments
@@ -13,6 +15,7 @@ def ArgumentsParser():
     parser.add_argument("-s", "--SS_STR", type = str, required=True, help="SS_STR")
     parser.add_argument("-o", "--OUTDIR", type = str, required=True, help="OUTDIR")
     parser.add_argument("-a", "--ALGO", type = str, required=True, help="ALGO")
+    parser.add_argument("-b", "--BUNDLE", action="store_true", help="also save the binary beta bundle (beta.bundle)")
     args = parser.parse_args()
 
     args.ALGO = [ i.strip() for i in args.ALGO.split(",") ]
@@ -35,20 +38,24 @@ def CheckWeights(weights, algo_list):
     fail_list_error = []
     fail_list_nobeta = []
     for i in algo_list:
-        if i not in weights.ss_df:
+        if i not in weights.tools:
             fail_list_error.append(i)
             continue
         
-        if weights.ss_df[i].isnull().all() or (weights.ss_df[i] == 0).all():
+        if len(weights.nonzero(i)[0]) == 0:
             fail_list_nobeta.append(i)
-            weights.ss_df = weights.ss_df.drop(columns = i)
+            weights.drop(i)
 
     return weights, fail_list_error, fail_list_nobeta
 
 
-def SaveFile(OUTDIR, weights, algo_list, fail_list_error, fail_list_nobeta):
+def SaveFile(OUTDIR, weights, algo_list, fail_list_error, fail_list_nobeta, bundle=False):
     # save beta
     weights.ss_df.to_csv(f"{OUTDIR}/beta.tsv", sep='\t', index=False)
+    if bundle:
+        SaveBetaBundle(bundle_path(f"{OUTDIR}/beta.tsv"), weights)
+    elif os.path.isdir(bundle_path(f"{OUTDIR}/beta.tsv")):
+        shutil.rmtree(bundle_path(f"{OUTDIR}/beta.tsv")) # stale bundle
     
     fail_list = [ i for i in algo_list if i in fail_list_error + fail_list_nobeta ]
     DD = {
@@ -84,5 +91,5 @@ if __name__ == "__main__":
     args = ArgumentsParser()
     weights = GetWeights(args.TARGET, args.SS_STR, args.OUTDIR)
     weights, fail_list_error, fail_list_nobeta = CheckWeights(weights, args.ALGO)
-    SaveFile(args.OUTDIR, weights, args.ALGO, fail_list_error, fail_list_nobeta)
+    SaveFile(args.OUTDIR, weights, args.ALGO, fail_list_error, fail_list_nobeta, args.BUNDLE)
     
\ No newline at end of file
@@ -11,6 +11,7 @@ Created on Nov 2020
 import argparse
 import os
 import sys
+import zipfile
 import numpy as np
 import joblib
 import re
@@ -26,6 +27,9 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import seaborn as sns
 
+from plinkio import BedReader
+from render import RenderQueue
+
 """"""""""""""""""""""""""""""
 # define functions 
 """"""""""""""""""""""""""""""
@@ -36,37 +40,19 @@ def ArgumentsParser():
     parser = argparse.ArgumentParser(prog='predictor', description=str_description)
     
     ### define arguments for I/O
-    parser.add_argument("-g", required=True, help="filename of the input .gen file")
+    parser.add_argument("-g", required=False, help="filename of the input .gen file")
+    parser.add_argument("-b", required=False, help="prefix of the input bfile (.bed, .bim, .fam), read directly instead of the .gen file")
+    parser.add_argument("-r", action="store_true", help="read the bfile as a view without duplicated variants, keeping chromosomes 1-22 and X (plink2 --rm-dup force-first --chr 1-22,X)")
     parser.add_argument("-p", required=False, help="filename of the input phenotype")
     parser.add_argument("-m", required=True, help="filename of the predicting model")
     parser.add_argument("-f", required=True, help="filename of the feature file")    
     parser.add_argument("-o", required=False, help="output file path")
+    parser.add_argument("-t", required=False, default=1, type=int, help="number of processes rendering the figures, default=1")
+    parser.add_argument("-n", action="store_true", help="skip the figures")
     
     return parser
 
-def FeatureGenerator(str_inputFileName_genotype, str_inputFileName_feature, str_outputFilePath = ""):
-    ### set default output path
-    if str_outputFilePath == "":
-        str_outputFilePath = os.path.dirname(str_inputFileName_genotype) + "/predictedResult/"
-    ### if output folder doesn't exist then create it
-    if not os.path.exists(str_outputFilePath):
-        os.makedirs(str_outputFilePath)
-
-    ### get all selected snp ids
-    list_feature_rsid_all = []
-    with open(str_inputFileName_feature, "r") as file_inputFile:
-        ### grep the header
-        list_rsids = file_inputFile.readline().strip().split(",")
-        for rsid in list_rsids:
-            list_feature_rsid_all.append(rsid)
-    ### get unique selected snp ids
-    dict_feature_rsid_unique = {}
-    for item in list_feature_rsid_all:
-        for subitem in item.split("*"): # modify
-            subitem_rsid=re.sub(r"\_\S*\.?\S*", "", subitem)
-            if subitem_rsid not in dict_feature_rsid_unique:
-                dict_feature_rsid_unique[subitem_rsid] = 1
-    
+def LoadGenotypeGen(str_inputFileName_genotype, dict_feature_rsid_unique):
     ### extract selected snp from genotype file
     list_inputFile_genotype = []
     with open(str_inputFileName_genotype, 'r') as file_inputFile:
@@ -104,28 +90,113 @@ def FeatureGenerator(str_inputFileName_genotype, str_inputFileName_feature, str_
     np_genotype = np.array(list_genotype, dtype=np.int8)
     np_genotype_rsid = np.array(list_genotype_rsid)
     
-    ### generate feature
-    np_feature = np.empty([int_num_phenotype, len(list_feature_rsid_all)], dtype='int')
+    return np_genotype, np_genotype_rsid
+
+def LoadGenotypeBed(str_inputFileName_bfile, dict_feature_rsid_unique, bool_dedup = False):
+    ### select snps in the order of the .bim, as plink --extract does
+    if bool_dedup:
+        reader = BedReader(str_inputFileName_bfile, dedup=True, chroms=[str(i) for i in range(1, 23)] + ["X"])
+    else:
+        reader = BedReader(str_inputFileName_bfile)
+    np_bim_rsid = reader.bim_df['ID'].to_numpy()
+    np_snp_idx = np.flatnonzero(reader.bim_df['ID'].isin(list(dict_feature_rsid_unique.keys())).to_numpy())
+    np_allele_1 = reader.bim_df['A1'].to_numpy()[np_snp_idx]
+    np_allele_2 = reader.bim_df['A2'].to_numpy()[np_snp_idx]
+
+    ### one-hot genotype (AA, Aa, aa) of each snp, A = allele 1 of .bim; missing = (0, 0, 0)
+    np_count = reader.read(np_snp_idx) # (snps, subjects), count of allele 1
+    np_genotype = np.zeros([reader.n_samples, len(np_snp_idx) * 3], dtype=np.int8)
+    for idx_type in range(3):
+        np_genotype[:, idx_type::3] = (np_count == 2 - idx_type).T
+
+    ### rsid_A.A, rsid_A.a, rsid_a.a
+    np_genotype_rsid = np.empty(len(np_snp_idx) * 3, dtype=object)
+    np_genotype_rsid[0::3] = [str(a) + "_" + str(b) + "." + str(b) for a, b in zip(np_bim_rsid[np_snp_idx], np_allele_1)]
+    np_genotype_rsid[1::3] = [str(a) + "_" + str(b) + "." + str(c) for a, b, c in zip(np_bim_rsid[np_snp_idx], np_allele_1, np_allele_2)]
+    np_genotype_rsid[2::3] = [str(a) + "_" + str(c) + "." + str(c) for a, c in zip(np_bim_rsid[np_snp_idx], np_allele_2)]
+    np_genotype_rsid = np_genotype_rsid.astype(str)
+
+    return np_genotype, np_genotype_rsid
+
+def ResolveFeatureColumn(str_feature_rsid, dict_genotype_column):
+    ### rsid_A.a is also looked up as rsid_a.A
+    if str_feature_rsid in dict_genotype_column:
+        return dict_genotype_column[str_feature_rsid]
+    split_snp = re.split('_|\.', str_feature_rsid)
+    return dict_genotype_column[split_snp[0] + '_' + split_snp[2] + '.' + split_snp[1]]
+
+def CompileFeaturePlan(list_feature_rsid_all, np_genotype_rsid):
+    ### (features, 2) column indices of the genotype for each term; -1 for the second term of a single snp
+    dict_genotype_column = {str_rsid: idx_column for idx_column, str_rsid in enumerate(np_genotype_rsid)}
+    np_plan = np.full([len(list_feature_rsid_all), 2], -1, dtype=np.int64)
     for idx_feature in range(len(list_feature_rsid_all)):
         list_feature_rsid = list_feature_rsid_all[idx_feature].split("*")
-        if len(list_feature_rsid) == 1:
-            #np_feature[:, idx_feature] = np_genotype[:, int(np.argwhere(np_genotype_rsid == list_feature_rsid[0]))]
-            list_feature_rsid_0 = list_feature_rsid[0]
-            if len(np.argwhere(np_genotype_rsid == list_feature_rsid[0])) == 0:
-                split_snp=re.split('_|\.',list_feature_rsid_0)
-                list_feature_rsid_0=split_snp[0]+'_'+split_snp[2]+'.'+split_snp[1]
-            np_feature[:, idx_feature] = np_genotype[:, int(np.argwhere(np_genotype_rsid == "".join(list_feature_rsid_0)))]
-        else:
-            #np_feature[:, idx_feature] = np.multiply(np_genotype[:, int(np.argwhere(np_genotype_rsid == list_feature_rsid[0]))], np_genotype[:, int(np.argwhere(np_genotype_rsid == list_feature_rsid[1]))])
-            list_feature_rsid_0 = list_feature_rsid[0]
-            if len(np.argwhere(np_genotype_rsid == list_feature_rsid[0])) == 0:
-                split_snp=re.split('_|\.',list_feature_rsid_0)
-                list_feature_rsid_0=split_snp[0]+'_'+split_snp[2]+'.'+split_snp[1]
-            list_feature_rsid_1 = list_feature_rsid[1]
-            if len(np.argwhere(np_genotype_rsid == list_feature_rsid[1])) == 0:
-                split_snp=re.split('_|\.',list_feature_rsid_1)
-                list_feature_rsid_1=split_snp[0]+'_'+split_snp[2]+'.'+split_snp[1]
-            np_feature[:, idx_feature] = np.multiply(np_genotype[:, int(np.argwhere(np_genotype_rsid == "".join(list_feature_rsid_0)))], np_genotype[:, int(np.argwhere(np_genotype_rsid == "".join(list_feature_rsid_1)))])
+        for idx_term in range(min(len(list_feature_rsid), 2)):
+            np_plan[idx_feature, idx_term] = ResolveFeatureColumn(list_feature_rsid[idx_term], dict_genotype_column)
+    
+    return np_plan
+
+def LoadFeaturePlan(list_feature_rsid_all, np_genotype_rsid, str_inputFileName_plan = ""):
+    ### reuse the cached plan if it was compiled for the same features and genotype columns
+    np_feature_rsid = np.array(list_feature_rsid_all, dtype=str)
+    np_genotype_rsid = np.asarray(np_genotype_rsid, dtype=str)
+    if str_inputFileName_plan != "" and os.path.isfile(str_inputFileName_plan):
+        try:
+            with np.load(str_inputFileName_plan, allow_pickle=False) as npz_plan:
+                if np.array_equal(npz_plan["feature"], np_feature_rsid) and np.array_equal(npz_plan["genotype"], np_genotype_rsid):
+                    return npz_plan["plan"]
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            pass
+
+    np_plan = CompileFeaturePlan(list_feature_rsid_all, np_genotype_rsid)
+    if str_inputFileName_plan != "":
+        ### written to a temporary file and renamed, since target, base, and test may share the plan at the same time
+        str_tmpFileName_plan = str_inputFileName_plan + ".tmp" + str(os.getpid()) + ".npz"
+        try:
+            np.savez(str_tmpFileName_plan, feature=np_feature_rsid, genotype=np_genotype_rsid, plan=np_plan)
+            os.replace(str_tmpFileName_plan, str_inputFileName_plan)
+        except OSError:
+            print("Cannot cache the feature plan at " + str_inputFileName_plan)
+            if os.path.isfile(str_tmpFileName_plan):
+                os.remove(str_tmpFileName_plan)
+    
+    return np_plan
+
+def FeatureGenerator(str_inputFileName_genotype, str_inputFileName_feature, str_outputFilePath = "", str_genotypeFormat = "gen", str_inputFileName_plan = "", bool_dedup = False):
+    ### set default output path
+    if str_outputFilePath == "":
+        str_outputFilePath = os.path.dirname(str_inputFileName_genotype) + "/predictedResult/"
+    ### if output folder doesn't exist then create it
+    if not os.path.exists(str_outputFilePath):
+        os.makedirs(str_outputFilePath)
+
+    ### get all selected snp ids
+    list_feature_rsid_all = []
+    with open(str_inputFileName_feature, "r") as file_inputFile:
+        ### grep the header
+        list_rsids = file_inputFile.readline().strip().split(",")
+        for rsid in list_rsids:
+            list_feature_rsid_all.append(rsid)
+    ### get unique selected snp ids
+    dict_feature_rsid_unique = {}
+    for item in list_feature_rsid_all:
+        for subitem in item.split("*"): # modify
+            subitem_rsid=re.sub(r"\_\S*\.?\S*", "", subitem)
+            if subitem_rsid not in dict_feature_rsid_unique:
+                dict_feature_rsid_unique[subitem_rsid] = 1
+    
+    ### get genotype, (subjects, snps * 3) one-hot of AA, Aa, aa
+    if str_genotypeFormat == "bed":
+        np_genotype, np_genotype_rsid = LoadGenotypeBed(str_inputFileName_genotype, dict_feature_rsid_unique, bool_dedup)
+    else:
+        np_genotype, np_genotype_rsid = LoadGenotypeGen(str_inputFileName_genotype, dict_feature_rsid_unique)
+    int_num_phenotype = np_genotype.shape[0]
+    
+    ### generate feature: gather the columns of each term and multiply the pairs
+    np_plan = LoadFeaturePlan(list_feature_rsid_all, np_genotype_rsid, str_inputFileName_plan)
+    np_feature = np_genotype[:, np_plan[:, 0]].astype('int')
+    np_pair = np_plan[:, 1] >= 0
+    np_feature[:, np_pair] *= np_genotype[:, np_plan[np_pair, 1]]
     
     ### output feature
     with open(os.path.join(str_outputFilePath, "Feature.csv"), "w") as file_outputFile:
@@ -135,7 +206,7 @@ def FeatureGenerator(str_inputFileName_genotype, str_inputFileName_feature, str_
     
     return np_feature
 
-def IsolatedDataPredictor(str_inputFileName_genotype, str_inputFileName_model, str_inputFileName_feature, str_outputFilePath = "", str_mode = "c"):
+def IsolatedDataPredictor(str_inputFileName_genotype, str_inputFileName_model, str_inputFileName_feature, str_outputFilePath = "", str_mode = "c", str_genotypeFormat = "gen", bool_dedup = False):
     ### set default output path
     if str_outputFilePath == "":
         str_outputFilePath = os.path.dirname(str_inputFileName_genotype) + "/"
@@ -144,7 +215,8 @@ def IsolatedDataPredictor(str_inputFileName_genotype, str_inputFileName_model, s
         os.makedirs(str_outputFilePath)
     
     estimator = joblib.load(str_inputFileName_model)
-    np_genotype = FeatureGenerator(str_inputFileName_genotype, str_inputFileName_feature, str_outputFilePath)
+    str_inputFileName_plan = os.path.splitext(str_inputFileName_model)[0] + ".plan.npz"
+    np_genotype = FeatureGenerator(str_inputFileName_genotype, str_inputFileName_feature, str_outputFilePath, str_genotypeFormat, str_inputFileName_plan, bool_dedup)
     
     if str_mode == "c":
         list_predict = []
@@ -180,7 +252,7 @@ def fsigmoid(x, a, b):
     float_return = 1.0/(1.0+np.exp(-a*(x-b)))
     return float_return
 
-def PlotPolygenicScore(list_target, list_predict, list_proba, str_outputFilePath="", str_label=""):
+def PlotPolygenicScore(list_target, list_predict, list_proba, str_outputFilePath="", str_label="", render_queue=None):
     """
 
     Plot figure for polygenic score, including group distribution and prevalence to PGS
@@ -191,6 +263,7 @@ def PlotPolygenicScore(list_target, list_predict, list_proba, str_outputFilePath
         list_proba (list): A list containing the predition probability of each samples
         str_outputFilePath (str): File path of output file
         str_label (str): The label of the output plots
+        render_queue (RenderQueue): The queue rendering the figures; figures are rendered before return if None
 
     Returns:
         None
@@ -198,6 +271,9 @@ def PlotPolygenicScore(list_target, list_predict, list_proba, str_outputFilePath
     """
 
     float_f1Score = skMetric.f1_score(list_target, list_predict)
+    str_method = "GenEpi"
+    str_title = str_method + ' Predicting F1 Score: ' + "%.4f" % float_f1Score + ' '
+    queue = render_queue if render_queue is not None else RenderQueue()
 
     #-------------------------
     # group distribution
@@ -206,40 +282,17 @@ def PlotPolygenicScore(list_target, list_predict, list_proba, str_outputFilePath
     pd_pgs.columns = ['target', 'predict', 'proba']
 
     int_bin = 25
-    plt.figure(figsize=(5,5))
-    
-    # plot case
-    pd_case = pd_pgs[pd_pgs.target == 1.0]
-    plt.hist(pd_case['proba'], bins=int_bin, label='Case', color="#e68fac", weights=np.ones_like(pd_case['proba'])/float(len(pd_case['proba'])))
-    bin_heights, bin_borders = np.histogram(pd_case['proba'], bins=int_bin)
-    bin_heights = bin_heights / float(len(pd_case['proba']))
-    bin_widths = np.diff(bin_borders)
-    bin_centers = bin_borders[:-1] + bin_widths / 2
-    popt, _ = curve_fit(gaussian, bin_centers, bin_heights, maxfev=100000000)
-    x_interval_for_fit = np.linspace(bin_borders[0], bin_borders[-1], 10000)
-    plt.plot(x_interval_for_fit, gaussian(x_interval_for_fit, *popt), c="#b3446c")
-
-    # plot control
-    pd_control = pd_pgs[pd_pgs.target == 0.0]
-    plt.hist(pd_control['proba'], bins=int_bin, label='Control', color="#4997d0", weights=np.ones_like(pd_control['proba'])/float(len(pd_control['proba'])))
-    bin_heights, bin_borders = np.histogram(pd_control['proba'], bins=int_bin)
-    bin_heights = bin_heights / float(len(pd_control['proba']))
-    bin_widths = np.diff(bin_borders)
-    bin_centers = bin_borders[:-1] + bin_widths / 2
-    popt, _ = curve_fit(gaussian, bin_centers, bin_heights, maxfev=100000000)
-    x_interval_for_fit = np.linspace(bin_borders[0], bin_borders[-1], 10000)
-    plt.plot(x_interval_for_fit, gaussian(x_interval_for_fit, *popt), c="#00416a")
-
-    # plot formatting
-    str_method = "GenEpi"
-    plt.legend(prop={'size': 12})
-    plt.title(str_method + ' Predicting F1 Score: ' + "%.4f" % float_f1Score + ' ')
-    plt.xlim(0, 1)
-    plt.ylim(0, 0.5)
-    plt.xlabel('Polygenic Score')
-    plt.ylabel('Fraction of samples by group')
-    plt.savefig(os.path.join(str_outputFilePath, str("GenEpi_PGS_" + str_label + ".png")), dpi=300)
-    plt.close('all')
+    list_group = []
+    for float_target, str_group, str_color, str_fitColor in [(1.0, 'Case', "#e68fac", "#b3446c"), (0.0, 'Control', "#4997d0", "#00416a")]:
+        np_proba = pd_pgs[pd_pgs.target == float_target]['proba'].to_numpy()
+        bin_heights, bin_borders = np.histogram(np_proba, bins=int_bin)
+        bin_heights = bin_heights / float(len(np_proba))
+        bin_widths = np.diff(bin_borders)
+        bin_centers = bin_borders[:-1] + bin_widths / 2
+        popt, _ = curve_fit(gaussian, bin_centers, bin_heights, maxfev=100000000)
+        x_interval_for_fit = np.linspace(bin_borders[0], bin_borders[-1], 10000)
+        list_group.append((np_proba, str_group, str_color, x_interval_for_fit, gaussian(x_interval_for_fit, *popt), str_fitColor))
+    queue.submit(DrawGroupDistribution, list_group, int_bin, str_title, os.path.join(str_outputFilePath, str("GenEpi_PGS_" + str_label + ".png")))
 
     #-------------------------
     # prevalence to PGS
@@ -260,26 +313,50 @@ def PlotPolygenicScore(list_target, list_predict, list_proba, str_outputFilePath
     pd_rr = (pd_rr_ingroup_case / pd_rr_ingroup_sum) / (pd_pgs.sum()[['target']] / pd_pgs.count()[['target']])
     pd_rr.columns = ['Relative Risk']
 
+    popt, pcov = sp.optimize.curve_fit(fsigmoid, pd_prevalence_pre.index, pd_prevalence_pre['pre'], method='dogbox', bounds=([0., 0.],[1., 100.]))
+    queue.submit(DrawPrevalence, pd_prevalence_obs, pd_rr, pd_prevalence_pre.index, fsigmoid(pd_prevalence_pre.index, *popt), str_title, os.path.join(str_outputFilePath, str("GenEpi_Prevalence_" + str_label + ".png")))
+
+    #-------------------------
+    # plot ROC
+    #-------------------------
+    fpr, tpr, _ = skMetric.roc_curve(list_target, np.array(list_proba)[:,1])
+    float_auc = skMetric.auc(fpr, tpr)
+    queue.submit(DrawROC, fpr, tpr, float_auc, os.path.join(str_outputFilePath, str("GenEpi_ROC_" + str_label + ".png")))
+
+    if render_queue is None:
+        queue.close()
+
+def DrawGroupDistribution(list_group, int_bin, str_title, str_outputFileName):
+    plt.figure(figsize=(5,5))
+    for np_proba, str_group, str_color, np_fitX, np_fitY, str_fitColor in list_group:
+        plt.hist(np_proba, bins=int_bin, label=str_group, color=str_color, weights=np.ones_like(np_proba)/float(len(np_proba)))
+        plt.plot(np_fitX, np_fitY, c=str_fitColor)
+
+    # plot formatting
+    plt.legend(prop={'size': 12})
+    plt.title(str_title)
+    plt.xlim(0, 1)
+    plt.ylim(0, 0.5)
+    plt.xlabel('Polygenic Score')
+    plt.ylabel('Fraction of samples by group')
+    plt.savefig(str_outputFileName, dpi=300)
+    plt.close('all')
+
+def DrawPrevalence(pd_prevalence_obs, pd_rr, np_fitX, np_fitY, str_title, str_outputFileName):
     plt.figure(figsize=(5,5))
     sns.scatterplot(x=pd_prevalence_obs.index, y=pd_prevalence_obs['obs'], hue=pd_rr['Relative Risk'], palette=sns.cubehelix_palette(8, start=.5, rot=-.75, as_cmap=True))
-    popt, pcov = sp.optimize.curve_fit(fsigmoid, pd_prevalence_pre.index, pd_prevalence_pre['pre'], method='dogbox', bounds=([0., 0.],[1., 100.]))
-    sns.lineplot(x=pd_prevalence_pre.index, y=fsigmoid(pd_prevalence_pre.index, *popt), color="black")
+    sns.lineplot(x=np_fitX, y=np_fitY, color="black")
 
     plt.legend(prop={'size': 12}, loc='upper left')
-    plt.title(str_method + ' Predicting F1 Score: ' + "%.4f" % float_f1Score + ' ')
+    plt.title(str_title)
     plt.xlim(0, 100)
     plt.ylim(0, 1)
     plt.xlabel('Polygenic Score Percentile')
     plt.ylabel('Prevalence of Percentile Group')
-    plt.savefig(os.path.join(str_outputFilePath, str("GenEpi_Prevalence_" + str_label + ".png")), dpi=300)
+    plt.savefig(str_outputFileName, dpi=300)
     plt.close('all')
 
-    #-------------------------
-    # plot ROC
-    #-------------------------
-    fpr, tpr, _ = skMetric.roc_curve(list_target, np.array(list_proba)[:,1])
-    float_auc = skMetric.auc(fpr, tpr)
-
+def DrawROC(fpr, tpr, float_auc, str_outputFileName):
     plt.figure(figsize=(5,5))
     plt.plot(fpr, tpr, color='#e68fac', lw=2, label='Class 1 ROC curve (area = %0.2f)' % float_auc)
     plt.plot([0, 1], [0, 1], color='black', lw=2, linestyle='--')
@@ -290,7 +367,7 @@ def PlotPolygenicScore(list_target, list_predict, list_proba, str_outputFilePath
     plt.ylim([0.0, 1.0])
     plt.xlabel('False Positive Rate')
     plt.ylabel('True Positive Rate')
-    plt.savefig(os.path.join(str_outputFilePath, str("GenEpi_ROC_" + str_label + ".png")), dpi=300)
+    plt.savefig(str_outputFileName, dpi=300)
     plt.close('all')
 
 """"""""""""""""""""""""""""""
@@ -301,15 +378,23 @@ def main(args=None):
     args = ArgumentsParser().parse_args(args)
     
     ### get arguments for I/O
-    str_file_genotype = args.g
+    if args.b is not None:
+        str_file_genotype = args.b
+        str_genotypeFormat = "bed"
+    elif args.g is not None:
+        str_file_genotype = args.g
+        str_genotypeFormat = "gen"
+    else:
+        print("Either -g or -b is required")
+        sys.exit(1)
     str_path_model = args.m
     str_file_feature = args.f
     str_path_output = args.o
 
     if "Classifier" in str_path_model:
-        list_predict, list_proba = IsolatedDataPredictor(str_file_genotype, str_path_model, str_file_feature, str_path_output, "c")
+        list_predict, list_proba = IsolatedDataPredictor(str_file_genotype, str_path_model, str_file_feature, str_path_output, "c", str_genotypeFormat, args.r)
     else:
-        list_predict, list_proba = IsolatedDataPredictor(str_file_genotype, str_path_model, str_file_feature, str_path_output, "r")
+        list_predict, list_proba = IsolatedDataPredictor(str_file_genotype, str_path_model, str_file_feature, str_path_output, "r", str_genotypeFormat, args.r)
 
     ### plot prs
     if args.p is not None:
@@ -332,7 +417,9 @@ def main(args=None):
         if list_proba: list_proba = np.array(list_proba)[~list_na]
 
         if "Classifier" in str_path_model:
-            PlotPolygenicScore(list_target, list_predict, list_proba, str_path_output)
+            if not args.n:
+                with RenderQueue(args.t) as render_queue:
+                    PlotPolygenicScore(list_target, list_predict, list_proba, str_path_output, render_queue=render_queue)
         else:
             print(sp.stats.pearsonr(list_target, list_predict))
 
@@ -0,0 +1,400 @@
+#!/usr/bin/python3
+
+import os, sys, gzip, json, time, asyncio, argparse
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from collections import OrderedDict
+from plinkio import BedReader
+from ScorePRS import ScoreWeights
+from utils import CovResults, ExactRankRef
+
+
+def ArgumentParser():
+    parser = argparse.ArgumentParser(prog='PRSService', description='long-lived PRS scoring service of single individuals; newline-delimited JSON over a Unix socket or TCP')
+    parser.add_argument('--model_dir', required=True, help='the output directory of run_prs.sh')
+    parser.add_argument('-m', '--method', required=True, help='the method of PRS models; clf or reg')
+    parser.add_argument('--beta', required=False, default='', help='the beta file, default=[model_dir]/beta.tsv (the beta bundle is used when fresh)')
+    parser.add_argument('--rank_ref', required=False, default='', help='the rank reference file, default=[model_dir]/rank_ref.csv')
+    parser.add_argument('--hist_ref', required=False, default='', help='the histogram reference file, default=[model_dir]/hist_ref.csv')
+    parser.add_argument('--cov_dir', required=False, default='', help='the directory of covariate models (models.json, rank_ref.csv), default=[model_dir]/analysis/target/cov')
+    parser.add_argument('--exact_rank', action='store_true', help='rank by the sorted scores of the cohort ([rank_ref].npz) when available')
+    parser.add_argument('--socket', required=False, default='', help='the Unix socket to listen on; TCP is used if not given')
+    parser.add_argument('--host', required=False, default='127.0.0.1', help='the TCP host, default=127.0.0.1')
+    parser.add_argument('--port', required=False, default=8765, type=int, help='the TCP port, default=8765')
+    parser.add_argument('--batch_size', required=False, default=64, type=int, help='the maximum number of individuals scored in a batch, default=64')
+    parser.add_argument('--batch_wait', required=False, default=5, type=float, help='the maximum time (ms) a request waits for its batch, default=5')
+    parser.add_argument('--max_bfiles', required=False, default=4, type=int, help='the number of bfiles of bed requests kept open, least recently used first evicted, default=4')
+    return parser
+
+
+# PRS models of run_prs.sh loaded in memory, scoring individuals in batches
+# request: {"id": ..., "genotypes": {ID: genotype}} | {"vcf": file} | {"bfile": prefix, "iid": IID, "fid": FID}, and optional {"covariates": {COV: value}}
+# genotype: the count of A1 of beta.tsv (0, 1, 2), or alleles such as "A/G", "A|G", "AG"; missing genotypes contribute 0 as plink --score-no-mean-imputation
+class PRSModel():
+    def __init__(self, beta_file, rank_ref_file, method, hist_ref_file='', cov_dir='', exact=False, max_bfiles=4):
+        print('\n\n###### Loading PRS Models ######\n\n')
+        start = time.time()
+
+        # checking method
+        if method not in ['clf', 'reg']:
+            raise ValueError('Method must be clf or reg')
+        self.method = method
+        self.exact = exact
+
+        # weights: unique IDs, A1, and (variants, tools) weights of the non-zero variants
+        self.weights = ScoreWeights(beta_file)
+        self.tools = self.weights.tools
+        self.id_index = pd.Index(self.weights.ids)
+        self.a1 = pd.Series(self.weights.a1).astype(str).str.upper().to_numpy()
+
+        # cohort reference
+        self.rank_ref = self._read_rank_ref(rank_ref_file)
+        self.hist_ref = pd.read_csv(hist_ref_file, index_col=0) if os.path.isfile(hist_ref_file) else None
+
+        # covariate models, stacked as CovResults.Test
+        self.cov_tools = list()
+        if os.path.isfile('{}/models.json'.format(cov_dir)):
+            with open('{}/models.json'.format(cov_dir), 'r') as f:
+                model_dict = json.load(f)
+            self.cov_tools = [tool for tool in ['cov'] + self.tools if tool in model_dict]
+            self.cov_features = list()
+            for tool in self.cov_tools:
+                self.cov_features += [col for col in model_dict[tool]['columns'] if col not in self.cov_features]
+            self.cov_weight, self.cov_intercept, self.cov_na_weight = CovResults._stack_models(model_dict, self.cov_tools, self.cov_features)
+            self.cov_rank_ref = self._read_rank_ref('{}/rank_ref.csv'.format(cov_dir))
+
+        # aligned bfiles of bed requests: bfile -> (size and mtime of .bed/.bim/.fam, aligned reader), in LRU order
+        self._bfiles = OrderedDict()
+        self.max_bfiles = max(1, max_bfiles)
+        print('{} algorithms, {} variants, {} covariate models; loaded in {:.2f}s'.format(
+            len(self.tools), len(self.weights.ids), len(self.cov_tools), time.time() - start))
+
+
+    def __call__(self, request):
+        start = time.time()
+        result = self.score([request])[0]
+        if 'error' in result:
+            raise ValueError(result['error'])
+        result['time_ms'] = (time.time() - start) * 1000
+        return result
+
+
+    def score(self, requests):
+        # a batch of individuals: dosages as a sparse (individuals, variants) matrix scored by one product with the weights
+        results = [None] * len(requests)
+        batch, rows, counts, n_observed = list(), list(), list(), list()
+        for k, dosage in self._dosages(requests):
+            if isinstance(dosage, Exception):
+                results[k] = {'id': requests[k].get('id'), 'error': '{}: {}'.format(type(dosage).__name__, dosage)}
+                continue
+            batch.append(k)
+            rows.append(dosage[0])
+            counts.append(dosage[1])
+            n_observed.append(dosage[2])
+        if len(batch) == 0:
+            return results
+
+        dosage = sparse.csr_matrix((np.concatenate(counts), np.concatenate(rows), np.cumsum([0] + [len(i) for i in rows])),
+                                   shape=(len(batch), len(self.weights.ids)))
+        scores = np.asarray(dosage @ self.weights.weights) # (individuals, tools); SCORESUM
+
+        # ranks and histogram bins of each algorithm
+        ranks = self._ranks(self.rank_ref, self.tools, scores)
+        bins = dict()
+        if self.hist_ref is not None:
+            for i, tool in enumerate(self.tools):
+                if tool in self.rank_ref:
+                    ref_scores = self.rank_ref[tool][0]
+                    edges = np.linspace(ref_scores[0], ref_scores[-1], self.hist_ref.shape[0] + 1)
+                    bins[tool] = np.clip(np.searchsorted(edges, scores[:, i], side='right') - 1, 0, self.hist_ref.shape[0] - 1)
+
+        # covariate-adjusted risks of the individuals with covariates
+        cov_batch = [b for b, k in enumerate(batch) if 'covariates' in requests[k]] if len(self.cov_tools) > 0 else []
+        if len(cov_batch) > 0:
+            risks = self._cov_risk(scores[cov_batch], [requests[batch[b]]['covariates'] for b in cov_batch])
+            cov_ranks = self._ranks(self.cov_rank_ref, self.cov_tools, risks)
+        cov_idx = {b: n for n, b in enumerate(cov_batch)}
+
+        for b, k in enumerate(batch):
+            result = {'id': requests[k].get('id'), 'n_variants': n_observed[b], 'algorithms': dict()}
+            for i, tool in enumerate(self.tools):
+                result['algorithms'][tool] = {'score': float(scores[b, i]), 'rank': None if ranks[i] is None else float(ranks[i][b])}
+                if tool in bins:
+                    result['algorithms'][tool]['hist_bin'] = int(bins[tool][b])
+            if b in cov_idx:
+                n = cov_idx[b]
+                result['cov'] = {tool: {'risk': float(risks[n, i]), 'rank': None if cov_ranks[i] is None else float(cov_ranks[i][n])}
+                                 for i, tool in enumerate(self.cov_tools)}
+            results[k] = result
+        return results
+
+
+    def _dosages(self, requests):
+        # (index, (rows, A1 counts, observed variants)) of each request, or (index, error); bed requests of a bfile are read together
+        bed = dict()
+        for k, request in enumerate(requests):
+            try:
+                if 'genotypes' in request:
+                    yield k, self._dict_dosage(request['genotypes'])
+                elif 'vcf' in request:
+                    yield k, self._vcf_dosage(request['vcf'])
+                elif 'bfile' in request:
+                    if 'iid' not in request:
+                        raise ValueError('iid is required with bfile')
+                    bed.setdefault(request['bfile'], list()).append(k)
+                else:
+                    raise ValueError('one of genotypes, vcf, and bfile is required')
+            except Exception as e:
+                yield k, e
+        for bfile, ks in bed.items():
+            try:
+                yield from zip(ks, self._bed_dosage(bfile, [(requests[k].get('fid'), requests[k]['iid']) for k in ks]))
+            except Exception as e:
+                for k in ks:
+                    yield k, e
+
+
+    def _dict_dosage(self, genotypes):
+        rows = self.id_index.get_indexer(list(genotypes.keys()))
+        hit = np.flatnonzero(rows >= 0)
+        rows = rows[hit]
+        values = pd.Series(list(genotypes.values()), dtype=object).iloc[hit].reset_index(drop=True)
+        return self._dosage(rows, values)
+
+
+    def _vcf_dosage(self, vcf_file):
+        # a single-sample VCF; the GT of the variants in beta become allele strings
+        rows, values = list(), list()
+        with (gzip.open(vcf_file, 'rt') if vcf_file.endswith('.gz') else open(vcf_file, 'r')) as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                fields = line.rstrip('\n').split('\t', 10)
+                row = self.id_index.get_indexer([fields[2]])[0]
+                if row < 0:
+                    continue
+                alleles = [fields[3]] + fields[4].split(',')
+                gt = dict(zip(fields[8].split(':'), fields[9].split(':'))).get('GT', '.')
+                gt = gt.replace('|', '/').split('/')
+                rows.append(row)
+                values.append(None if '.' in gt else '/'.join(alleles[int(i)] for i in gt))
+        return self._dosage(np.array(rows, dtype=np.int64), pd.Series(values, dtype=object))
+
+
+    def _bed_dosage(self, bfile, samples):
+        # samples (FID or None, IID) of a bfile, read through a view without duplicated variants as predictor.sh
+        reader, pos, bim_idx, is_a2 = self._aligned_bfile(bfile)
+        sample_idx = [reader.sample_index([(fid, iid)] if fid is not None else [iid]) for fid, iid in samples]
+        found = [i[0] for i in sample_idx if len(i) > 0]
+        if len(found) > 0:
+            geno = reader.read(bim_idx, samples=found).astype(np.float64)
+            observed = geno >= 0
+            geno[is_a2] = 2 - geno[is_a2]
+            geno[~observed] = 0
+
+        # samples not in the fam fail alone
+        dosages, n = list(), 0
+        for (fid, iid), sample in zip(samples, sample_idx):
+            if len(sample) == 0:
+                dosages.append(ValueError('{} is not in {}.fam'.format(iid, bfile)))
+                continue
+            dosages.append((pos, geno[:, n], int(observed[:, n].sum())))
+            n += 1
+        return dosages
+
+
+    def _aligned_bfile(self, bfile):
+        # the reader and the variants of beta aligned to it; realigned when the bfile changes on disk
+        stamp = tuple((os.stat(file).st_size, os.stat(file).st_mtime_ns) for file in ['{}.{}'.format(bfile, ext) for ext in ['bed', 'bim', 'fam']])
+        if bfile in self._bfiles and self._bfiles[bfile][0] == stamp:
+            self._bfiles.move_to_end(bfile)
+            return self._bfiles[bfile][1]
+        self._bfiles.pop(bfile, None)
+        reader = BedReader(bfile, dedup=True)
+        self._bfiles[bfile] = (stamp, (reader, *reader.match_alleles(self.weights.ids, self.weights.a1)))
+        while len(self._bfiles) > self.max_bfiles:
+            self._bfiles.popitem(last=False)
+        return self._bfiles[bfile][1]
+
+
+    def _dosage(self, rows, values):
+        # the count of A1 of each variant; numbers are counts of A1, strings are alleles
+        if len(rows) == 0:
+            return rows, np.zeros(0), 0
+        numeric = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+        is_str = values.map(lambda x: isinstance(x, str)).to_numpy()
+
+        count = np.where(is_str, np.nan, numeric)
+        if is_str.any():
+            genotype = values[is_str].str.upper().str.strip()
+            split = genotype.str.split(r'[/|]', n=1, expand=True, regex=True)
+            if split.shape[1] == 1: # no separator: one character per allele
+                split = pd.DataFrame({0: genotype.str[:1], 1: genotype.str[1:]})
+            no_sep = split[1].isna()
+            split.loc[no_sep, 0] = genotype[no_sep].str[:1]
+            split.loc[no_sep, 1] = genotype[no_sep].str[1:]
+            a1 = self.a1[rows[is_str]]
+            missing = split.isin(['.', '', 'N', '0']).any(axis=1).to_numpy() | genotype.isin(['NA', 'NAN']).to_numpy()
+            count[is_str] = np.where(missing, np.nan, (split[0].to_numpy() == a1).astype(float) + (split[1].to_numpy() == a1))
+
+        # missing genotypes contribute 0; a variant listed twice is scored twice as plink
+        observed = ~np.isnan(count)
+        return rows[observed], count[observed], int(observed.sum())
+
+
+    def _cov_risk(self, scores, covariates):
+        # the same as CovResults.Test: NA features contribute 0 after scaling
+        tool_idx = {tool: i for i, tool in enumerate(self.tools)}
+        x = np.array([[scores[n, tool_idx[col]] if col in tool_idx else cov.get(col, np.nan) for col in self.cov_features]
+                      for n, cov in enumerate(covariates)], dtype=np.float64)
+        na = np.isnan(x)
+        x[na] = 0
+        pred = x @ self.cov_weight + self.cov_intercept + na.astype(float) @ self.cov_na_weight
+        if self.method == 'clf':
+            pred = 1 / (1 + np.exp(-pred))
+        return pred
+
+
+    def _read_rank_ref(self, rank_ref_file):
+        # tool -> (scores, ranks) as CohortRef
+        rank_ref = dict()
+        if not os.path.isfile(rank_ref_file):
+            return rank_ref
+        rank_ref_df = pd.read_csv(rank_ref_file, index_col=0)
+        if rank_ref_df.index.name is not None:
+            rank_ref_df = pd.read_csv(rank_ref_file)
+        for tool in rank_ref_df.columns:
+            rank_ref[tool] = (rank_ref_df[tool].to_numpy(dtype=np.float64), rank_ref_df.index.to_numpy(dtype=np.float64))
+
+        # exact: the distinct scores of the cohort and their ranks replace the percentiles
+        if self.exact and os.path.isfile(ExactRankRef.path(rank_ref_file)):
+            exact_ref = ExactRankRef.load(ExactRankRef.path(rank_ref_file))
+            for tool in exact_ref.tools:
+                rank_ref[tool] = exact_ref.grid(tool)
+        return rank_ref
+
+
+    def _ranks(self, rank_ref, tools, values):
+        # ranks of the (individuals, tools) values; None for the tools without reference
+        return [np.interp(values[:, i], rank_ref[tool][0], rank_ref[tool][1]) if tool in rank_ref else None
+                for i, tool in enumerate(tools)]
+
+
+# requests coalesced into batches of up to batch_size individuals or batch_wait milliseconds, each scored by PRSModel.score
+class BatchQueue():
+    def __init__(self, model, batch_size=64, batch_wait=5):
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait / 1000
+        self.queue = asyncio.Queue()
+        self.worker = None
+
+
+    async def submit(self, request):
+        if self.worker is None:
+            self.worker = asyncio.get_running_loop().create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((request, future, time.time()))
+        return await future
+
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # the first request opens a batch, which closes when full or when its wait is over
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # score off the event loop, so that requests keep queueing
+            try:
+                results = await loop.run_in_executor(None, self.model.score, [i[0] for i in batch])
+            except Exception as e:
+                results = [{'id': i[0].get('id'), 'error': '{}: {}'.format(type(e).__name__, e)} for i in batch]
+            end = time.time()
+            for (request, future, start), result in zip(batch, results):
+                result['time_ms'] = (end - start) * 1000
+                result['batch_size'] = len(batch)
+                if not future.done():
+                    future.set_result(result)
+
+
+# newline-delimited JSON: one request per line, one response per line in the order of requests
+# requests of a connection are pipelined, so that they can share batches
+async def handle(model, queue, reader, writer):
+    pending = asyncio.Queue()
+
+    async def respond():
+        while True:
+            task = await pending.get()
+            if task is None:
+                break
+            writer.write((json.dumps(await task) + '\n').encode())
+            await writer.drain()
+
+    responder = asyncio.get_running_loop().create_task(respond())
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        try:
+            request = json.loads(line)
+            if request.get('op') == 'ping':
+                task = _done({'ok': True, 'algorithms': model.tools, 'cov': model.cov_tools})
+            else:
+                task = asyncio.ensure_future(queue.submit(request))
+        except Exception as e:
+            task = _done({'error': '{}: {}'.format(type(e).__name__, e)})
+        await pending.put(task)
+    await pending.put(None)
+    await responder
+    writer.close()
+
+
+def _done(result):
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(result)
+    return future
+
+
+async def serve(model, socket_path='', host='127.0.0.1', port=8765, batch_size=64, batch_wait=5):
+    queue = BatchQueue(model, batch_size, batch_wait)
+    callback = lambda reader, writer: handle(model, queue, reader, writer)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = await asyncio.start_unix_server(callback, path=socket_path)
+        print('Listening on {}'.format(socket_path))
+    else:
+        server = await asyncio.start_server(callback, host=host, port=port)
+        print('Listening on {}:{}'.format(host, port))
+    print('Batches of up to {} individuals or {} ms'.format(batch_size, batch_wait))
+    sys.stdout.flush()
+    async with server:
+        await server.serve_forever()
+
+
+def main(args=None):
+    args = ArgumentParser().parse_args(args)
+    beta_file = args.beta if args.beta else '{}/beta.tsv'.format(args.model_dir)
+    rank_ref_file = args.rank_ref if args.rank_ref else '{}/rank_ref.csv'.format(args.model_dir)
+    hist_ref_file = args.hist_ref if args.hist_ref else '{}/hist_ref.csv'.format(args.model_dir)
+    cov_dir = args.cov_dir if args.cov_dir else '{}/analysis/target/cov'.format(args.model_dir)
+    if not os.path.isfile(rank_ref_file):
+        print('Rank reference file is required')
+        sys.exit(1)
+
+    model = PRSModel(beta_file, rank_ref_file, args.method, hist_ref_file, cov_dir, args.exact_rank, args.max_bfiles)
+    asyncio.run(serve(model, args.socket, args.host, args.port, args.batch_size, args.batch_wait))
+
+
+if __name__ == '__main__':
+    main()
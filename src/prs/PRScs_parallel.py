@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+
+import os, sys, glob, argparse
+from scheduler import Job, JobScheduler
+from plinkio import read_bim
+
+
+def ArgumentParser():
+    parser = argparse.ArgumentParser(prog='PRScs_parallel', description='run PRScs of each chromosome in parallel and merge the effect sizes')
+    parser.add_argument('--src', required=True, help='the src of PRScs (PRScs.py)')
+    parser.add_argument('--ref_dir', required=True, help='the directory of LD reference')
+    parser.add_argument('--bim_prefix', required=True, help='the bim prefix of the target data')
+    parser.add_argument('--sst_file', required=True, help='the summary statistics of PRScs')
+    parser.add_argument('--n_gwas', required=True, help='the sample size of GWAS')
+    parser.add_argument('--out_dir', required=True, help='the output prefix of PRScs')
+    parser.add_argument('--chrom', required=False, default=','.join(map(str, range(1, 23))), help='chromosomes, separated by comma; default=1-22')
+    parser.add_argument('--thread', required=False, default=1, type=int, help='the number of cores, default=1')
+    parser.add_argument('--memory', required=False, default=0, type=int, help='the memory (MB) of all jobs, default=0 (no limit)')
+    parser.add_argument('--phi', required=False, default='1e-2', help='the global shrinkage parameter, default=1e-2')
+    parser.add_argument('--n_iter', required=False, default=1000, type=int, help='the number of MCMC iterations, default=1000')
+    parser.add_argument('--n_burnin', required=False, default=500, type=int, help='the number of burnin iterations, default=500')
+    parser.add_argument('--output', required=False, default='', help='the merged effect sizes, default=[directory of out_dir]/effect_size.txt')
+    return parser
+
+
+def chromosome_size(bim_file, chroms):
+    # the number of variants of each chromosome in the bim, the cost of its MCMC
+    counts = read_bim(bim_file)['CHR'].astype(str).value_counts()
+    return {chrom: int(counts.get(chrom, 0)) for chrom in chroms}
+
+
+def job_memory(ref_dir, chrom):
+    # the LD blocks of a chromosome are loaded at once; a few times of the hdf5 file size
+    ref_files = glob.glob('{}/ldblk_*_chr{}.hdf5'.format(ref_dir, chrom))
+    if len(ref_files) == 0:
+        return 0
+    return max(256, int(4 * os.path.getsize(ref_files[0]) / 1024**2))
+
+
+def main(args=None):
+    args = ArgumentParser().parse_args(args)
+    chroms = [i.strip() for i in args.chrom.split(',') if i.strip() != '']
+    sizes = chromosome_size('{}.bim'.format(args.bim_prefix), chroms)
+
+    # one job per chromosome with variants; largest chromosomes first
+    # extra cores go to the BLAS threads of each job when there are fewer jobs than cores
+    chroms = [chrom for chrom in chroms if sizes[chrom] > 0]
+    threads = max(1, args.thread // max(len(chroms), 1))
+    jobs = list()
+    for chrom in chroms:
+        cmd = [sys.executable, args.src,
+               '--ref_dir={}'.format(args.ref_dir),
+               '--bim_prefix={}'.format(args.bim_prefix),
+               '--sst_file={}'.format(args.sst_file),
+               '--n_gwas={}'.format(args.n_gwas),
+               '--chrom={}'.format(chrom),
+               '--phi={}'.format(args.phi),
+               '--n_iter={}'.format(args.n_iter),
+               '--n_burnin={}'.format(args.n_burnin),
+               '--out_dir={}'.format(args.out_dir)]
+        jobs.append(Job('chr{}'.format(chrom), cmd, threads=threads, memory=job_memory(args.ref_dir, chrom),
+                        priority=sizes[chrom], log_file='{}.chr{}.log'.format(args.out_dir, chrom)))
+
+    print('\n\n###### PRScs: {} chromosomes, {} cores ######\n\n'.format(len(jobs), args.thread))
+    scheduler = JobScheduler(thread=args.thread, memory=args.memory)
+    failed = scheduler(jobs)
+
+    # logs in chromosome order
+    for job in jobs:
+        if os.path.isfile(job.log_file):
+            with open(job.log_file, 'r') as f:
+                print(f.read())
+            os.remove(job.log_file)
+
+    if len(failed) > 0:
+        print('PRScs failed: {}'.format(', '.join(job.name for job in failed)))
+        sys.exit(1)
+
+    # merge all in chromosome order
+    output = args.output if args.output else '{}/effect_size.txt'.format(os.path.dirname(args.out_dir))
+    out_files = list()
+    for chrom in chroms:
+        chrom_files = sorted(glob.glob('{}_*_chr{}.txt'.format(args.out_dir, chrom)))
+        if len(chrom_files) == 0:
+            print('No result of chr{}'.format(chrom))
+            sys.exit(1)
+        out_files.append(chrom_files[0])
+
+    with open(output, 'w') as fw:
+        for out_file in out_files:
+            with open(out_file, 'r') as f:
+                fw.write(f.read())
+    print('Save {}'.format(output))
+
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,7 @@ err_report(){
 trap 'err_report ${LINENO} "${BASH_COMMAND}"' ERR
 
 # arguments
-while getopts 'hi:a:r:p:d:o:c:' flag; do
+while getopts 'hi:a:r:p:d:o:c:t:m:' flag; do
     case $flag in
         h)
             echo "PRScs training (the last character of directory path should not be '/')"
@@ -22,6 +22,8 @@ while getopts 'hi:a:r:p:d:o:c:' flag; do
             echo "-d, the directory of working and output"
             echo "-o, the basename of output file"
             echo "-c, chromosome, default: '1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22'"
+            echo "-t, the number of cores for the chromosomes run in parallel, default: 1"
+            echo "-m, the memory (MB) of all chromosomes run in parallel, default: 0 (no limit)"
             ;;
         i) BFILE=$OPTARG;;
         a) ASSOC_FILE=$OPTARG;;
@@ -30,10 +32,15 @@ while getopts 'hi:a:r:p:d:o:c:' flag; do
         d) WORK_DIR=$OPTARG;;
         o) BASENAME=$OPTARG;;
         c) CHR=$OPTARG;;
-        *) echo "usage: $0 [-i] [-a] [-r] [-p] [-d] [-o] [-c]"; exit 1;;
+        t) THREAD=$OPTARG;;
+        m) MEMORY=$OPTARG;;
+        *) echo "usage: $0 [-i] [-a] [-r] [-p] [-d] [-o] [-c] [-t] [-m]"; exit 1;;
     esac
 done
 
+REAL_PATH=$(realpath $0)
+SRC_DIR=$(dirname ${REAL_PATH})
+
 if [ ! -f "$BFILE.bed" ] || [ ! -f "$BFILE.bim" ] || [ ! -f "$BFILE.fam" ]; then
     echo "-i missing or designating error"
     exit 1
@@ -79,48 +86,35 @@ fi
 OBS_CT_COLNUM=$(sed -n '1s/\s/\n/gp' $ASSOC_FILE | grep -nx 'OBS_CT' | cut -d: -f1)
 SAMPLE_SIZE=$(awk -v max=0 -v obs_ct_colnum=$OBS_CT_COLNUM '{if($obs_ct_colnum>max){want=$obs_ct_colnum;max=$obs_ct_colnum}}END{print want}' "$WORK_DIR/summary_statistics.txt")
 
-# keep autosomal chromosomes
-plink2 \
-    --bfile "${BFILE}" \
-    --chr 1-22 \
-    --allow-extra-chr \
-    --make-bed \
-    --out "${WORK_DIR}/${BASENAME}.auto"
+# keep autosomal chromosomes: PRScs only reads the .bim, so the genotypes are not copied
+awk 'BEGIN{OFS="\t"} {sub(/^[Cc][Hh][Rr]/, "", $1); $1 = $1; if ($1 ~ /^([1-9]|1[0-9]|2[0-2])$/) print}' "${BFILE}.bim" > "${WORK_DIR}/${BASENAME}.auto.bim"
 
 # run PRScs in parallel
 if [ -z "$CHR" ]; then
     CHR="1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22"
 fi
-IFS=',' read -ra CHR_ARR <<< $CHR
-
-for i in ${CHR_ARR[@]}
-do
-    python3 "$SRC" \
-        --ref_dir="$LD_REF_DIR" \
-        --bim_prefix="${WORK_DIR}/${BASENAME}.auto" \
-        --sst_file="$WORK_DIR/summary_statistics_no_na.txt" \
-        --n_gwas="$SAMPLE_SIZE" \
-        --chrom="$i" \
-        --phi=1e-2 \
-        --n_iter=1000 \
-        --n_burnin=500 \
-        --out_dir="${WORK_DIR}/${BASENAME}"
-done
 
-# merge all
-MERGE=true
-for i in ${CHR_ARR[@]}
-do
-    if [ ! -f ${WORK_DIR}/${BASENAME}_*_chr${i}.txt ]; then
-        MERGE=false
-    fi
-done
+if [ -z "$THREAD" ]; then
+    THREAD=1
+fi
 
-if $MERGE; then
-    rm ${WORK_DIR}/effect_size.txt || true
-    for i in ${CHR_ARR[@]}
-    do
-        cat ${WORK_DIR}/${BASENAME}_*_chr${i}.txt >> ${WORK_DIR}/effect_size.txt
-    done
-    rm ${WORK_DIR}/${BASENAME}.auto.* || true
+if [ -z "$MEMORY" ]; then
+    MEMORY=0
 fi
+
+# chromosomes are scheduled within the cores and memory, and merged into effect_size.txt in chromosome order
+python3 "${SRC_DIR}/PRScs_parallel.py" \
+    --src="$SRC" \
+    --ref_dir="$LD_REF_DIR" \
+    --bim_prefix="${WORK_DIR}/${BASENAME}.auto" \
+    --sst_file="$WORK_DIR/summary_statistics_no_na.txt" \
+    --n_gwas="$SAMPLE_SIZE" \
+    --chrom="$CHR" \
+    --thread="$THREAD" \
+    --memory="$MEMORY" \
+    --phi=1e-2 \
+    --n_iter=1000 \
+    --n_burnin=500 \
+    --out_dir="${WORK_DIR}/${BASENAME}" \
+    --output="${WORK_DIR}/effect_size.txt"
+rm ${WORK_DIR}/${BASENAME}.auto.* || true
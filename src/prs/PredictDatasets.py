@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+
+import os, sys, shutil, argparse, contextlib
+import multiprocessing as mp
+from threadpoolctl import threadpool_limits
+from ScorePRS import ScoreWeights, PRSScorer
+from scheduler import BLAS_THREAD_VARS
+from utils import PRSResults
+
+
+def ArgumentParser():
+    parser = argparse.ArgumentParser(prog='PredictDatasets', description='predict several datasets with the weights of beta.tsv loaded once')
+    parser.add_argument('-i', '--bfile', required=True, action='append', help='the input bfile prefix; repeat for each dataset')
+    parser.add_argument('-d', '--dir', required=True, action='append', help='the directory of working and output of each dataset; prediction.csv is saved here')
+    parser.add_argument('-g', '--genepi', required=False, action='append', default=None, help='the GenEpi prediction file of each dataset (optional)')
+    parser.add_argument('-b', '--beta', required=True, help='the beta file (beta.tsv)')
+    parser.add_argument('-m', '--method', required=True, help='the method of PRS models; clf or reg')
+    parser.add_argument('-r', '--dedup', action='store_true', help='score views of the bfiles without duplicated variants (plink2 --rm-dup force-first)')
+    parser.add_argument('-t', '--thread', required=False, default=1, type=int, help='the number of datasets predicted in parallel, default=1')
+    parser.add_argument('--memory', required=False, default=512, type=int, help='the memory (MB) of decoded genotype blocks of all datasets, default=512')
+    return parser
+
+
+# the compiled weights shared by the workers
+_WEIGHTS = None
+_BLAS_LIMITS = None
+
+def _init_worker(weights, blas_threads=None):
+    # the workers split the BLAS threads of the job (NODE_THREAD), inherited from the parent, so the cores are not oversubscribed
+    global _WEIGHTS, _BLAS_LIMITS
+    _WEIGHTS = weights
+    if blas_threads is not None:
+        for var in BLAS_THREAD_VARS:
+            os.environ[var] = str(blas_threads)
+        _BLAS_LIMITS = threadpool_limits(limits=blas_threads)
+
+
+# predict a dataset: the same as predictPRS.sh with the weights already compiled
+def PredictDataset(bfile, work_dir, method, genepi_pred='', dedup=False, memory=512, weights=None):
+    weights = _WEIGHTS if weights is None else weights
+    basename = os.path.basename(bfile)
+    log_file = '{}/{}.predict.log'.format(work_dir, basename)
+    with open(log_file, 'w') as log, contextlib.redirect_stdout(log):
+        ### predict by algorithms; duplicated variants are skipped by a view of the bfile, without a dedup copy
+        print('\n\n\n###### Predict with All Algorithms ######\n\n\n')
+        scorer = PRSScorer(bfile, weights, dedup=dedup)
+        scorer('{}/{}'.format(work_dir, basename), memory=memory)
+        if genepi_pred and os.path.isfile(genepi_pred):
+            shutil.move(genepi_pred, '{}/{}.GenEpi.csv'.format(work_dir, basename))
+
+        ### merge predictions
+        df = PRSResults(bfile, '{}/{}'.format(work_dir, basename), method)()
+        df.to_csv('{}/prediction.csv'.format(work_dir), index=False)
+    return log_file
+
+
+def main(args=None):
+    args = ArgumentParser().parse_args(args)
+    if len(args.bfile) != len(args.dir):
+        print('The numbers of -i and -d are different')
+        sys.exit(1)
+    genepi = args.genepi if args.genepi is not None else [''] * len(args.bfile)
+    if len(genepi) != len(args.bfile):
+        print('The numbers of -i and -g are different')
+        sys.exit(1)
+
+    # weights are loaded and compiled once
+    print('\n\n###### Loading Weights ######\n\n')
+    weights = ScoreWeights(args.beta)
+    print('{} algorithms: {}'.format(len(weights.tools), ', '.join(weights.tools)))
+
+    # datasets share the cores and the memory
+    n_workers = max(1, min(args.thread, len(args.bfile)))
+    memory = max(1, args.memory // n_workers)
+    tasks = [(bfile, work_dir, args.method, genepi_pred, args.dedup, memory) for bfile, work_dir, genepi_pred in zip(args.bfile, args.dir, genepi)]
+    print('\n\n###### Predicting {} Datasets with {} Processes ######\n\n'.format(len(tasks), n_workers))
+    sys.stdout.flush()
+    if n_workers == 1:
+        _init_worker(weights)
+        results = [_run(task) for task in tasks]
+    else:
+        blas_threads = max(1, args.thread // n_workers)
+        with mp.Pool(n_workers, initializer=_init_worker, initargs=(weights, blas_threads)) as pool:
+            results = pool.map(_run, tasks, chunksize=1)
+
+    # logs in the order of datasets
+    failed = list()
+    for task, (log_file, error) in zip(tasks, results):
+        if os.path.isfile(log_file):
+            with open(log_file, 'r') as f:
+                print(f.read())
+            os.remove(log_file)
+        if error is not None:
+            print('Prediction of {} failed: {}'.format(task[0], error))
+            failed.append(task[0])
+    if len(failed) > 0:
+        sys.exit(1)
+
+
+def _run(task):
+    bfile, work_dir = task[0], task[1]
+    log_file = '{}/{}.predict.log'.format(work_dir, os.path.basename(bfile))
+    try:
+        PredictDataset(*task)
+    except (Exception, SystemExit) as e:
+        return log_file, repr(e)
+    return log_file, None
+
+
+if __name__ == '__main__':
+    main()
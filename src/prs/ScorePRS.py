@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+
+import sys, argparse
+import numpy as np
+import pandas as pd
+from plinkio import BedReader
+from beta_store import BetaBundle, bundle_path, is_fresh
+
+
+def ArgumentParser():
+    parser = argparse.ArgumentParser(prog='ScorePRS', description='score every PRS algorithm of the beta file in a single pass of the bfile')
+    parser.add_argument('--bfile', required=True, help='the input bfile prefix')
+    parser.add_argument('--beta', required=True, help='the beta file (beta.tsv)')
+    parser.add_argument('--out', required=True, help='the output prefix; results are saved as [out].[ALGO].profile')
+    parser.add_argument('--algo', required=False, default='', help='the algorithms to score, separated by comma; default=all')
+    parser.add_argument('--memory', required=False, default=512, type=int, help='the memory (MB) of a decoded genotype block, default=512')
+    parser.add_argument('--dedup', action='store_true', help='score a view of the bfile without duplicated variants (plink2 --rm-dup force-first)')
+    return parser
+
+
+# the weights of beta.tsv compiled for scoring: unique variant IDs, score alleles, and float64 weights of the variants
+# with a non-zero weight in any of the algorithms; loaded once and shared by the scorers of several bfiles
+class ScoreWeights():
+    def __init__(self, beta_file, tools=None):
+        # beta: prefer the binary bundle, which only maps the IDs, A1, and the non-zero rows of each algorithm
+        if is_fresh(beta_file):
+            print('Loading beta bundle {} ...'.format(bundle_path(beta_file)))
+            bundle = BetaBundle(bundle_path(beta_file))
+            self.tools = [tool for tool in bundle.tools if (tools is None) or (tool in tools)]
+            # only the non-zero variants when all algorithms are sparse
+            if len(self.tools) > 0 and all(tool in bundle.sparse_tools for tool in self.tools):
+                rows = np.unique(np.concatenate([bundle.nonzero(tool)[0] for tool in self.tools]))
+            else:
+                rows = np.arange(bundle.n_variants)
+            ids, a1 = bundle.column('ID', rows), bundle.column('A1', rows)
+            get_weights = lambda idx: np.column_stack([bundle.beta(tool, rows[idx]) for tool in self.tools]).astype(np.float64)
+        else:
+            # ['CHR', 'POS', 'ID', 'REF', 'ALT', 'A1', 'P', 'LOG10_P', 'BETA', ALGO_1, ALGO_2, ...]
+            beta_df = pd.read_csv(beta_file, sep='\t', dtype={'ID': str, 'A1': str})
+            self.tools = [tool for tool in list(beta_df.columns)[9:] if (tools is None) or (tool in tools)]
+            ids, a1 = beta_df['ID'].to_numpy(), beta_df['A1'].to_numpy()
+            get_weights = lambda idx: beta_df[self.tools].to_numpy(dtype=np.float64)[idx]
+        self.n_variants = len(ids)
+
+        # the first row of each ID; variants with zero weights in all algorithms are never read
+        rows = np.flatnonzero(~pd.Index(ids).duplicated(keep='first'))
+        self.weights = np.zeros((len(rows), len(self.tools)), dtype=np.float64)
+        if len(self.tools) > 0:
+            self.weights = np.nan_to_num(get_weights(rows))
+        nonzero = (self.weights != 0).any(axis=1)
+        self.ids = ids[rows][nonzero]
+        self.a1 = a1[rows][nonzero]
+        self.weights = self.weights[nonzero]
+
+
+# score all algorithms (columns after BETA) of the beta file, equivalent to plink1.9 --score [beta] 3 6 [col] header sum --score-no-mean-imputation
+# CNT and CNT2 only count the variants with a non-zero weight in any of the scored algorithms
+class PRSScorer():
+    def __init__(self, bfile, beta, tools=None, dedup=False):
+        # beta: the beta file, or ScoreWeights
+        self.bfile = bfile
+
+        # fam and bim; duplicated variants are skipped by the view of the reader
+        try:
+            self.reader = BedReader(bfile, dedup=dedup)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        self.fam_df = self.reader.fam_df
+        self.bim_df = self.reader.bim_df
+        self.n_samples = self.reader.n_samples
+
+        weights = beta if isinstance(beta, ScoreWeights) else ScoreWeights(beta, tools)
+        self.tools = weights.tools
+        self._align(weights)
+
+
+    def __call__(self, out_prefix, memory=512):
+        print('\n\n###### Scoring {} ######\n\n'.format(', '.join(self.tools)))
+        if len(self.tools) == 0:
+            print('No algorithm to score')
+            return
+
+        # variants per block so that a decoded float64 block fits in the memory
+        block_size = self.reader.block_size(memory, itemsize=8)
+        scores, cnt, cnt2 = self._score(block_size)
+
+        # save as plink profile
+        for i, tool in enumerate(self.tools):
+            profile_df = pd.DataFrame({
+                'FID': self.fam_df['FID'],
+                'IID': self.fam_df['IID'],
+                'PHENO': self.fam_df['phenotype'],
+                'CNT': cnt,
+                'CNT2': cnt2.astype(np.int64),
+                'SCORESUM': scores[:, i]
+            })
+            profile_df.to_csv('{}.{}.profile'.format(out_prefix, tool), sep=' ', index=False)
+            print('Save {}.{}.profile'.format(out_prefix, tool))
+
+        print('\n\n###### Complete ######\n\n')
+
+
+    def _align(self, weights):
+        # map the variants of beta onto the bim; the score allele must be one of the bim alleles
+        pos, bim_idx, is_a2 = self.reader.match_alleles(weights.ids, weights.a1)
+
+        # sorted by the position in the bed for sequential reading
+        order = np.argsort(bim_idx, kind='stable')
+        self.variant_idx = bim_idx[order]
+        self.flip = is_a2[order] # count A2 instead of A1
+        self.weights = weights.weights[pos[order]]
+        print('{} / {} variants of the beta file are scored'.format(len(self.variant_idx), weights.n_variants))
+
+
+    def _score(self, block_size):
+        scores = np.zeros((self.n_samples, len(self.tools)), dtype=np.float64)
+        cnt = np.zeros(self.n_samples, dtype=np.int64)
+        cnt2 = np.zeros(self.n_samples, dtype=np.float64)
+        for block, geno in self.reader.iter_blocks(self.variant_idx, block_size=block_size):
+            missing = geno < 0
+            dosage = geno.astype(np.float64)
+            flip = self.flip[block]
+            dosage[flip] = 2 - dosage[flip]
+            dosage[missing] = 0
+
+            # (variants, samples).T x (variants, tools)
+            scores += dosage.T @ self.weights[block]
+            cnt += 2 * (~missing).sum(axis=0)
+            cnt2 += dosage.sum(axis=0)
+
+        return scores, cnt, cnt2
+
+
+def main(args=None):
+    args = ArgumentParser().parse_args(args)
+    tools = [i.strip() for i in args.algo.split(',')] if args.algo else None
+    scorer = PRSScorer(args.bfile, args.beta, tools, dedup=args.dedup)
+    scorer(args.out, memory=args.memory)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@
 
 import os, sys, argparse
 from utils import *
+from stream import PredictionStream, PredictionSketch, StreamAnalysis
 
 
 def ArgumentParser():
@@ -14,6 +15,15 @@ def ArgumentParser():
     parser.add_argument('--cov', required=False, default="", help='the covariate file (.tsv)')
     parser.add_argument('--cov_ref_dir', required=False, default="", help='the directory of covariate regression model, including scaler.joblib, reg.joblib')
     parser.add_argument('--run_performance', action='store_true', help='whether to calculate the model performance')
+    parser.add_argument('--exact_rank', action='store_true', help='rank by the sorted scores of the cohort ([rank_ref].npz) instead of the percentiles of rank_ref.csv')
+    parser.add_argument('--ref_state', required=False, default="", help='the exact rank reference (rank_ref.npz) of an existing cohort; in target mode, the predictions are merged into it')
+    parser.add_argument('--no_plot', action='store_true', help='calculate the metrics only, without rendering figures')
+    parser.add_argument('--thread', required=False, default=1, type=int, help='the number of processes rendering figures and bootstrap, default=1')
+    parser.add_argument('--roc_points', required=False, default=0, type=int, help='the maximum number of points of each curve in roc.json, default=0 (all thresholds)')
+    parser.add_argument('--bootstrap', required=False, default=0, type=int, help='the number of bootstrap replicates of the confidence intervals of the metrics (bootstrap.json), default=0 (no bootstrap)')
+    parser.add_argument('--seed', required=False, default=0, type=int, help='the random seed of bootstrap, default=0')
+    parser.add_argument('--chunk_size', required=False, default=0, type=int, help='stream the prediction file in chunks of this number of samples with bounded memory; covariates, bootstrap, and the exact reference of the target load the whole file instead, default=0 (load the whole file)')
+    parser.add_argument('--sketch_bins', required=False, default=100000, type=int, help='the number of bins of each score in streaming mode, default=100000')
     parser.add_argument('--percentile_num', required=False, default=10, type=int, help='the number of percentile groups, default=10')
     return parser
 
@@ -22,9 +32,6 @@ def main(args=None):
     ### arguments
     args = ArgumentParser().parse_args(args)
 
-    # prediction dataframe
-    pred_df = pd.read_csv(args.pred_file)
-
     # output dir
     if not os.path.isdir(args.out_dir):
         os.mkdir(args.out_dir)
@@ -38,23 +45,43 @@ def main(args=None):
             print('If the covariate file is provied, covariate models are required in test mode')
             sys.exit()
 
+    # streaming mode; the options that need all samples at once fall back to loading the whole file
+    if args.chunk_size > 0:
+        unsupported = stream_unsupported(args)
+        if len(unsupported) == 0:
+            main_stream(args)
+            return
+        print('Warning: {} not supported in streaming mode; loading the whole prediction file'.format(', '.join(unsupported)))
+
+    # prediction dataframe
+    pred_df = pd.read_csv(args.pred_file)
+
 
     ### cohort reference
     if args.mode == 'target':
-        cohort_ref = CohortRef(pred_df)
+        ref_state = ExactRankRef.load(args.ref_state) if os.path.isfile(args.ref_state) else None
+        cohort_ref = CohortRef(pred_df, exact=args.exact_rank, ref_state=ref_state)
         rank_df = cohort_ref()
         cohort_ref.rank_ref_df.to_csv(f'{args.out_dir}/rank_ref.csv')
         cohort_ref.hist_ref_df.to_csv(f'{args.out_dir}/hist_ref.csv')
+        if cohort_ref.exact_ref is not None:
+            cohort_ref.exact_ref.save(f'{args.out_dir}/rank_ref.npz')
     else:
-        cohort_ref = CohortRef(pred_df, args.rank_ref_file)
+        cohort_ref = CohortRef(pred_df, args.rank_ref_file, exact=args.exact_rank)
         rank_df = cohort_ref()
     rank_df.to_csv(f'{args.out_dir}/rank.csv', index=False)
 
 
-    ### performance
+    ### performance: figures of all analyses are rendered together at the end
+    # the render pool and the bootstrap pools run at the same time, and split the processes of --thread
+    render_processes, bootstrap_processes = args.thread, args.thread
+    if args.run_performance and args.bootstrap > 0 and not args.no_plot:
+        render_processes = max(1, args.thread // 2)
+        bootstrap_processes = max(1, args.thread - render_processes)
+    render_queue = RenderQueue(render_processes, enabled=not args.no_plot)
     if args.run_performance:
-        analysis = Analysis(pred_df, args.method, args.out_dir)
-        analysis(percentile_num=args.percentile_num)
+        analysis = Analysis(pred_df, args.method, args.out_dir, render_queue)
+        analysis(percentile_num=args.percentile_num, roc_points=args.roc_points, bootstrap=args.bootstrap, seed=args.seed, processes=bootstrap_processes)
 
     ### covariates
     if os.path.isfile(args.cov):
@@ -82,10 +109,12 @@ def main(args=None):
             json.dump(weight_dict, open(f'{args.out_dir}/cov/weight.json', 'w'))
             
             # build cohort reference
-            cov_cohort_ref = CohortRef(cov_pred_df)
+            cov_cohort_ref = CohortRef(cov_pred_df, exact=args.exact_rank)
             cov_rank_df = cov_cohort_ref()
             cov_cohort_ref.rank_ref_df.to_csv(f'{args.out_dir}/cov/rank_ref.csv')
             cov_cohort_ref.hist_ref_df.to_csv(f'{args.out_dir}/cov/hist_ref.csv')
+            if args.exact_rank:
+                cov_cohort_ref.exact_ref.save(f'{args.out_dir}/cov/rank_ref.npz')
         
         # test
         else:
@@ -93,7 +122,7 @@ def main(args=None):
             cov_pred_df = cov.Test(f'{args.cov_ref_dir}/models.json')
             
             # calculate rank
-            cov_cohort_ref = CohortRef(cov_pred_df, f'{args.cov_ref_dir}/rank_ref.csv')
+            cov_cohort_ref = CohortRef(cov_pred_df, f'{args.cov_ref_dir}/rank_ref.csv', exact=args.exact_rank)
             cov_rank_df = cov_cohort_ref()
 
         # save files
@@ -102,8 +131,55 @@ def main(args=None):
         
         # cov performance
         if args.run_performance:
-            cov_analysis = Analysis(cov_pred_df, args.method, f'{args.out_dir}/cov')
-            cov_analysis(percentile_num=args.percentile_num)
+            cov_analysis = Analysis(cov_pred_df, args.method, f'{args.out_dir}/cov', render_queue)
+            cov_analysis(percentile_num=args.percentile_num, roc_points=args.roc_points, bootstrap=args.bootstrap, seed=args.seed, processes=bootstrap_processes)
+
+    ### figures
+    if len(render_queue.tasks) > 0:
+        print('\n\n###### Rendering {} Figures ######\n\n'.format(len(render_queue.tasks)))
+    render_queue.close()
+
+
+# the options of args that streaming mode does not support
+def stream_unsupported(args):
+    unsupported = list()
+    if os.path.isfile(args.cov):
+        unsupported.append('covariates')
+    if args.bootstrap > 0:
+        unsupported.append('bootstrap')
+    if args.mode == 'target' and (args.exact_rank or os.path.isfile(args.ref_state)):
+        unsupported.append('the exact rank reference of the target')
+    return unsupported
+
+
+# streaming mode: the predictions are read in chunks, and the cohort reference, ranks, and performance come from the bins
+# of a PredictionSketch; covariates, bootstrap, and the exact reference of the target need all samples at once
+def main_stream(args):
+    print('\n\n###### Streaming Predictions in Chunks of {} Samples ######\n\n'.format(args.chunk_size))
+    stream = PredictionStream(args.pred_file, args.chunk_size)
+    sketch = PredictionSketch(stream, args.method, bins=args.sketch_bins, percentile_num=args.percentile_num)
+
+    ### cohort reference: the reference of the target is saved first, and ranks the target as the test
+    rank_ref_file = args.rank_ref_file
+    if args.mode == 'target':
+        rank_ref_df, hist_ref_df = sketch.summary()
+        rank_ref_file = f'{args.out_dir}/rank_ref.csv'
+        rank_ref_df.to_csv(rank_ref_file)
+        hist_ref_df.to_csv(f'{args.out_dir}/hist_ref.csv')
+    cohort_ref = CohortRef(None, rank_ref_file, exact=args.exact_rank)
+    percentile_dir = f'{args.out_dir}/percentile.tmp' if args.run_performance and args.method == 'reg' else None
+    sketch.rank(cohort_ref, f'{args.out_dir}/rank.csv', percentile_dir=percentile_dir)
+
+    ### performance
+    render_queue = RenderQueue(args.thread, enabled=not args.no_plot)
+    if args.run_performance:
+        analysis = StreamAnalysis(sketch, args.method, args.out_dir, render_queue)
+        analysis(percentile_num=args.percentile_num, roc_points=args.roc_points)
+
+    ### figures
+    if len(render_queue.tasks) > 0:
+        print('\n\n###### Rendering {} Figures ######\n\n'.format(len(render_queue.tasks)))
+    render_queue.close()
 
 
 if __name__ == '__main__':
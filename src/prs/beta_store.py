@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+
+import os, json, shutil
+import numpy as np
+import pandas as pd
+
+
+# binary beta bundle saved next to beta.tsv: one .npy per column, so a single algorithm can be memory-mapped
+# [bundle]/meta.json: the number of variants, metadata columns, and algorithms
+# [bundle]/[COL].npy: metadata columns; strings as fixed-width bytes
+# [bundle]/beta.[ALGO].npy: float32 betas of each dense algorithm
+# [bundle]/beta.[ALGO].idx.npy, beta.[ALGO].val.npy: non-zero variants and float32 betas of each sparse algorithm (C+T, PRSice2)
+META_COLS = ['CHR', 'POS', 'ID', 'REF', 'ALT', 'A1', 'P', 'LOG10_P', 'BETA']
+STR_COLS = ['CHR', 'ID', 'REF', 'ALT', 'A1']
+
+
+def bundle_path(beta_file):
+    return '{}.bundle'.format(os.path.splitext(beta_file)[0])
+
+
+def is_fresh(beta_file):
+    # the bundle exists and was written after beta.tsv
+    bundle_dir = bundle_path(beta_file)
+    if not os.path.isfile('{}/meta.json'.format(bundle_dir)):
+        return False
+    if not os.path.isfile(beta_file):
+        return True
+    return os.path.getmtime('{}/meta.json'.format(bundle_dir)) >= os.path.getmtime(beta_file)
+
+
+def SaveBetaBundle(bundle_dir, weights):
+    # weights: utils.Weights after __call__
+    tmp_dir = '{}.tmp'.format(bundle_dir)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    # metadata
+    for col in ['CHR', 'POS', 'ID', 'REF', 'ALT']:
+        values = weights.bim_df[col].to_numpy()
+        np.save('{}/{}.npy'.format(tmp_dir, col), _to_array(col, values))
+    np.save('{}/A1.npy'.format(tmp_dir), _to_array('A1', weights.A1))
+    for col in ['P', 'LOG10_P', 'BETA']:
+        np.save('{}/{}.npy'.format(tmp_dir, col), weights.ss[col])
+
+    # betas
+    sparse_tools = list()
+    for tool in weights.tools:
+        if tool in weights.sparse_beta:
+            idx, value = weights.sparse_beta[tool]
+            np.save('{}/beta.{}.idx.npy'.format(tmp_dir, tool), np.asarray(idx, dtype=np.int64))
+            np.save('{}/beta.{}.val.npy'.format(tmp_dir, tool), np.asarray(value, dtype=np.float32))
+            sparse_tools.append(tool)
+        else:
+            np.save('{}/beta.{}.npy'.format(tmp_dir, tool), np.ascontiguousarray(weights.values(tool), dtype=np.float32))
+
+    meta = {'n_variants': int(weights.n_variants), 'columns': META_COLS, 'tools': list(weights.tools), 'sparse': sparse_tools}
+    with open('{}/meta.json'.format(tmp_dir), 'w') as f:
+        json.dump(meta, f, indent=4)
+
+    # replace the old bundle
+    shutil.rmtree(bundle_dir, ignore_errors=True)
+    os.rename(tmp_dir, bundle_dir)
+
+
+def _to_array(col, values):
+    if col in STR_COLS:
+        return np.asarray(pd.Series(values).astype(str).to_numpy(), dtype='S')
+    return np.asarray(values)
+
+
+# reader of the beta bundle; columns are memory-mapped and only parsed when accessed
+class BetaBundle():
+    def __init__(self, bundle_dir):
+        self.bundle_dir = bundle_dir
+        with open('{}/meta.json'.format(bundle_dir), 'r') as f:
+            meta = json.load(f)
+        self.n_variants = meta['n_variants']
+        self.columns = meta['columns']
+        self.tools = meta['tools']
+        self.sparse_tools = meta.get('sparse', [])
+
+
+    def column(self, col, rows=None, mmap=True):
+        values = np.load('{}/{}.npy'.format(self.bundle_dir, col), mmap_mode='r' if mmap else None)
+        if rows is not None:
+            values = values[rows]
+        if col in STR_COLS:
+            return values.astype(str)
+        return values
+
+
+    def beta(self, tool, rows=None, mmap=True):
+        # dense betas of a tool, or of the given rows only
+        if tool in self.sparse_tools:
+            idx, value = self.nonzero(tool)
+            if rows is None:
+                beta = np.zeros(self.n_variants, dtype=np.float32)
+                beta[idx] = value
+                return beta
+            rows = np.asarray(rows)
+            pos = np.minimum(np.searchsorted(idx, rows), max(len(idx) - 1, 0))
+            beta = np.zeros(len(rows), dtype=np.float32)
+            if len(idx) > 0:
+                hit = idx[pos] == rows
+                beta[hit] = value[pos[hit]]
+            return beta
+        beta = np.load('{}/beta.{}.npy'.format(self.bundle_dir, tool), mmap_mode='r' if mmap else None)
+        return beta if rows is None else beta[rows]
+
+
+    def nonzero(self, tool):
+        # sparse (index, value) betas of a tool
+        if tool in self.sparse_tools:
+            idx = np.load('{}/beta.{}.idx.npy'.format(self.bundle_dir, tool))
+            value = np.load('{}/beta.{}.val.npy'.format(self.bundle_dir, tool))
+            return idx, value
+        beta = self.beta(tool)
+        idx = np.flatnonzero(beta)
+        return idx, np.asarray(beta[idx])
+
+
+    def to_frame(self, tools=None):
+        # the same dataframe as beta.tsv
+        tools = self.tools if tools is None else tools
+        df = pd.DataFrame({col: self.column(col, mmap=False) for col in self.columns})
+        for tool in tools:
+            df[tool] = self.beta(tool, mmap=False)
+        return df
@@ -0,0 +1,176 @@
+#!/usr/bin/python3
+
+import os, sys, json, time, fcntl, shutil, hashlib, argparse, subprocess, contextlib
+
+
+# content-addressed cache of the output directories of pipeline steps
+# [cache_dir]/objects/[key]/: the cached output directory of a step
+# [cache_dir]/objects/[key].json: stage, size (bytes), and the last access time for LRU eviction
+# [cache_dir]/hashes.json: content hashes of the input files, reused while the size and mtime of a file are unchanged
+# an input directory is hashed by the relative paths and the contents of its files, without __pycache__
+CHUNK_SIZE = 16 * 1024**2
+
+
+def ArgumentParser():
+    parser = argparse.ArgumentParser(prog='cache', description='run a pipeline step, or restore its output directory from the cache when its inputs are unchanged')
+    parser.add_argument('--cache_dir', required=True, help='the cache directory')
+    parser.add_argument('--size', required=False, default=0, type=int, help='the size cap (MB) of the cache; least recently used entries are evicted, default=0 (no limit)')
+    parser.add_argument('--stage', required=True, help='the name of the step')
+    parser.add_argument('--dir', required=True, help='the output directory of the step')
+    parser.add_argument('--input', required=False, action='append', default=[], help='an input file or directory whose content keys the cache; repeatable')
+    parser.add_argument('--param', required=False, action='append', default=[], help='a parameter (KEY=VALUE) keying the cache; repeatable')
+    parser.add_argument('cmd', nargs=argparse.REMAINDER, help='the command of the step, after --')
+    return parser
+
+
+class ArtifactCache():
+    def __init__(self, cache_dir, size=0):
+        self.cache_dir = cache_dir
+        self.size = size * 1024**2 # bytes; 0 = no limit
+        self.object_dir = '{}/objects'.format(cache_dir)
+        os.makedirs(self.object_dir, exist_ok=True)
+
+
+    def key(self, stage, inputs=(), params=None):
+        # hash of the stage, the contents of the inputs, and the parameters
+        h = hashlib.sha256()
+        h.update(stage.encode())
+        for file in inputs:
+            h.update(b'\0input\0')
+            h.update(self.file_hash(file).encode())
+        for k, v in sorted((params or dict()).items()):
+            h.update('\0param\0{}={}'.format(k, v).encode())
+        return '{}-{}'.format(stage, h.hexdigest()[:32])
+
+
+    def file_hash(self, file):
+        # content hash of a file; a missing file hashes as empty so that optional inputs can be listed
+        if os.path.isdir(file):
+            return self.dir_hash(file)
+        if not os.path.isfile(file):
+            return 'missing'
+        stat = os.stat(file)
+        path = os.path.realpath(file)
+        with self._lock():
+            memo = self._read_json('{}/hashes.json'.format(self.cache_dir))
+        if path in memo and memo[path]['size'] == stat.st_size and memo[path]['mtime'] == stat.st_mtime_ns:
+            return memo[path]['hash']
+
+        h = hashlib.sha256()
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                h.update(chunk)
+        with self._lock():
+            memo = self._read_json('{}/hashes.json'.format(self.cache_dir))
+            memo[path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': h.hexdigest()}
+            self._write_json('{}/hashes.json'.format(self.cache_dir), memo)
+        return h.hexdigest()
+
+
+    def dir_hash(self, directory):
+        # hash of the relative paths and the content hashes of the files of a directory, in a fixed order
+        h = hashlib.sha256()
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = sorted(i for i in dirs if i != '__pycache__')
+            for file in sorted(files):
+                path = os.path.join(root, file)
+                h.update('\0file\0{}\0'.format(os.path.relpath(path, directory)).encode())
+                h.update(self.file_hash(path).encode())
+        return h.hexdigest()
+
+
+    def fetch(self, key, out_dir):
+        # restore the cached directory; return False on a miss
+        entry = '{}/{}'.format(self.object_dir, key)
+        with self._lock():
+            if not os.path.isfile('{}.json'.format(entry)):
+                return False
+            meta = self._read_json('{}.json'.format(entry))
+            meta['last_access'] = time.time()
+            self._write_json('{}.json'.format(entry), meta)
+            shutil.rmtree(out_dir, ignore_errors=True)
+            shutil.copytree(entry, out_dir)
+        return True
+
+
+    def store(self, key, out_dir, stage=''):
+        entry = '{}/{}'.format(self.object_dir, key)
+        tmp_dir = '{}.tmp{}'.format(entry, os.getpid())
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        shutil.copytree(out_dir, tmp_dir)
+        size = sum(os.path.getsize(os.path.join(root, i)) for root, _, files in os.walk(tmp_dir) for i in files)
+        with self._lock():
+            shutil.rmtree(entry, ignore_errors=True)
+            os.rename(tmp_dir, entry)
+            self._write_json('{}.json'.format(entry), {'stage': stage, 'size': size, 'last_access': time.time()})
+            self._evict()
+
+
+    def _evict(self):
+        # remove the least recently used entries until the cache fits in the size cap
+        if self.size <= 0:
+            return
+        entries = list()
+        for file in os.listdir(self.object_dir):
+            if file.endswith('.json'):
+                meta = self._read_json('{}/{}'.format(self.object_dir, file))
+                entries.append((meta.get('last_access', 0), meta.get('size', 0), file[:-len('.json')]))
+        total = sum(i[1] for i in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.size:
+                break
+            os.remove('{}/{}.json'.format(self.object_dir, key))
+            shutil.rmtree('{}/{}'.format(self.object_dir, key), ignore_errors=True)
+            total -= size
+            print('Evict {} from the cache'.format(key))
+
+
+    @contextlib.contextmanager
+    def _lock(self):
+        # steps run in parallel share the cache
+        with open('{}/.lock'.format(self.cache_dir), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+    def _read_json(self, file):
+        if not os.path.isfile(file):
+            return dict()
+        with open(file, 'r') as f:
+            return json.load(f)
+
+
+    def _write_json(self, file, obj):
+        with open('{}.tmp'.format(file), 'w') as f:
+            json.dump(obj, f)
+        os.replace('{}.tmp'.format(file), file)
+
+
+def main(args=None):
+    args = ArgumentParser().parse_args(args)
+    cmd = args.cmd[1:] if len(args.cmd) > 0 and args.cmd[0] == '--' else args.cmd
+    if len(cmd) == 0:
+        print('No command of {}'.format(args.stage))
+        sys.exit(1)
+    params = dict(i.split('=', 1) if '=' in i else (i, '') for i in args.param)
+
+    cache = ArtifactCache(args.cache_dir, args.size)
+    key = cache.key(args.stage, args.input, params)
+    if cache.fetch(key, args.dir):
+        print('Restore {} from the cache ({})'.format(args.stage, key))
+        return
+
+    # run the step, and cache its output directory when it succeeds
+    returncode = subprocess.call(cmd)
+    if returncode != 0:
+        sys.exit(returncode)
+    if os.path.isdir(args.dir):
+        cache.store(key, args.dir, args.stage)
+        print('Save {} to the cache ({})'.format(args.stage, key))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/python3
+
+import os, sys, argparse
+import numpy as np
+import pandas as pd
+from plinkio import BedReader, read_fam
+
+
+P_THRESHOLDS = ['1', '1e-1', '1e-2', '1e-3', '1e-4', '1e-5', '1e-6', '1e-7', '1e-8']
+
+
+def ArgumentParser():
+    parser = argparse.ArgumentParser(prog='clump_threshold_best_fit', description='select the best p-value threshold of clumping and thresholding')
+    parser.add_argument('-i', '--input', required=True, help='the input bfile prefix')
+    parser.add_argument('-a', '--assoc', required=True, help='the summary statistics (ID, A1, P, BETA)')
+    parser.add_argument('-s', '--snp', required=True, help='the clumped SNP list (.valid.snp)')
+    parser.add_argument('-c', '--covar', required=False, default='', help='the covariate file')
+    parser.add_argument('-m', '--method', required=False, default='clf', help='classificaion(clf) or regression(reg), default=clf')
+    parser.add_argument('-d', '--dir', required=True, help='the output directory')
+    parser.add_argument('-o', '--output', required=True, help='the output basename')
+    parser.add_argument('-n', '--n_thresholds', required=False, default=0, type=int, help='the number of log-spaced thresholds between 1e-8 and 1; default=0, the 9 thresholds 1, 1e-1, ..., 1e-8')
+    parser.add_argument('--memory', required=False, default=512, type=int, help='the memory (MB) of a decoded genotype block, default=512')
+    return parser
+
+
+# sweep the p-value thresholds of C+T in one pass of the clumped SNPs, and fit the null / full models of all thresholds together
+class ThresholdSweep():
+    def __init__(self, bfile, assoc_file, snp_file, thresholds=P_THRESHOLDS):
+        print('\n\n###### Clumping and Thresholding: Threshold Sweep ######\n\n')
+        self.reader = BedReader(bfile)
+        self.thresholds = list(thresholds)
+        self.threshold_values = np.array(list(map(float, self.thresholds)))
+
+        # clumped SNPs passing the largest threshold
+        ss_df = pd.read_csv(assoc_file, sep='\s+', usecols=['ID', 'A1', 'P', 'BETA'], dtype={'ID': str, 'A1': str})
+        with open(snp_file, 'r') as f:
+            snp_list = f.read().split()
+        ss_df = ss_df[ss_df['ID'].isin(snp_list) & (ss_df['P'] <= self.threshold_values.max())]
+        ss_df = ss_df.dropna(subset=['P', 'BETA']).drop_duplicates(subset='ID', keep='first')
+
+        # sorted by the position in the bed
+        pos, bim_idx, is_a2 = self.reader.match_alleles(ss_df['ID'].to_numpy(), ss_df['A1'].to_numpy())
+        order = np.argsort(bim_idx, kind='stable')
+        self.variant_idx = bim_idx[order]
+        self.flip = is_a2[order]
+        self.beta = ss_df['BETA'].to_numpy(dtype=np.float64)[pos][order]
+
+        # each SNP joins the scores of all thresholds >= its p-value
+        sorted_idx = np.argsort(self.threshold_values)
+        pvalue = ss_df['P'].to_numpy(dtype=np.float64)[pos][order]
+        self.bins = sorted_idx[np.searchsorted(self.threshold_values[sorted_idx], pvalue, side='left')]
+        self.sorted_idx = sorted_idx
+        print('{} clumped SNPs, {} thresholds'.format(len(self.variant_idx), len(self.thresholds)))
+
+
+    def __call__(self, memory=512):
+        # (samples, thresholds) scores: scores of each p-value bin, then cumulated over the sorted thresholds
+        n_thresholds = len(self.thresholds)
+        bin_scores = np.zeros((self.reader.n_samples, n_thresholds), dtype=np.float64)
+        block_size = self.reader.block_size(memory, itemsize=8)
+        for block, geno in self.reader.iter_blocks(self.variant_idx, block_size=block_size):
+            dosage = geno.astype(np.float64)
+            flip = self.flip[block]
+            dosage[flip] = 2 - dosage[flip]
+            # missing genotypes are imputed by 2 x the frequency of the scored allele in the observed calls, as plink --score
+            missing = geno < 0
+            dosage[missing] = 0
+            n_called = dosage.shape[1] - missing.sum(axis=1)
+            mean = np.divide(dosage.sum(axis=1), n_called, out=np.zeros(dosage.shape[0]), where=n_called > 0)
+            dosage = np.where(missing, mean[:, None], dosage)
+            weights = np.zeros((dosage.shape[0], n_thresholds), dtype=np.float64)
+            weights[np.arange(dosage.shape[0]), self.bins[block]] = self.beta[block]
+            bin_scores += dosage.T @ weights
+
+        scores = np.empty_like(bin_scores)
+        scores[:, self.sorted_idx] = np.cumsum(bin_scores[:, self.sorted_idx], axis=1)
+        return scores
+
+
+def load_phenotype(bfile, method, covar_file=''):
+    fam_df = read_fam('{}.fam'.format(bfile))
+    fam_df['row'] = np.arange(fam_df.shape[0])
+    fam_df['phenotype'] = fam_df['phenotype'].replace(-9, np.nan)
+    if method == 'clf':
+        fam_df['phenotype'] = fam_df['phenotype'].map({1: 0, 2: 1}) # control = 0, case = 1; others are NA
+    df = fam_df[['FID', 'IID', 'row', 'phenotype']]
+
+    # covariates
+    covs = list()
+    if os.path.isfile(covar_file):
+        cov_df = pd.read_csv(covar_file, sep='\s+', dtype={'FID': str, 'IID': str})
+        covs = [col for col in cov_df.columns if col not in ['FID', 'IID']]
+        df = df.merge(cov_df, on=['FID', 'IID'], how='inner')
+    df = df.replace(-9, np.nan).dropna(subset=['phenotype'] + covs)
+    return df, covs
+
+
+# R-square of linear regressions sharing the covariates, one model per column of scores
+def linear_r2(y, x_null, scores):
+    q, _ = np.linalg.qr(x_null)
+    res_y = y - q @ (q.T @ y)
+    res_s = scores - q @ (q.T @ scores)
+    tss = np.sum((y - y.mean())**2)
+    rss_null = np.sum(res_y**2)
+    ss = np.sum(res_s**2, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rss = rss_null - np.where(ss > 0, (res_s.T @ res_y)**2 / ss, 0)
+    return 1 - rss_null / tss, 1 - rss / tss
+
+
+# log-likelihoods of logistic regressions sharing the covariates, fitted by batched Newton-Raphson with step halving
+# fits not converged in maxit iterations (e.g. separation, where the coefficients diverge) are NaN
+def logistic_loglik(y, x_null, scores=None, maxit=100, tol=1e-8, max_halving=30):
+    if scores is None:
+        x = x_null[None, :, :]
+    else:
+        x = np.concatenate([np.broadcast_to(x_null, (scores.shape[1],) + x_null.shape), scores.T[:, :, None]], axis=2)
+
+    def loglik(x, b):
+        eta = np.einsum('tnp,tp->tn', x, b)
+        return np.sum(y * eta - np.logaddexp(0, eta), axis=1)
+
+    b = np.zeros((x.shape[0], x.shape[2]))
+    current = loglik(x, b)
+    active = np.ones(x.shape[0], dtype=bool)
+    for _ in range(maxit):
+        idx = np.flatnonzero(active)
+        if len(idx) == 0:
+            break
+        xa, ba = x[idx], b[idx]
+        mu = 1 / (1 + np.exp(-np.einsum('tnp,tp->tn', xa, ba)))
+        w = mu * (1 - mu)
+        grad = np.einsum('tnp,tn->tp', xa, y - mu)
+        hess = np.einsum('tnp,tn,tnq->tpq', xa, w, xa) + 1e-10 * np.eye(x.shape[2])
+        step = np.linalg.solve(hess, grad[:, :, None])[:, :, 0]
+
+        # halve the steps that decrease the log-likelihood; a fit without any increasing step stops where it is
+        t = np.ones(len(idx))
+        new = loglik(xa, ba + step)
+        for _ in range(max_halving):
+            worse = ~(new >= current[idx])
+            if not worse.any():
+                break
+            t[worse] /= 2
+            new[worse] = loglik(xa[worse], ba[worse] + t[worse, None] * step[worse])
+        stuck = ~(new >= current[idx])
+        t[stuck] = 0
+        b[idx] = ba + t[:, None] * step
+        current[idx] = np.where(stuck, current[idx], new)
+        active[idx[stuck | (np.max(np.abs(step), axis=1) < tol)]] = False
+    current[active] = np.nan
+    return current
+
+
+def nagelkerke_r2(loglik, loglik0, n):
+    return (1 - np.exp(2 * (loglik0 - loglik) / n)) / (1 - np.exp(2 * loglik0 / n))
+
+
+def main(args=None):
+    args = ArgumentParser().parse_args(args)
+
+    # thresholds
+    if args.n_thresholds > 0:
+        thresholds = ['{:.3g}'.format(i) for i in np.logspace(0, -8, args.n_thresholds)]
+    else:
+        thresholds = P_THRESHOLDS
+
+    # scores of all thresholds
+    sweep = ThresholdSweep(args.input, args.assoc, args.snp, thresholds)
+    scores = sweep(memory=args.memory)
+
+    # phenotype and covariates
+    df, covs = load_phenotype(args.input, args.method, args.covar)
+    y = df['phenotype'].to_numpy(dtype=np.float64)
+    x_null = np.column_stack([np.ones(df.shape[0])] + [df[col].to_numpy(dtype=np.float64) for col in covs])
+    scores = scores[df['row'].to_numpy()]
+
+    # min-max normalization
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = (scores - scores.min(axis=0)) / (scores.max(axis=0) - scores.min(axis=0))
+    valid = np.isfinite(scores).all(axis=0)
+
+    # R-square of PRS = R-square of the full model - R-square of the null model (0 without covariates)
+    r2 = np.full(len(thresholds), np.nan)
+    n = df.shape[0]
+    if args.method == 'clf':
+        loglik0 = n * np.mean(y) * np.log(np.mean(y)) + n * (1 - np.mean(y)) * np.log(1 - np.mean(y))
+        null_r2 = nagelkerke_r2(logistic_loglik(y, x_null)[0], loglik0, n) if len(covs) > 0 else 0
+        for start in range(0, len(thresholds), 32): # batches of thresholds to bound the memory
+            idx = np.flatnonzero(valid)[start:start+32]
+            if len(idx) > 0:
+                r2[idx] = nagelkerke_r2(logistic_loglik(y, x_null, scores[:, idx]), loglik0, n) - null_r2
+    else:
+        null_r2, full_r2 = linear_r2(y, x_null, scores[:, valid])
+        r2[valid] = full_r2 - (null_r2 if len(covs) > 0 else 0)
+
+    # summary of the thresholds with a valid score
+    result_df = pd.DataFrame({'Threshold': thresholds, 'R2': r2}).dropna()
+    result_df.to_csv('{}/{}.r2.summary'.format(args.dir, args.output), sep='\t', index=False)
+    if not np.isfinite(r2).any():
+        print('No valid threshold')
+        sys.exit(1)
+
+    # best result
+    best_threshold = thresholds[int(np.nanargmax(r2))]
+    print('Best fit threshold: {}'.format(best_threshold))
+    with open('{}/best_pvalue_range'.format(args.dir), 'w') as f:
+        f.write('{} 0 {}\n'.format(best_threshold, best_threshold))
+
+
+if __name__ == '__main__':
+    main()
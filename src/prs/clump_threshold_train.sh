@@ -17,7 +17,7 @@ while getopts 'hi:c:a:m:p:d:o:' flag; do
             echo "-c, the covariates file (optional)"
             echo "-a, the filename of summary statistics"
             echo "-m, method (classification(clf) or regression(reg), default='clf'"
-            echo "-p, the directory of src (clump_threshold_best_fit.R)"
+            echo "-p, the directory of src (clump_threshold_best_fit.py)"
             echo "-d, the directory of working and output"
             echo "-o, the basename of output file"
             ;;
@@ -46,7 +46,7 @@ if [ -z "$METHOD" ]; then
     METHOD='clf'
 fi
 
-if [ ! -f "$OPT_DIR/clump_threshold_best_fit.R" ]; then
+if [ ! -f "$OPT_DIR/clump_threshold_best_fit.py" ]; then
     echo "-p missing"
     exit 1
 fi
@@ -77,48 +77,22 @@ plink1.9 \
 # extract valid SNPs
 awk 'NR!=1{print $3}' "${WORK_DIR}"/"${BASENAME}".clumped > "${WORK_DIR}"/"${BASENAME}".valid.snp
 
-# extract P-value
-P_COLNUM=$(sed -n '1s/\s/\n/gp' $ASSOC_FILE | grep -nx 'P' | cut -d: -f1)
-awk -v p_colnum=$P_COLNUM '{print $3,$p_colnum}' "${ASSOC_FILE}" > "${WORK_DIR}"/"${BASENAME}".pvalue
-
-# list of P-value 
-{
-    echo "1e-8 0 1e-8"
-    echo "1e-7 0 1e-7"
-    echo "1e-6 0 1e-6"
-    echo "1e-5 0 1e-5"
-    echo "1e-4 0 1e-4"
-    echo "1e-3 0 1e-3"
-    echo "1e-2 0 1e-2"
-    echo "1e-1 0 1e-1"
-    echo "1 0 1"
-} > "$WORK_DIR"/pvalue_ranges
-
-# PRS
-BETA_COLNUM=$(sed -n '1s/\s/\n/gp' $ASSOC_FILE | grep -nx 'BETA' | cut -d: -f1)
-plink1.9 \
-    --bfile "$BFILE" \
-    --score "$ASSOC_FILE" 3 6 "${BETA_COLNUM}" header sum \
-    --q-score-range "$WORK_DIR"/pvalue_ranges "${WORK_DIR}"/"${BASENAME}".pvalue \
-    --extract "${WORK_DIR}"/"${BASENAME}".valid.snp \
-    --allow-extra-chr \
-    --allow-no-sex \
-    --out "${WORK_DIR}"/"${BASENAME}"
-
-# select best fit threshold
+# PRS of all p-value thresholds and select best fit threshold
 if [ -f "$COVAR_FILE" ]; then
-    Rscript "$OPT_DIR"/clump_threshold_best_fit.R \
+    python3 "$OPT_DIR"/clump_threshold_best_fit.py \
         -i "$BFILE" \
+        -a "$ASSOC_FILE" \
+        -s "${WORK_DIR}"/"${BASENAME}".valid.snp \
         -c "$COVAR_FILE" \
-        -p "$WORK_DIR/$BASENAME" \
         -m "$METHOD" \
         -d "$WORK_DIR" \
         -o "$BASENAME"
 else
-    Rscript "$OPT_DIR"/clump_threshold_best_fit.R \
+    python3 "$OPT_DIR"/clump_threshold_best_fit.py \
         -i "$BFILE" \
-        -p "$WORK_DIR/$BASENAME" \
+        -a "$ASSOC_FILE" \
+        -s "${WORK_DIR}"/"${BASENAME}".valid.snp \
         -m "$METHOD" \
         -d "$WORK_DIR" \
         -o "$BASENAME"
-fi
\ No newline at end of file
+fi
@@ -61,34 +61,19 @@ if [ -z "$BASENAME" ]; then
     exit 1
 fi
 
-### remove duplicates
-plink2 \
-    --bfile "${BFILE}" \
-    --rm-dup force-first \
-    --chr 1-22,X \
-    --allow-extra-chr \
-    --make-bed \
-    --out "${WORK_DIR}/${BASENAME}.dedup"
-
-# build oxford format
-head "${FEATURE}" -n1 | sed -e 's/[,\*]/\n/g' | sed -E 's/_[ATCGatcgNn-]+\.[ATCGatcgNn-]+$//g'| sort | uniq > "${WORK_DIR}/${BASENAME}.snp_list"
-if [ ! -f "${WORK_DIR}/${BASENAME}.gen" ] || [ ! -f "${WORK_DIR}/${BASENAME}.sample" ]; then
-    plink1.9 \
-        --bfile "${WORK_DIR}/${BASENAME}.dedup" \
-        --allow-extra-chr \
-        --extract "${WORK_DIR}/${BASENAME}.snp_list" \
-        --recode oxford \
-        --out "${WORK_DIR}/${BASENAME}"
-fi
-
-# extract phenotype
+# extract phenotype (control = 0, case = 1 for classification; NA for missing)
 if [ ! -f "${WORK_DIR}/${BASENAME}.phenotype.csv" ]; then
-    awk 'NR>2{print $5}' "${WORK_DIR}/${BASENAME}.sample" > "${WORK_DIR}/${BASENAME}.phenotype.csv"
+    if [ ${METHOD} = "c" ]; then
+        awk '{if ($6 == 1) print 0; else if ($6 == 2) print 1; else print "NA"}' "${BFILE}.fam" > "${WORK_DIR}/${BASENAME}.phenotype.csv"
+    else
+        awk '{if ($6 == -9) print "NA"; else print $6}' "${BFILE}.fam" > "${WORK_DIR}/${BASENAME}.phenotype.csv"
+    fi
 fi
 
-# GenEpi
+# GenEpi: the selected SNPs are read from the bed file directly, through a view without duplicated variants (chromosomes 1-22 and X)
 python3 "${PREDICTOR}" \
-    -g "${WORK_DIR}/${BASENAME}.gen" \
+    -b "${BFILE}" \
+    -r \
     -p "${WORK_DIR}/${BASENAME}.phenotype.csv" \
     -m "${MODEL}" \
     -f "${FEATURE}" \
@@ -102,8 +87,7 @@ fi
 awk 'NR==FNR {a[NR]=$1","$2;next} FNR>1 {print a[FNR-1], $0}' OFS=',' "$BFILE.fam" "${WORK_DIR}/${BASENAME}.pred/Prediction.csv" >> "${WORK_DIR}/${BASENAME}.pred.csv"
 
 # remove files
-rm ${WORK_DIR}/${BASENAME}.dedup.* || true
-EXTS=("gen" "sample" "phenotype.csv" "log" "nosex" "snp_list")
+EXTS=("phenotype.csv")
 for EXT in "${EXTS[@]}";
 do
     TMP_FILE=${WORK_DIR}/${BASENAME}.${EXT}
@@ -8,7 +8,7 @@ err_report(){
 trap 'err_report ${LINENO} "${BASH_COMMAND}"' ERR
 
 # arguments
-while getopts 'hi:m:b:g:ed:o:' flag; do
+while getopts 'hi:m:b:g:ed:o:t:' flag; do
     case $flag in
         h)
             echo "GenEpi training"
@@ -20,6 +20,7 @@ while getopts 'hi:m:b:g:ed:o:' flag; do
             echo "-e, apply epistasis"
             echo "-d, the directory of working and output"
             echo "-o, the basename of output file"
+            echo "-t, the number of threads, default=16"
             ;;
         i) BFILE=$OPTARG;;
         m) METHOD=$OPTARG;;
@@ -28,7 +29,8 @@ while getopts 'hi:m:b:g:ed:o:' flag; do
         e) EPISTASIS="true";;
         d) WORK_DIR=$OPTARG;;
         o) BASENAME=$OPTARG;;
-        *) echo "usage: $0 [-i] [-m] [-b] [-g] [-e] [-d] [-o]"; exit 1;;
+        t) N_THREAD=$OPTARG;;
+        *) echo "usage: $0 [-i] [-m] [-b] [-g] [-e] [-d] [-o] [-t]"; exit 1;;
     esac
 done
 
@@ -46,6 +48,10 @@ if [ ! -d "$DBDIR" ]; then
     exit 1
 fi
 
+if [ -z "$N_THREAD" ]; then
+    N_THREAD=16
+fi
+
 if [ -z "$GENOME" ]; then
     GENOME='hg19'
 fi
@@ -89,7 +95,7 @@ if [ "$EPISTASIS" = "true" ]; then
         -o "${WORK_DIR}/${BASENAME}" \
         -b "${GENOME}" \
         -k 5 \
-        -t 16
+        -t "${N_THREAD}"
 else
     echo "Run GenEpi without epistasis"
     GenEpi \
@@ -100,7 +106,7 @@ else
         -o "${WORK_DIR}/${BASENAME}" \
         -b "${GENOME}" \
         -k 5 \
-        -t 16 \
+        -t "${N_THREAD}" \
         --noepistasis
 fi
 
@@ -0,0 +1,38 @@
+#!/usr/bin/python3
+
+import os, sys, argparse
+from utils import *
+
+
+def ArgumentParser():
+    parser = argparse.ArgumentParser(prog='merge_ref', description='merge the exact rank references (rank_ref.npz) of cohort shards into one cohort reference')
+    parser.add_argument('--ref', required=True, action='append', help='the exact rank reference (rank_ref.npz) of a shard; repeat for each shard')
+    parser.add_argument('--out_dir', required=True, help='the output directory; rank_ref.csv, hist_ref.csv, rank_ref.npz, and ref_moments.csv are saved here')
+    return parser
+
+
+def main(args=None):
+    args = ArgumentParser().parse_args(args)
+    for file in args.ref:
+        if not os.path.isfile(file):
+            print('{} is not found'.format(file))
+            sys.exit(1)
+    if not os.path.isdir(args.out_dir):
+        os.mkdir(args.out_dir)
+
+    print('\n\n###### Merging {} Cohort References ######\n\n'.format(len(args.ref)))
+    exact_ref = ExactRankRef.load(args.ref[0])
+    for file in args.ref[1:]:
+        exact_ref = exact_ref.merge(ExactRankRef.load(file))
+
+    rank_ref_df, hist_ref_df = exact_ref.summary()
+    moments_df = exact_ref.moments()
+    print(moments_df)
+    rank_ref_df.to_csv(f'{args.out_dir}/rank_ref.csv')
+    hist_ref_df.to_csv(f'{args.out_dir}/hist_ref.csv')
+    moments_df.to_csv(f'{args.out_dir}/ref_moments.csv')
+    exact_ref.save(f'{args.out_dir}/rank_ref.npz')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+
+import os, sys, shutil, argparse
+from scheduler import Job, JobScheduler, SKIPPED
+
+
+# PRS algorithms trained independently before CollectBeta
+ALGOS = ['CandT', 'PRSice2', 'Lassosum', 'LDpred2', 'PRScs', 'GenEpi']
+# algorithms that run on NODE_THREAD cores; the others are single-threaded
+MULTI_THREAD_ALGOS = ['PRScs', 'Lassosum', 'LDpred2', 'GenEpi']
+
+
+def ArgumentParser():
+    parser = argparse.ArgumentParser(prog='pipeline', description='run the steps of run_prs.sh as a DAG; each step is an exported bash function of run_prs.sh')
+    parser.add_argument('--tools', required=True, help='the PRS algorithms, separated by comma')
+    parser.add_argument('--out_dir', required=True, help='the output directory of PRS')
+    parser.add_argument('--log_dir', required=True, help='the log directory; logs of each algorithm are saved as [log_dir]/[ALGO].log')
+    parser.add_argument('--detail_log', required=True, help='the detail log; logs of all steps are appended when the steps finish')
+    parser.add_argument('--run_base', required=False, default='false', help='predict and analyze the base data (true/false), default=false')
+    parser.add_argument('--run_test', required=False, default='false', help='predict and analyze the test data (true/false), default=false')
+    parser.add_argument('--thread', required=False, default=1, type=int, help='the number of cores, default=1')
+    parser.add_argument('--memory', required=False, default=0, type=int, help='the memory (MB), default=0 (no limit)')
+    return parser
+
+
+class PRSPipeline():
+    def __init__(self, tools, out_dir, log_dir, detail_log, run_base=False, run_test=False, thread=1, memory=0):
+        self.out_dir = out_dir
+        self.log_dir = log_dir
+        self.detail_log = detail_log
+        self.thread = max(1, thread)
+        self.memory = memory
+
+        # training: GenEpi is trained on the base data
+        self.algos = [algo for algo in ALGOS if algo in tools]
+        if not run_base and 'GenEpi' in self.algos:
+            self.algos.remove('GenEpi')
+
+        # prediction and analysis
+        self.datasets = ['target']
+        if run_base:
+            self.datasets.append('base')
+        if run_test:
+            self.datasets.append('test')
+
+
+    def __call__(self):
+        jobs = self.jobs()
+        scheduler = JobScheduler(thread=self.thread, memory=self.memory)
+        failed = scheduler(jobs)
+        return all(not job.critical for job in failed)
+
+
+    def jobs(self):
+        jobs = list()
+
+        # training: algorithms share the cores and memory; single-threaded algorithms take one core each, and the
+        # multi-threaded ones split the rest (PRScs first for the remainder)
+        n_algos = max(len(self.algos), 1)
+        memory = self.memory // n_algos
+        multi = [algo for algo in MULTI_THREAD_ALGOS if algo in self.algos]
+        spare = max(self.thread - (len(self.algos) - len(multi)), len(multi))
+        for algo in self.algos:
+            threads = 1
+            if algo in multi:
+                threads = spare // len(multi) + (1 if multi.index(algo) < spare % len(multi) else 0)
+            jobs.append(self._job(algo, 'train {}'.format(algo), threads=threads, memory=memory,
+                                  callback=self._algo_callback))
+
+        # check and merge beta after all algorithms, successful or not
+        jobs.append(self._job('CollectBeta', 'collect_beta', after=self.algos, critical=True,
+                              callback=self._stage_callback('PRS: Build PRS model complete', 'PRS: Collect beta failed')))
+
+        # prediction of all datasets in one job, which loads the weights once and predicts the datasets in parallel
+        jobs.append(self._job('predict', 'predict', threads=self.thread, memory=self.memory, deps=['CollectBeta'], critical=True,
+                              callback=self._stage_callback(None, 'PRS: Prediction and evaluation failed')))
+
+        # analysis: base and test are ranked by the reference of target, and share the cores rendering figures after it
+        n_others = max(len(self.datasets) - 1, 1)
+        for dataset in self.datasets:
+            deps = ['predict'] + (['analyze_target'] if dataset != 'target' else [])
+            threads = self.thread if dataset == 'target' else max(1, self.thread // n_others)
+            jobs.append(self._job('analyze_{}'.format(dataset), 'analyze_{}'.format(dataset), threads=threads, deps=deps, critical=True,
+                                  callback=self._stage_callback(None, 'PRS: Prediction and evaluation failed')))
+        return jobs
+
+
+    def _job(self, name, function, threads=1, memory=0, **kwargs):
+        # run the exported bash function of run_prs.sh; NODE_THREAD and NODE_MEMORY are the resources of the step
+        cmd = ['bash', '-c', 'set -eo pipefail; {}'.format(function)]
+        env = {'NODE_THREAD': str(threads), 'NODE_MEMORY': str(memory)}
+        return Job(name, cmd, threads=threads, memory=memory, log_file='{}/{}.log'.format(self.log_dir, name), env=env, **kwargs)
+
+
+    def _append_detail(self, job, keep=True):
+        if not os.path.isfile(job.log_file):
+            return
+        with open(job.log_file, 'r') as f, open(self.detail_log, 'a') as fw:
+            fw.write(f.read())
+        if not keep:
+            os.remove(job.log_file)
+
+
+    def _algo_callback(self, job):
+        # the same as my_catch of run_prs.sh: [log_dir]/[ALGO].log is kept, and the output of a failed algorithm is removed
+        self._append_detail(job, keep=True)
+        if job.returncode == 0:
+            print('PRS: {} successfully complete'.format(job.name))
+        else:
+            print('PRS: {} failed'.format(job.name))
+            shutil.rmtree('{}/{}'.format(self.out_dir, job.name), ignore_errors=True)
+
+
+    def _stage_callback(self, success_message, fail_message):
+        def callback(job):
+            self._append_detail(job, keep=False)
+            if job.returncode == 0 and success_message is not None:
+                print(success_message)
+            elif job.returncode not in [0, SKIPPED]:
+                print(fail_message)
+        return callback
+
+
+def main(args=None):
+    args = ArgumentParser().parse_args(args)
+    tools = [i.strip() for i in args.tools.split(',')]
+    pipeline = PRSPipeline(tools, args.out_dir, args.log_dir, args.detail_log,
+                           run_base=args.run_base == 'true', run_test=args.run_test == 'true',
+                           thread=args.thread, memory=args.memory)
+    if not pipeline():
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/python3
+
+import os, hashlib, zipfile
+import numpy as np
+import pandas as pd
+
+
+# the number of A1 (the 5th column of .bim) alleles of each 2-bit code; -1 = missing
+# 00: homozygous A1, 01: missing, 10: heterozygous, 11: homozygous A2
+CODE_TO_COUNT = np.array([2, -1, 1, 0], dtype=np.int8)
+BYTE_TO_COUNT = CODE_TO_COUNT[(np.arange(256)[:, None] >> np.array([0, 2, 4, 6])) & 3] # (256, 4)
+BED_MAGIC = b'\x6c\x1b\x01'
+
+# schemas of the PLINK text formats, parsed by the C engine of pandas; chromosomes and alleles are categorical with the
+# labels of the file, and CHR_CODE of a bim is the int8 code of plink (chrom_code); phenotypes are inferred, as integer codes
+# of case/control or a quantitative trait
+BIM_COLUMNS = ['CHR', 'ID', 'CM', 'POS', 'A1', 'A2']
+BIM_DTYPE = {'CHR': 'category', 'ID': str, 'CM': np.float64, 'POS': np.int32, 'A1': 'category', 'A2': 'category'}
+FAM_COLUMNS = ['FID', 'IID', 'father', 'mother', 'sex', 'phenotype']
+FAM_DTYPE = {'FID': str, 'IID': str, 'father': str, 'mother': str, 'sex': np.int8}
+PROFILE_DTYPE = {'FID': str, 'IID': str, 'CNT': np.int64, 'CNT2': np.int64, 'SCORE': np.float64, 'SCORESUM': np.float64}
+BIM_CACHE_VERSION = 2
+
+
+def read_bim(bim_file, cache_dir=None):
+    # the parsed bim is cached in [cache_dir]/bim (default: CACHE_DIR of the environment; unset = no cache) as an npz of
+    # plain arrays, loaded without pickle and reused while the size and mtime of the bim are unchanged
+    cache_dir = os.environ.get('CACHE_DIR') if cache_dir is None else cache_dir
+    cache_file = None
+    if cache_dir:
+        path = os.path.realpath(bim_file)
+        cache_file = '{}/bim/{}.npz'.format(cache_dir, hashlib.sha256(path.encode()).hexdigest()[:32])
+    stat = os.stat(bim_file)
+    key = np.array([BIM_CACHE_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    if cache_file is not None and os.path.isfile(cache_file):
+        try:
+            df = _load_bim_cache(cache_file, key)
+            if df is not None:
+                return df
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+            print('Ignore the bim cache {}: {}'.format(cache_file, e))
+
+    df = pd.read_csv(bim_file, sep='\s+', engine='c', header=None, names=BIM_COLUMNS, dtype=BIM_DTYPE)
+    chrom = df['CHR'].cat
+    df['CHR_CODE'] = np.where(chrom.codes >= 0, chrom_code(chrom.categories)[chrom.codes], 0).astype(np.int8)
+    if cache_file is not None:
+        try:
+            _save_bim_cache(cache_file, key, df)
+        except OSError as e:
+            print('Skip the bim cache {}: {}'.format(cache_file, e))
+    return df
+
+
+def _save_bim_cache(cache_file, key, df):
+    # written atomically into a directory private to the user
+    os.makedirs(os.path.dirname(cache_file), mode=0o700, exist_ok=True)
+    arrays = {'key': key, 'CM': df['CM'].to_numpy(), 'POS': df['POS'].to_numpy(), 'CHR_CODE': df['CHR_CODE'].to_numpy()}
+    # IDs have no whitespace in a bim; they are joined by newlines into one buffer of utf-8 bytes
+    arrays['ID'] = np.frombuffer('\n'.join(df['ID'].tolist()).encode(), dtype=np.uint8)
+    for col in ['CHR', 'A1', 'A2']:
+        arrays['{}.codes'.format(col)] = df[col].cat.codes.to_numpy()
+        arrays['{}.categories'.format(col)] = np.asarray(df[col].cat.categories.astype(str), dtype=str)
+    tmp_file = '{}.tmp{}.npz'.format(cache_file[:-len('.npz')], os.getpid())
+    try:
+        np.savez(tmp_file, **arrays)
+        os.replace(tmp_file, cache_file)
+    finally:
+        if os.path.isfile(tmp_file):
+            os.remove(tmp_file)
+
+
+def _load_bim_cache(cache_file, key):
+    # None when the bim has changed since the cache was written
+    with np.load(cache_file, allow_pickle=False) as data:
+        if not np.array_equal(data['key'], key):
+            return None
+        n = data['POS'].shape[0]
+        ids = np.array(data['ID'].tobytes().decode().split('\n') if n > 0 else [], dtype=object)
+        if ids.shape[0] != n:
+            raise ValueError('{} IDs of {} variants'.format(len(ids), n))
+        df = pd.DataFrame({'CHR': None, 'ID': ids, 'CM': data['CM'], 'POS': data['POS'], 'A1': None, 'A2': None})
+        for col in ['CHR', 'A1', 'A2']:
+            df[col] = pd.Categorical.from_codes(data['{}.codes'.format(col)], categories=data['{}.categories'.format(col)].astype(object))
+        df['CHR_CODE'] = data['CHR_CODE']
+    return df
+
+
+def read_fam(fam_file):
+    return pd.read_csv(fam_file, sep='\s+', engine='c', header=None, names=FAM_COLUMNS, dtype=FAM_DTYPE)
+
+
+def read_profile(profile_file, usecols=None):
+    # plink --score output ([out].profile) with a header; columns not in PROFILE_DTYPE are inferred
+    return pd.read_csv(profile_file, sep='\s+', engine='c', usecols=usecols, dtype=PROFILE_DTYPE)
+
+
+def chrom_code(chrom):
+    # chromosome codes of plink as int8: 1-22, X = 23, Y = 24, XY = 25, MT = 26, and 0 for the others (unplaced)
+    chrom = pd.Series(chrom, dtype=str).str.replace('^chr', '', case=False, regex=True).str.upper()
+    code = pd.to_numeric(chrom.replace({'X': '23', 'Y': '24', 'XY': '25', 'MT': '26', 'M': '26'}), errors='coerce')
+    return code.where((code >= 0) & (code <= 26), 0).fillna(0).to_numpy(dtype=np.int8)
+
+
+def normalize_chrom(chrom):
+    # chromosome codes as plink: '1'-'22', 'X' (23), 'Y' (24), 'XY' (25), 'MT' (26)
+    chrom = pd.Series(chrom, dtype=str).str.replace('^chr', '', case=False, regex=True).str.upper()
+    return chrom.replace({'23': 'X', '24': 'Y', '25': 'XY', '26': 'MT', 'M': 'MT'}).to_numpy()
+
+
+def view_index(bim_df, dedup=False, chroms=None):
+    # the kept variants of a view, the same as plink2 [--chr chroms] [--rm-dup force-first]
+    # chromosomes are filtered first; the first variant of each duplicated ID is kept, and missing IDs ('.') are never duplicates
+    keep = np.ones(bim_df.shape[0], dtype=bool)
+    if chroms is not None:
+        keep &= np.isin(normalize_chrom(bim_df['CHR']), normalize_chrom(list(chroms)))
+    if dedup:
+        ids = bim_df['ID'].to_numpy()
+        duplicated = pd.Series(np.where(keep, ids, None)).duplicated(keep='first').to_numpy()
+        keep &= ~(duplicated & (ids != '.'))
+    return np.flatnonzero(keep)
+
+
+# memory-mapped reader of a PLINK1 bfile (.bed, .bim, .fam)
+# genotypes are decoded into int8 counts of A1 (the 5th column of .bim), -1 for missing
+# dedup / chroms give a view of the kept variants over the original bed, without writing a copy of the genotypes
+class BedReader():
+    def __init__(self, bfile, dedup=False, chroms=None):
+        self.bfile = bfile
+        self.bim_df = read_bim('{}.bim'.format(bfile))
+        self.fam_df = read_fam('{}.fam'.format(bfile))
+        n_rows = self.bim_df.shape[0]
+        self.n_samples = self.fam_df.shape[0]
+        self.bytes_per_variant = (self.n_samples + 3) // 4
+
+        # bed
+        with open('{}.bed'.format(bfile), 'rb') as f:
+            magic = f.read(3)
+        if magic != BED_MAGIC:
+            raise ValueError('{}.bed is not a variant-major PLINK1 bed file'.format(bfile))
+        self.bed = np.memmap('{}.bed'.format(bfile), dtype=np.uint8, mode='r', offset=3,
+                             shape=(n_rows, self.bytes_per_variant))
+
+        # view: variant i of the reader is row rows[i] of the bed
+        self.rows = None
+        if dedup or chroms is not None:
+            self.rows = view_index(self.bim_df, dedup, chroms)
+            self.bim_df = self.bim_df.iloc[self.rows].reset_index(drop=True)
+            print('View of {}: {} / {} variants'.format(bfile, len(self.rows), n_rows))
+        self.n_variants = self.bim_df.shape[0]
+        self._id_index = None
+
+
+    def variant_index(self, variants):
+        # variant IDs or indices -> indices; unknown IDs are -1, and duplicated IDs map to the first variant
+        variants = np.asarray(variants)
+        if variants.dtype.kind in 'iu':
+            return variants.astype(np.int64)
+        if self._id_index is None:
+            first = np.flatnonzero(~self.bim_df['ID'].duplicated(keep='first').to_numpy())
+            self._id_index = (pd.Index(self.bim_df['ID'].to_numpy()[first]), first)
+        index, first = self._id_index
+        idx = index.get_indexer(variants)
+        return np.where(idx >= 0, first[idx], -1)
+
+
+    def match_alleles(self, variants, alleles):
+        # match (variant, allele) pairs onto the bim; the allele must be A1 or A2 of the variant
+        # return the positions of the matched pairs, their variant indices, and whether the allele is A2
+        idx = self.variant_index(variants)
+        pos = np.flatnonzero(idx >= 0)
+        idx = idx[pos]
+        alleles = np.asarray(alleles)[pos]
+        is_a1 = alleles == self.bim_df['A1'].to_numpy()[idx]
+        is_a2 = alleles == self.bim_df['A2'].to_numpy()[idx]
+        valid = is_a1 | is_a2
+        return pos[valid], idx[valid], is_a2[valid]
+
+
+    def sample_index(self, keep):
+        # keep file (FID IID), a list of (FID, IID), or a list of IID -> indices of the fam; unknown samples are dropped
+        if isinstance(keep, str):
+            keep = pd.read_csv(keep, sep='\s+', header=None, usecols=[0, 1], dtype=str).values.tolist()
+        keep = list(keep)
+        if len(keep) > 0 and isinstance(keep[0], (list, tuple)):
+            keys = pd.MultiIndex.from_frame(self.fam_df[['FID', 'IID']])
+            idx = keys.get_indexer(pd.MultiIndex.from_tuples([tuple(map(str, i)) for i in keep]))
+        else:
+            idx = pd.Index(self.fam_df['IID']).get_indexer(list(map(str, keep)))
+        return idx[idx >= 0]
+
+
+    def read(self, variants=None, samples=None):
+        # (variants, samples) int8 matrix of the selected variants and samples
+        variants = self._selected(variants)
+        return self._decode(self.bed[self._bed_rows(variants)], samples)
+
+
+    def iter_blocks(self, variants=None, samples=None, block_size=10000):
+        # yield (position in variants, int8 genotype block); only the rows of the selected variants are paged in
+        variants = self._selected(variants)
+        for start in range(0, len(variants), block_size):
+            idx = self._bed_rows(variants[start:start+block_size])
+            if len(idx) > 0 and np.all(np.diff(idx) == 1):
+                rows = self.bed[idx[0]:idx[-1]+1] # contiguous, read as a slice
+            else:
+                rows = self.bed[idx]
+            yield slice(start, start + len(idx)), self._decode(rows, samples)
+
+
+    def block_size(self, memory=512, itemsize=8, samples=None):
+        # variants per block so that a decoded block of the itemsize fits in the memory (MB)
+        n = self.n_samples if samples is None else len(samples)
+        return max(1, int(memory * 1024**2 // (max(n, 1) * itemsize)))
+
+
+    def _selected(self, variants):
+        # indices of the variants to read; unknown IDs raise KeyError and out-of-range indices raise IndexError
+        if variants is None:
+            return np.arange(self.n_variants)
+        idx = self.variant_index(variants)
+        if np.asarray(variants).dtype.kind in 'iu':
+            bad = (idx < 0) | (idx >= self.n_variants)
+            if bad.any():
+                raise IndexError('variant indices out of range [0, {}): {}'.format(self.n_variants, idx[bad][:10].tolist()))
+        elif (idx < 0).any():
+            missing = np.asarray(variants)[idx < 0]
+            raise KeyError('{} variants not in {}.bim: {}'.format(len(missing), self.bfile, ', '.join(map(str, missing[:10]))))
+        return idx
+
+
+    def _bed_rows(self, variants):
+        # variant indices of the view -> rows of the bed
+        return variants if self.rows is None else self.rows[variants]
+
+
+    def _decode(self, rows, samples=None):
+        rows = np.asarray(rows)
+        if samples is None:
+            # 4 genotypes per byte through the lookup table
+            return BYTE_TO_COUNT[rows].reshape(rows.shape[0], rows.shape[1] * 4)[:, :self.n_samples]
+        # only the bytes holding the selected samples
+        samples = np.asarray(samples)
+        shift = ((samples % 4) * 2).astype(np.uint8)
+        return CODE_TO_COUNT[(rows[:, samples // 4] >> shift) & 3]
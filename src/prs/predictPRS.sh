@@ -37,33 +37,18 @@ REAL_PATH=$(realpath $0)
 SRC_DIR=$(dirname ${REAL_PATH})
 
 
-### dedup
-if [ "${DEDUP}" = "true" ];then
-    printf "\n\n\n###### Dedup the Bfile ######\n\n\n"
-    plink2 \
-        --bfile "${BFILE}" \
-        --rm-dup force-first \
-        --allow-extra-chr \
-        --make-bed \
-        --out "${WORK_DIR}/${BASENAME}.dedup"
-        BFILE="${WORK_DIR}/${BASENAME}.dedup"
-fi
+### dedup: duplicated variants are skipped by a view of the bfile in ScorePRS.py, without a dedup copy
+[ "${DEDUP}" = "true" ] && DEDUP_CMD="--dedup" || DEDUP_CMD=""
 
 
 ### predict by algorithms
 # MODEL columns = ['#CHROM','POS','ID','REF','ALT','A1','P','LOG10_P','BETA', ALGO_1, ALGO_2, ...]
-read -ra COLS < ${MODEL}
-for ((i=9; i<${#COLS[@]}; i++));do
-    ALGO=${COLS[i]}
-    printf "\n\n\n###### Predict with ${ALGO} ######\n\n\n"
-    plink1.9 \
-        --bfile "${BFILE}" \
-        --score "${MODEL}" 3 6 $((i+1)) header sum \
-        --score-no-mean-imputation \
-        --allow-extra-chr \
-        --allow-no-sex \
-        --out "${WORK_DIR}/${BASENAME}.${ALGO}"
-done
+# all algorithms are scored in a single pass of the bed file
+printf "\n\n\n###### Predict with All Algorithms ######\n\n\n"
+python3 "${SRC_DIR}/ScorePRS.py" \
+    --bfile "${BFILE}" \
+    --beta "${MODEL}" \
+    --out "${WORK_DIR}/${BASENAME}" ${DEDUP_CMD}
 [[ -f ${GENEPI_PRED} ]] && mv ${GENEPI_PRED} "${WORK_DIR}/${BASENAME}.GenEpi.csv"
 
 
@@ -75,8 +60,4 @@ pred = PRSResults("${BFILE}", "${WORK_DIR}/${BASENAME}", "${METHOD}")
 df = pred()
 df.to_csv("${WORK_DIR}/prediction.csv", index=False)
 EOF
-cd ${OUTDIR} || exit
-
-
-### remove temp files
-rm ${WORK_DIR}/${BASENAME}.dedup.* || true
\ No newline at end of file
+cd ${OUTDIR} || exit
\ No newline at end of file
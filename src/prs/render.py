@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+
+import multiprocessing as mp
+
+
+# deferred figure rendering: plot functions take the plot spec (arrays, labels, and styles) and save a figure
+# figures are rendered by a process pool on the Agg backend when close() is called, or in the main process with processes=1
+# enabled=False skips rendering, for the metrics only
+class RenderQueue():
+    def __init__(self, processes=1, enabled=True):
+        self.processes = max(1, processes)
+        self.enabled = enabled
+        self.pool = None
+        self.tasks = list()
+
+
+    def submit(self, func, *args, **kwargs):
+        if not self.enabled:
+            return
+        if self.processes > 1:
+            if self.pool is None:
+                self.pool = mp.Pool(self.processes, initializer=_init_worker)
+            self.tasks.append(self.pool.apply_async(_render, (func, args, kwargs)))
+        else:
+            self.tasks.append((func, args, kwargs))
+
+
+    def close(self):
+        # wait for all figures; the first error of rendering is raised after the other figures are saved
+        if self.processes == 1 and len(self.tasks) > 0:
+            _init_worker()
+        errors = list()
+        for task in self.tasks:
+            try:
+                if self.pool is not None:
+                    task.get()
+                else:
+                    _render(*task)
+            except Exception as e:
+                errors.append(e)
+        self.tasks = list()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if len(errors) > 0:
+            print('{} figures failed'.format(len(errors)))
+            raise errors[0]
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        elif self.pool is not None:
+            self.pool.terminate()
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _render(func, args, kwargs):
+    func(*args, **kwargs)
@@ -82,7 +82,9 @@ if [ "$RUN_TEST" = "true" ]; then
     TEST_BASENAME=$(basename "$TEST")
 fi
 
+set -a # the config is exported to the steps run by pipeline.py
 source "${CONFIG}"
+set +a
 REAL_PATH=$(realpath $0)
 SRC_DIR=$(dirname ${REAL_PATH})
 mkdir -p "${OUTDIR}"
@@ -99,38 +101,17 @@ DETAIL_LOG=${DETAIL_LOG-"${LOGDIR}/prs.detail.log"}
 exec &> >(tee "${LOGFILE}")
 exec &> >(tee -a "${DETAIL_LOG}")
 
-# https://stackoverflow.com/questions/22009364/is-there-a-try-catch-command-in-bash
-function my_try(){
-  # Check if out bash is set -e or +e and save the condition
-  [[ $- = *e* ]]; SAVED_OPT_E=$?
-  # turn off set -e 
-  set +e
-}
-
-function my_catch(){
-  EXIT_CODE=$?
-  ALGO_NAME=$1
-  if [ "${EXIT_CODE}" = 0 ];then 
-    echo "PRS: ${ALGO_NAME} successfully complete"
-  else 
-    echo "PRS: ${ALGO_NAME} failed"
-    rm -rf "${OUTDIR}/${ALGO_NAME}" || true
-  fi
-  # return back to origin set e condidctionm
-  [ ${SAVED_OPT_E} = 0 ] && set -e
-}
-
 
 ### PRS models
 #echo "==========================================================="
 #printf "Building PRS Models\n"
 #echo "==========================================================="
 
+# every step is a function run by pipeline.py; independent steps run in parallel within THREAD and MEMORY
+# NODE_THREAD and NODE_MEMORY are the cores and memory given to the step
+
 # Clumping and Thresholding
-if [[ ${TOOLS} =~ "CandT" ]]; then
-my_try
-(   
-    set -e
+function train_CandT(){
     printf "\n###### Clumping and Thresholding ######\n"
     mkdir -p "$OUTDIR/CandT"
 
@@ -142,16 +123,10 @@ my_try
         -p "$SRC_DIR" \
         -d "$OUTDIR/CandT" \
         -o "$TARGET_BASENAME"
-
-) 2>&1  | tee ${LOGDIR}/CandT.log >> "${DETAIL_LOG}"
-my_catch "CandT"
-fi
+}
 
 # PRSice2
-if [[ ${TOOLS} =~ "PRSice2" ]]; then
-my_try
-(   
-    set -e
+function train_PRSice2(){
     printf "\n###### PRSice2 ######\n"
     mkdir -p "$OUTDIR/PRSice2"
 
@@ -162,16 +137,11 @@ my_try
         -m "$METHOD" \
         -d "$OUTDIR/PRSice2" \
         -o "$TARGET_BASENAME"
-) 2>&1  | tee ${LOGDIR}/PRSice2.log >> "${DETAIL_LOG}"
-my_catch "PRSice2"
-fi
+}
 
 
 # Lassosum
-if [[ ${TOOLS} =~ "Lassosum" ]]; then
-my_try
-(   
-    set -e
+function train_Lassosum(){
     printf "\n###### Lassosum ######\n"
     mkdir -p "$OUTDIR/Lassosum"
 
@@ -182,20 +152,16 @@ my_try
         -l "$POPULATION_PRS" \
         -g "$GENOME" \
         -d "$OUTDIR/Lassosum" \
-        -o "$TARGET_BASENAME"
+        -o "$TARGET_BASENAME" \
+        -n "${NODE_THREAD-$THREAD}"
 
     # remove temp files
     rm "./Rplots.pdf" || true
-) 2>&1  | tee ${LOGDIR}/Lassosum.log >> "${DETAIL_LOG}"
-my_catch "Lassosum"
-fi
+}
 
 
 # LDpred2
-if [[ ${TOOLS} =~ "LDpred2" ]]; then
-my_try
-(   
-    set -e
+function train_LDpred2(){
     printf "\n###### LDpred2 ######\n"
     mkdir -p "$OUTDIR/LDpred2"
 
@@ -213,22 +179,17 @@ my_try
         -l "$LIFTOVER_REF_DIR" \
         -b "$LDPRED_REF_DIR" \
         -g "$GENOME" \
-        -t "$MODE"
+        -t "$MODE" \
+        -n "${NODE_THREAD-$THREAD}"
 
     # remove temp files
     rm "${OUTDIR}/LDpred2/${TARGET_BASENAME}.bk" || true
     rm "${OUTDIR}/LDpred2/${TARGET_BASENAME}.rds" || true
-
-) 2>&1  | tee ${LOGDIR}/LDpred2.log >> "${DETAIL_LOG}"
-my_catch "LDpred2"
-fi
+}
 
 
 # PRScs: must be rsID
-if [[ ${TOOLS} =~ "PRScs" ]]; then
-my_try
-(   
-    set -e
+function train_PRScs(){
     printf "\n###### PRScs ######\n"
     mkdir -p "$OUTDIR/PRScs"
 
@@ -247,17 +208,14 @@ my_try
         -r "$PRSCS_REF_DIR/ldblk_1kg_$POPULATION_LOWER" \
         -p "$PRSCS_SRC" \
         -d "$OUTDIR/PRScs" \
-        -o "$TARGET_BASENAME"
-) 2>&1  | tee ${LOGDIR}/PRScs.log >> "${DETAIL_LOG}"
-my_catch "PRScs"
-fi
+        -o "$TARGET_BASENAME" \
+        -t "${NODE_THREAD-$THREAD}" \
+        -m "${NODE_MEMORY-$MEMORY}"
+}
 
 
 # GenEpi
-if [[ ${TOOLS} =~ "GenEpi" ]] && [ "$RUN_BASE" = "true" ]; then
-my_try
-(   
-    set -e
+function train_GenEpi(){
     printf "\n###### GenEpi ######\n"
     if [ "${METHOD}" == "clf" ]; then
         METHOD_CODE="c"
@@ -276,6 +234,7 @@ my_try
         -g "${GENOME}" \
         -d "${OUTDIR}/GenEpi" \
         -o "${BASE_BASENAME}" \
+        -t "${NODE_THREAD-$THREAD}" \
         -e
     
     bash "${SRC_DIR}/genepi_test.sh" \
@@ -298,19 +257,57 @@ my_try
             -d "${OUTDIR}/GenEpi" \
             -o "${TEST_BASENAME}"
     fi
-) 2>&1  | tee ${LOGDIR}/GenEpi.log >> "${DETAIL_LOG}"
-my_catch "GenEpi"
-fi
+}
+
+# train an algorithm, or restore its output directory from the cache (CACHE_DIR in config.sh) when the inputs are unchanged
+# the cache is keyed by the contents of the input data and the scripts of the algorithm, the parameters of config.sh,
+# and the basenames of the output files
+function train(){
+    ALGO=$1
+    if [ -z "${CACHE_DIR}" ]; then
+        train_${ALGO}
+        return
+    fi
 
-{
+    KEYS=(--input "${TARGET}.bed" --input "${TARGET}.bim" --input "${TARGET}.fam" --param "METHOD=${METHOD}" --param "TARGET_BASENAME=${TARGET_BASENAME}")
+    # SS may be a glob of summary statistics, as in collect_beta
+    for SS_FILE in $(ls ${SS}); do
+        KEYS+=(--input "${SS_FILE}")
+    done
+    case $ALGO in
+        CandT) KEYS+=(--input "${SRC_DIR}/clump_threshold_train.sh" --input "${SRC_DIR}/clump_threshold_best_fit.py" --input "${SRC_DIR}/plinkio.py" \
+                      --param "plink=$(plink1.9 --version 2>/dev/null | head -n 1)");;
+        PRSice2) KEYS+=(--input "${SRC_DIR}/PRSice2_train.sh" --param "prsice=$(PRSice_linux --version 2>/dev/null | head -n 1)");;
+        Lassosum) KEYS+=(--input "${SRC_DIR}/lassosum_train.R" --param "POPULATION_PRS=${POPULATION_PRS}" --param "GENOME=${GENOME}");;
+        LDpred2) KEYS+=(--input "${SRC_DIR}/ldpred2_train.R" --param "GENOME=${GENOME}" \
+                        --param "LIFTOVER_REF_DIR=${LIFTOVER_REF_DIR}" --param "LDPRED_REF_DIR=${LDPRED_REF_DIR}");;
+        PRScs) KEYS+=(--input "${SRC_DIR}/PRScs_train.sh" --input "${SRC_DIR}/PRScs_parallel.py" --input "${PRSCS_SRC}" \
+                      --param "POPULATION_PRS=${POPULATION_PRS}" --param "PRSCS_REF_DIR=${PRSCS_REF_DIR}");;
+        GenEpi) KEYS+=(--input "${BASE}.bed" --input "${BASE}.bim" --input "${BASE}.fam" --input "${TEST}.bed" --input "${TEST}.bim" --input "${TEST}.fam" \
+                       --input "${SRC_DIR}/genepi_train.sh" --input "${SRC_DIR}/genepi_test.sh" --input "${SRC_DIR}/GenEpi_predictor.py" \
+                       --param "RUN_TEST=${RUN_TEST}" --param "GENEPI_REF_DIR=${GENEPI_REF_DIR}" --param "GENOME=${GENOME}" \
+                       --param "BASE_BASENAME=${BASE_BASENAME}" --param "TEST_BASENAME=${TEST_BASENAME}");;
+    esac
+
+    python3 "${SRC_DIR}/cache.py" \
+        --cache_dir "${CACHE_DIR}" \
+        --size "${CACHE_SIZE-0}" \
+        --stage "${ALGO}" \
+        --dir "${OUTDIR}/${ALGO}" \
+        "${KEYS[@]}" \
+        -- bash -c "set -eo pipefail; train_${ALGO}"
+}
+
+function collect_beta(){
 # check and merge beta
 cd ${SRC_DIR} || exit
 SS_STR=$(ls ${SS})
+[ "${BETA_BUNDLE}" = "false" ] && BUNDLE_CMD="" || BUNDLE_CMD="-b"
 python3 ${SRC_DIR}/CollectBeta.py \
     -t "${TARGET}" \
     -s "${SS_STR}" \
     -o "${OUTDIR}" \
-    -a "${TOOLS}"
+    -a "${TOOLS}" ${BUNDLE_CMD}
 
 # Get freq 
 plink1.9 \
@@ -326,91 +323,73 @@ for ALGO_NAME in $(cat ${LOGDIR}/fail_algo_list);do
     [ -d "${OUTDIR}/${ALGO_NAME}" ] && rm -rf "${OUTDIR}/${ALGO_NAME}" || true
     echo "Remove ${OUTDIR}/${ALGO_NAME} since $ALGO_NAME failed"
 done
-}  >> ${DETAIL_LOG} 2>&1 || \
-        { echo "PRS: Collect beta failed"; TRHOW_AN_ERROR; }
-
-echo "PRS: Build PRS model complete"
-
-
-{
-### prediction
-echo "==========================================================="
-printf "Predicting Target and Test Sets \n"
-echo "==========================================================="
-
-printf "###### Predicting Target ######\n"
-mkdir -p ${OUTDIR}/prediction/target
-mkdir -p ${OUTDIR}/analysis/target
-
-bash ${SRC_DIR}/predictPRS.sh \
-    -i "${TARGET}" \
-    -b "${OUTDIR}/beta.tsv" \
-    -m "${METHOD}" \
-    -d "${OUTDIR}/prediction/target" \
-    -o "${TARGET_BASENAME}" \
-    -r \
-    -g "${OUTDIR}/GenEpi/${TARGET_BASENAME}.pred.csv"
-
-mv "${OUTDIR}/prediction/target/prediction.csv" "${OUTDIR}/analysis/target/prediction.csv"
-
-if [ "$RUN_BASE" = "true" ]; then
-    printf "###### Predicting Base ######\n"
-    mkdir -p ${OUTDIR}/prediction/base
-    mkdir -p ${OUTDIR}/analysis/base
-
-    bash ${SRC_DIR}/predictPRS.sh \
-        -i "${BASE}" \
-        -b "${OUTDIR}/beta.tsv" \
-        -m "${METHOD}" \
-        -d "${OUTDIR}/prediction/base" \
-        -o "${BASE_BASENAME}" \
-        -r \
-        -g "${OUTDIR}/GenEpi/${BASE_BASENAME}.pred.csv"
-
-    mv "${OUTDIR}/prediction/base/prediction.csv" "${OUTDIR}/analysis/base/prediction.csv"
-fi
-
+}
 
-if [ "$RUN_TEST" = "true" ]; then
-    printf "###### Predicting Test ######\n"
-    mkdir -p ${OUTDIR}/prediction/test
-    mkdir -p ${OUTDIR}/analysis/test
 
-    bash ${SRC_DIR}/predictPRS.sh \
-        -i "${TEST}" \
+### prediction: the weights are loaded once, and the datasets are predicted in parallel
+function predict(){
+    echo "==========================================================="
+    printf "Predicting Target and Test Sets \n"
+    echo "==========================================================="
+
+    DATASETS=("target")
+    [ "$RUN_BASE" = "true" ] && DATASETS+=("base")
+    [ "$RUN_TEST" = "true" ] && DATASETS+=("test")
+    PREDICT_CMD=()
+    for DATASET in ${DATASETS[@]}
+    do
+        case $DATASET in
+            target) BFILE="${TARGET}"; BASENAME="${TARGET_BASENAME}";;
+            base) BFILE="${BASE}"; BASENAME="${BASE_BASENAME}";;
+            test) BFILE="${TEST}"; BASENAME="${TEST_BASENAME}";;
+        esac
+        mkdir -p ${OUTDIR}/prediction/${DATASET}
+        mkdir -p ${OUTDIR}/analysis/${DATASET}
+        PREDICT_CMD+=(-i "${BFILE}" -d "${OUTDIR}/prediction/${DATASET}" -g "${OUTDIR}/GenEpi/${BASENAME}.pred.csv")
+    done
+
+    cd ${SRC_DIR} || exit
+    python3 ${SRC_DIR}/PredictDatasets.py \
+        "${PREDICT_CMD[@]}" \
         -b "${OUTDIR}/beta.tsv" \
         -m "${METHOD}" \
-        -d "${OUTDIR}/prediction/test" \
-        -o "${TEST_BASENAME}" \
         -r \
-        -g "${OUTDIR}/GenEpi/${TEST_BASENAME}.pred.csv"
-
-    mv "${OUTDIR}/prediction/test/prediction.csv" "${OUTDIR}/analysis/test/prediction.csv"
-fi
+        -t "${NODE_THREAD-1}"
+    cd ${OUTDIR} || exit
 
-printf "###### Predicting Target and Test Sets Complete ######\n"
+    for DATASET in ${DATASETS[@]}
+    do
+        mv "${OUTDIR}/prediction/${DATASET}/prediction.csv" "${OUTDIR}/analysis/${DATASET}/prediction.csv"
+    done
 
+    printf "###### Predicting Target and Test Sets Complete ######\n"
+}
 
 
 ### analysis: cohort reference, covariates, performance
-echo "==========================================================="
-printf "Analyzing PRS Results \n"
-echo "==========================================================="
-
-printf "###### Analyzing Target ######\n"
-[ -f "${TARGET_COV}" ] && TARGET_COV_CMD="--cov ${TARGET_COV}" || TARGET_COV_CMD=""
-python3 ${SRC_DIR}/analysis.py \
-    --pred_file "${OUTDIR}/analysis/target/prediction.csv" \
-    --method "${METHOD}" \
-    --mode "target" \
-    --out_dir "${OUTDIR}/analysis/target" ${TARGET_COV_CMD} \
-    --run_performance
-
-mv "${OUTDIR}/analysis/target/rank_ref.csv" "${OUTDIR}/rank_ref.csv"
-mv "${OUTDIR}/analysis/target/hist_ref.csv" "${OUTDIR}/hist_ref.csv"
+[ "${EXACT_RANK}" = "true" ] && EXACT_RANK_CMD="--exact_rank" || EXACT_RANK_CMD=""
+[ -f "${REF_STATE}" ] && REF_STATE_CMD="--ref_state ${REF_STATE}" || REF_STATE_CMD=""
 
+function analyze_target(){
+    printf "###### Analyzing Target ######\n"
+    [ -f "${TARGET_COV}" ] && TARGET_COV_CMD="--cov ${TARGET_COV}" || TARGET_COV_CMD=""
+    python3 ${SRC_DIR}/analysis.py \
+        --pred_file "${OUTDIR}/analysis/target/prediction.csv" \
+        --method "${METHOD}" \
+        --mode "target" \
+        --out_dir "${OUTDIR}/analysis/target" ${TARGET_COV_CMD} ${EXACT_RANK_CMD} ${REF_STATE_CMD} \
+        --run_performance \
+        --thread "${NODE_THREAD-1}" \
+        --roc_points "${ROC_POINTS-0}" \
+        --bootstrap "${BOOTSTRAP-0}" \
+        --chunk_size "${CHUNK_SIZE-0}"
+
+    mv "${OUTDIR}/analysis/target/rank_ref.csv" "${OUTDIR}/rank_ref.csv"
+    mv "${OUTDIR}/analysis/target/hist_ref.csv" "${OUTDIR}/hist_ref.csv"
+    [ ! -f "${OUTDIR}/analysis/target/rank_ref.npz" ] || mv "${OUTDIR}/analysis/target/rank_ref.npz" "${OUTDIR}/rank_ref.npz"
+}
 
-if [ "$RUN_TEST" = "true" ]; then
+function analyze_test(){
     printf "###### Analyzing Test ######\n"
     [ -f "${TEST_COV}" ] && TEST_COV_CMD="--cov ${TEST_COV}" || TEST_COV_CMD=""
     python3 ${SRC_DIR}/analysis.py \
@@ -419,12 +398,15 @@ if [ "$RUN_TEST" = "true" ]; then
         --mode "test" \
         --out_dir "${OUTDIR}/analysis/test" \
         --rank_ref_file "${OUTDIR}/rank_ref.csv" \
-        --cov_ref_dir "${OUTDIR}/analysis/target/cov" ${TEST_COV_CMD} \
-        --run_performance
-fi
-
+        --cov_ref_dir "${OUTDIR}/analysis/target/cov" ${TEST_COV_CMD} ${EXACT_RANK_CMD} \
+        --run_performance \
+        --thread "${NODE_THREAD-1}" \
+        --roc_points "${ROC_POINTS-0}" \
+        --bootstrap "${BOOTSTRAP-0}" \
+        --chunk_size "${CHUNK_SIZE-0}"
+}
 
-if [ "$RUN_BASE" = "true" ]; then
+function analyze_base(){
     printf "###### Analyzing Base ######\n"
     BASE_COV="${BASE}.cov"
     [ -f "${BASE_COV}" ] && BASE_COV_CMD="--cov ${BASE_COV}" || BASE_COV_CMD=""
@@ -434,18 +416,29 @@ if [ "$RUN_BASE" = "true" ]; then
         --mode "test" \
         --out_dir "${OUTDIR}/analysis/base" \
         --rank_ref_file "${OUTDIR}/rank_ref.csv" \
-        --cov_ref_dir "${OUTDIR}/analysis/target/cov" ${BASE_COV_CMD} \
-        --run_performance
-fi
-
-
-
-#printf "###### Analyzing PRS Performance Complete ######\n"
-}  >> ${DETAIL_LOG} 2>&1 || \
-        { echo "PRS: Prediction and evaluation failed"; TRHOW_AN_ERROR; }
-
-
+        --cov_ref_dir "${OUTDIR}/analysis/target/cov" ${BASE_COV_CMD} ${EXACT_RANK_CMD} \
+        --run_performance \
+        --thread "${NODE_THREAD-1}" \
+        --roc_points "${ROC_POINTS-0}" \
+        --bootstrap "${BOOTSTRAP-0}" \
+        --chunk_size "${CHUNK_SIZE-0}"
+}
 
 
+### run the DAG: algorithms -> CollectBeta -> prediction -> analysis
+export -f train train_CandT train_PRSice2 train_Lassosum train_LDpred2 train_PRScs train_GenEpi collect_beta
+export -f predict analyze_target analyze_test analyze_base
+export BASE TARGET TEST TARGET_COV TEST_COV SS METHOD OUTDIR TOOLS RUN_BASE RUN_TEST
+export BASE_BASENAME TARGET_BASENAME TEST_BASENAME SRC_DIR LOGDIR DETAIL_LOG EXACT_RANK_CMD REF_STATE_CMD
+
+python3 "${SRC_DIR}/pipeline.py" \
+    --tools "${TOOLS}" \
+    --out_dir "${OUTDIR}" \
+    --log_dir "${LOGDIR}" \
+    --detail_log "${DETAIL_LOG}" \
+    --run_base "${RUN_BASE}" \
+    --run_test "${RUN_TEST}" \
+    --thread "${THREAD-1}" \
+    --memory "${MEMORY-0}" || TRHOW_AN_ERROR
 
 echo "PRS: Prediction and evaluation complete"
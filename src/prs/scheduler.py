@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+
+import os, sys, time, subprocess
+
+
+# environment variables of the BLAS / OpenMP thread pools
+BLAS_THREAD_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+# return code of the jobs skipped because a dependency failed
+SKIPPED = -1
+
+
+class Job():
+    def __init__(self, name, cmd, threads=1, memory=0, priority=0, log_file=None,
+                 deps=(), after=(), critical=False, env=None, callback=None):
+        self.name = name
+        self.cmd = cmd
+        self.threads = threads
+        self.memory = memory # MB
+        self.priority = priority # larger first
+        self.log_file = log_file
+        self.deps = list(deps) # jobs that must succeed before this job
+        self.after = list(after) # jobs that must finish (succeed or fail) before this job
+        self.critical = critical # stop launching new jobs when this job fails
+        self.env = dict() if env is None else env
+        self.callback = callback # called with the job when it finishes or is skipped
+        self.returncode = None
+
+
+# run shell jobs concurrently within the budgets of cores and memory (MB)
+# jobs form a DAG through deps / after; ready jobs are launched by priority, and a job larger than the budget runs alone
+class JobScheduler():
+    def __init__(self, thread=1, memory=0, poll=0.5):
+        self.thread = max(1, int(thread))
+        self.memory = int(memory) # 0 = no memory limit
+        self.poll = poll
+
+
+    def __call__(self, jobs):
+        names = set(job.name for job in jobs)
+        for job in jobs:
+            unknown = [i for i in job.deps + job.after if i not in names]
+            if len(unknown) > 0:
+                raise ValueError('{}: unknown dependencies {}'.format(job.name, ', '.join(unknown)))
+
+        finished = dict()
+        pending = sorted(jobs, key=lambda job: job.priority, reverse=True)
+        running = list()
+        stop = False
+        while len(pending) > 0 or len(running) > 0:
+            # skip the jobs whose dependencies failed, and all pending jobs after a critical failure
+            for job in list(pending):
+                if stop or any(finished.get(i, 0) != 0 for i in job.deps if i in finished):
+                    pending.remove(job)
+                    self._finish(job, SKIPPED, finished)
+
+            # launch the ready jobs fitting in the free cores and memory
+            for job in list(pending):
+                if any(i not in finished for i in job.deps + job.after):
+                    continue
+                if len(running) > 0 and not self._fit(job, running):
+                    continue
+                running.append((job, self._launch(job)))
+                pending.remove(job)
+
+            if len(running) == 0:
+                if len(pending) > 0: # unreachable jobs, e.g. circular dependencies
+                    raise ValueError('cannot schedule {}'.format(', '.join(job.name for job in pending)))
+                break
+
+            # wait for any job
+            time.sleep(self.poll)
+            for job, (proc, log) in list(running):
+                if proc.poll() is not None:
+                    if log is not None:
+                        log.close()
+                    running.remove((job, (proc, log)))
+                    self._finish(job, proc.returncode, finished)
+                    if job.returncode != 0 and job.critical:
+                        stop = True
+
+        return [job for job in jobs if job.returncode != 0]
+
+
+    def _finish(self, job, returncode, finished):
+        job.returncode = returncode
+        finished[job.name] = returncode
+        if job.callback is not None:
+            job.callback(job)
+        elif returncode == SKIPPED:
+            print('{}: skipped'.format(job.name))
+        else:
+            print('{}: {} (exit {})'.format(job.name, 'done' if returncode == 0 else 'failed', returncode))
+        sys.stdout.flush()
+
+
+    def _fit(self, job, running):
+        used_thread = sum(i.threads for i, _ in running)
+        used_memory = sum(i.memory for i, _ in running)
+        if used_thread + job.threads > self.thread:
+            return False
+        if self.memory > 0 and used_memory + job.memory > self.memory:
+            return False
+        return True
+
+
+    def _launch(self, job):
+        # pin the BLAS threads so that concurrent jobs do not oversubscribe the cores
+        env = dict(os.environ)
+        for var in BLAS_THREAD_VARS:
+            env[var] = str(job.threads)
+        env.update(job.env)
+        log = open(job.log_file, 'w') if job.log_file else None
+        if job.callback is None:
+            print('{}: start ({} threads, {} MB)'.format(job.name, job.threads, job.memory))
+            sys.stdout.flush()
+        proc = subprocess.Popen(job.cmd, shell=isinstance(job.cmd, str), env=env,
+                                stdout=log, stderr=subprocess.STDOUT if log is not None else None)
+        return proc, log
@@ -0,0 +1,367 @@
+#!/usr/bin/python3
+
+import os, sys, json, shutil
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+from utils import Analysis, threshold_curve, draw_bar, draw_or_percentile
+
+
+# prediction.csv in chunks of fixed dtypes: categorical IDs, float64 phenotype, and float32 scores
+class PredictionStream():
+    def __init__(self, pred_file, chunk_size=1000000):
+        self.pred_file = pred_file
+        self.chunk_size = chunk_size
+        self.columns = pd.read_csv(pred_file, nrows=0).columns.tolist() # ['FID', 'IID', 'phenotype', ALGO_1, ALGO_2, ...]
+        self.tools = self.columns[3:]
+        self.dtype = {self.columns[0]: 'category', self.columns[1]: 'category', self.columns[2]: np.float64}
+        self.dtype.update({tool: np.float32 for tool in self.tools})
+
+
+    def __iter__(self):
+        return self.chunks()
+
+
+    def chunks(self, ids=True):
+        # ids=False skips parsing FID and IID, for the passes of the scores only
+        usecols = self.columns if ids else self.columns[2:]
+        with pd.read_csv(self.pred_file, chunksize=self.chunk_size, dtype=self.dtype, usecols=usecols) as reader:
+            for chunk in reader:
+                if chunk.shape[0] > 0:
+                    yield chunk
+
+
+
+# accumulators of a PredictionStream with bounded memory, in three passes over the chunks
+#   scan: the number of samples, the range of each score, and the means of the samples with phenotype
+#   sketch: fixed bins over the range of each score, with the number, minimum, and maximum of the scores of each bin;
+#           cases and controls (clf) or the phenotype and the moments of Pearson (reg) of the samples with phenotype
+#   rank: ranks of the cohort reference written to rank.csv; percentile groups (clf) or the moments of Spearman (reg)
+# the scores of a bin are taken as evenly spaced from its minimum to its maximum, which is exact for the bins of one or
+# two samples (e.g. the tails), and within 1/bins of the range otherwise
+class PredictionSketch():
+    def __init__(self, stream, method, bins=100000, percentile_num=10):
+        self.stream = stream
+        self.tools = stream.tools
+        self.method = method
+        self.bins = max(100, bins // 100 * 100) # aggregated into the 100 bins of hist_ref
+        self.percentile_num = percentile_num
+        print('Scanning predictions ...')
+        self._scan()
+        print('Sketching {} samples of {} algorithms in {} bins ...'.format(self.n, len(self.tools), self.bins))
+        self._sketch()
+
+
+    def _scan(self):
+        self.n, self.n_pheno = 0, 0
+        self.lo = np.full(len(self.tools), np.inf)
+        self.hi = np.full(len(self.tools), -np.inf)
+        sum_x, sum_y = np.zeros(len(self.tools)), 0.0
+        self.n_case, self.n_control = 0, 0
+        y_lo, y_hi = np.inf, -np.inf
+        for chunk in self.stream.chunks(ids=False):
+            scores, y, mask = self._arrays(chunk)
+            self.n += scores.shape[0]
+            self.n_pheno += int(mask.sum())
+            # fmin and fmax skip NaN
+            self.lo = np.fmin(self.lo, np.fmin.reduce(scores, axis=0))
+            self.hi = np.fmax(self.hi, np.fmax.reduce(scores, axis=0))
+            sum_x += scores[mask].sum(axis=0)
+            sum_y += y[mask].sum()
+            self.n_case += int((y == 1).sum())
+            self.n_control += int((y == 0).sum())
+            if mask.any():
+                y_lo, y_hi = min(y_lo, y[mask].min()), max(y_hi, y[mask].max())
+        self.mean_x = sum_x / max(self.n_pheno, 1)
+        self.mean_y = sum_y / max(self.n_pheno, 1)
+        self.y_lo, self.y_hi = y_lo, y_hi
+
+
+    def _sketch(self):
+        shape = (len(self.tools), self.bins)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.bin_min = np.full(shape, np.inf)
+        self.bin_max = np.full(shape, -np.inf)
+        if self.method == 'clf':
+            self.case = np.zeros(shape, dtype=np.int64)
+            self.control = np.zeros(shape, dtype=np.int64)
+        else:
+            # bins of the samples with phenotype, the phenotype, and the centered moments of Pearson
+            self.pheno_count = np.zeros(shape, dtype=np.int64)
+            self.y_count = np.zeros(self.bins, dtype=np.int64)
+            self.y_min = np.full(self.bins, np.inf)
+            self.y_max = np.full(self.bins, -np.inf)
+            self.sxy, self.sxx, self.syy = np.zeros(len(self.tools)), np.zeros(len(self.tools)), 0.0
+
+        for chunk in self.stream.chunks(ids=False):
+            scores, y, mask = self._arrays(chunk)
+            for k in range(len(self.tools)):
+                valid = ~np.isnan(scores[:, k])
+                x = scores[valid, k]
+                b = self._bin(x, self.lo[k], self.hi[k])
+                self.count[k] += np.bincount(b, minlength=self.bins)
+                np.minimum.at(self.bin_min[k], b, x)
+                np.maximum.at(self.bin_max[k], b, x)
+                y_valid = y[valid]
+                if self.method == 'clf':
+                    self.case[k] += np.bincount(b[y_valid == 1], minlength=self.bins)
+                    self.control[k] += np.bincount(b[(y_valid != 1) & ~np.isnan(y_valid)], minlength=self.bins)
+                else:
+                    self.pheno_count[k] += np.bincount(b[~np.isnan(y_valid)], minlength=self.bins)
+                    xc, yc = scores[mask, k] - self.mean_x[k], y[mask] - self.mean_y
+                    self.sxy[k] += np.sum(xc * yc)
+                    self.sxx[k] += np.sum(xc * xc)
+            if self.method == 'reg':
+                b = self._bin(y[mask], self.y_lo, self.y_hi)
+                self.y_count += np.bincount(b, minlength=self.bins)
+                np.minimum.at(self.y_min, b, y[mask])
+                np.maximum.at(self.y_max, b, y[mask])
+                self.syy += np.sum((y[mask] - self.mean_y) ** 2)
+
+
+    def summary(self):
+        # rank_ref and hist_ref of CohortRef: percentiles of the bins, and the bins aggregated in [rank 0, rank 100]
+        rank_list = list(range(100)) + [99.5, 99.7, 99.9, 100]
+        rank_df = pd.DataFrame(index=rank_list)
+        hist_df = pd.DataFrame()
+        for k, tool in enumerate(self.tools):
+            rank_df[tool] = _quantile(self.count[k], self.bin_min[k], self.bin_max[k], np.array(rank_list, dtype=np.float64))
+            n = self.count[k].sum()
+            if self.hi[k] > self.lo[k]:
+                hist_df[tool] = self.count[k].reshape(100, -1).sum(axis=1) / (n * (self.hi[k] - self.lo[k]) / 100)
+            else:
+                hist_df[tool] = np.histogram(self.lo[k:k+1], bins=100, range=(self.lo[k], self.hi[k]), density=True)[0]
+        return rank_df, hist_df
+
+
+    def rank(self, cohort_ref, rank_file, percentile_dir=None):
+        # ranks of the samples by the cohort reference, written to rank_file chunk by chunk
+        # percentile_dir (reg): the samples of each (tool, percentile group) are written to [percentile_dir]/[tool].[group].csv
+        # for write_percentile()
+        print('Mapping ranking score to {} ...'.format(rank_file))
+        n = self.percentile_num
+        seen = np.zeros((len(self.tools), self.bins), dtype=np.int64) # samples of each bin in the previous chunks
+        if self.method == 'clf':
+            self.pct_pos = np.zeros(len(self.tools) * n, dtype=np.int64)
+            self.pct_neg = np.zeros(len(self.tools) * n, dtype=np.int64)
+            pheno_count = self.case + self.control
+        else:
+            self.srr = np.zeros((len(self.tools), 3)) # centered sums of rank_x * rank_y, rank_x ** 2, rank_y ** 2
+            pheno_count = self.pheno_count
+            self.percentile_dir = percentile_dir
+            if percentile_dir is not None:
+                shutil.rmtree(percentile_dir, ignore_errors=True)
+                os.makedirs(percentile_dir)
+
+        header = True
+        for chunk in self.stream:
+            cohort_ref.map(chunk).to_csv(rank_file, mode='w' if header else 'a', header=header, index=False)
+            header = False
+
+            scores, y, mask = self._arrays(chunk)
+            scores, y = scores[mask], y[mask]
+            if self.method == 'reg':
+                b = self._bin(y, self.y_lo, self.y_hi)
+                y_rank = _position(self.y_count, self.y_min, self.y_max, b, y) + 1 - (self.n_pheno + 1) / 2
+            for k in range(len(self.tools)):
+                valid = ~np.isnan(scores[:, k])
+                x = scores[valid, k]
+                b = self._bin(x, self.lo[k], self.hi[k])
+                position = _position(pheno_count[k], self.bin_min[k], self.bin_max[k], b, x)
+                if self.method == 'reg':
+                    x_rank = position + 1 - (pheno_count[k].sum() + 1) / 2
+                    self.srr[k] += [np.sum(x_rank * y_rank[valid]), np.sum(x_rank ** 2), np.sum(y_rank[valid] ** 2)]
+                    if self.percentile_dir is None:
+                        continue
+
+                # the samples of a bin take the successive positions of the bin in the order of the stream, so that the
+                # groups have the sizes of Analysis._percentile with ties and close scores; only a bin across two groups
+                # differs from a sort
+                start = (np.cumsum(pheno_count[k]) - pheno_count[k])[b]
+                position = start + seen[k][b] + _occurrence(b)
+                seen[k] += np.bincount(b, minlength=self.bins)
+                # groups of the descending order as Analysis._percentile; samples without score are the last
+                descending = np.full(y.shape[0], self.n_pheno - 1, dtype=np.int64)
+                descending[valid] = np.floor(pheno_count[k].sum() - 1 - position).astype(np.int64)
+                group = self._group(descending)
+                if self.method == 'clf':
+                    group = k * n + n - 1 - group
+                    self.pct_pos += np.bincount(group[y == 1], minlength=len(self.pct_pos))
+                    self.pct_neg += np.bincount(group[y == 0], minlength=len(self.pct_neg))
+                else:
+                    for g in np.unique(group):
+                        in_group = group == g
+                        pd.DataFrame({'phenotype': y[in_group], 'PRS': scores[in_group, k]}).to_csv(
+                            '{}/{}.{}.csv'.format(self.percentile_dir, k, g), mode='a', header=False, index=False)
+
+
+    def write_percentile(self, percentile_file):
+        # percentile.csv of reg as Analysis._percentile: the samples of each tool in the descending order of the score
+        # (NaN last) with their percentiles, from the groups of rank(); only one group is sorted in memory at a time
+        n = self.percentile_num
+        idx = np.array([(i+1)*(100/n) for i in range(n)])
+        header = True
+        for k, tool in enumerate(self.tools):
+            for g in range(n):
+                group_file = '{}/{}.{}.csv'.format(self.percentile_dir, k, g)
+                if not os.path.isfile(group_file):
+                    continue
+                df = pd.read_csv(group_file, header=None, names=['phenotype', 'PRS'])
+                df = df.sort_values('PRS', ascending=False, kind='stable', na_position='last')
+                df['tool'] = tool
+                df['percentile'] = idx[n - 1 - g]
+                df.to_csv(percentile_file, mode='w' if header else 'a', header=header, index=False)
+                header = False
+        shutil.rmtree(self.percentile_dir, ignore_errors=True)
+
+
+    def curves(self):
+        # ROC and PR curves at the bin edges: the cases and controls of the bins with samples from the highest bin
+        curves = list()
+        for k in range(len(self.tools)):
+            nonzero = (self.case[k] + self.control[k]) > 0
+            tps = np.cumsum(self.case[k][nonzero][::-1], dtype=np.float64)
+            fps = np.cumsum(self.control[k][nonzero][::-1], dtype=np.float64)
+            curves.append(threshold_curve(tps, fps))
+        return curves
+
+
+    def percentile_counts(self):
+        # the arguments of Analysis._or_table after rank()
+        n = self.percentile_num
+        interval = self.n_pheno // n
+        idx = np.array([(i+1)*(100/n) for i in range(n)])
+        counts = np.full(n, interval)
+        counts[-1] += self.n_pheno - interval*n
+        base_pos, base_neg = self.n_case // n, self.n_control // n
+        return idx, counts, self.pct_pos, self.pct_neg, base_pos, base_neg
+
+
+    def correlations(self):
+        # Pearson of the moments and Spearman of the ranks after rank(), with the p-values of scipy.stats
+        n = self.n_pheno
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pearson = np.clip(self.sxy / np.sqrt(self.sxx * self.syy), -1, 1)
+            spearman = np.clip(self.srr[:, 0] / np.sqrt(self.srr[:, 1] * self.srr[:, 2]), -1, 1)
+            dist = stats.beta(n/2 - 1, n/2 - 1, loc=-1, scale=2)
+            pearson_p = np.clip(2 * dist.sf(np.abs(pearson)), 0, 1)
+            t = spearman * np.sqrt(np.clip((n - 2) / ((spearman + 1) * (1 - spearman)), 0, None))
+            spearman_p = 2 * stats.t.sf(np.abs(t), n - 2)
+        return ({tool: [float(pearson[k]), float(pearson_p[k])] for k, tool in enumerate(self.tools)},
+                {tool: [float(spearman[k]), float(spearman_p[k])] for k, tool in enumerate(self.tools)})
+
+
+    def _arrays(self, chunk):
+        scores = chunk[self.tools].to_numpy(dtype=np.float64)
+        y = chunk[self.stream.columns[2]].to_numpy(dtype=np.float64)
+        return scores, y, ~np.isnan(y)
+
+
+    def _bin(self, values, lo, hi):
+        # fixed bins of [lo, hi], with hi in the last bin
+        scale = self.bins / (hi - lo) if hi > lo else 0.0
+        return np.clip(((values - lo) * scale).astype(np.int64), 0, self.bins - 1)
+
+
+    def _group(self, descending):
+        # percentile groups of Analysis._percentile from the top: the first (interval + remainder) samples, then intervals
+        interval = self.n_pheno // self.percentile_num
+        top = self.n_pheno - interval * (self.percentile_num - 1)
+        if interval == 0:
+            return np.zeros(descending.shape[0], dtype=np.int64)
+        return np.where(descending < top, 0, 1 + (descending - top) // interval).clip(0, self.percentile_num - 1)
+
+
+def _values_at(count, bin_min, bin_max, j):
+    # the j-th (0-based) smallest values of the bins, evenly spaced from the minimum to the maximum of a bin
+    cum = np.cumsum(count)
+    b = np.searchsorted(cum, j, side='right')
+    c = count[b]
+    step = np.where(c > 1, (bin_max[b] - bin_min[b]) / np.maximum(c - 1, 1), 0)
+    return bin_min[b] + (j - (cum[b] - c)) * step
+
+
+def _quantile(count, bin_min, bin_max, q):
+    # np.percentile (linear) of the bins
+    position = q / 100 * (count.sum() - 1)
+    j = np.floor(position).astype(np.int64)
+    v0 = _values_at(count, bin_min, bin_max, j)
+    v1 = _values_at(count, bin_min, bin_max, np.minimum(j + 1, count.sum() - 1))
+    return v0 + (position - j) * (v1 - v0)
+
+
+def _occurrence(values):
+    # the number of previous elements of the same value of each element
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    first = np.r_[True, sorted_values[1:] != sorted_values[:-1]] if len(values) > 0 else np.zeros(0, dtype=bool)
+    run_start = np.maximum.accumulate(np.where(first, np.arange(len(values)), 0))
+    occurrence = np.empty(len(values), dtype=np.int64)
+    occurrence[order] = np.arange(len(values)) - run_start
+    return occurrence
+
+
+def _position(count, bin_min, bin_max, b, values):
+    # 0-based positions of the values in the sorted samples of the bins; ties of a bin are at the middle of the bin
+    c = count[b]
+    width = bin_max[b] - bin_min[b]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = np.where(width > 0, (values - bin_min[b]) / np.where(width > 0, width, 1) * (c - 1), (c - 1) / 2)
+    return (np.cumsum(count) - count)[b] + np.clip(k, 0, np.maximum(c - 1, 0))
+
+
+
+# Analysis of a PredictionSketch after rank(): performance.json, roc.json, and percentile.csv from the bins, the same as
+# Analysis up to the bins; the figures of all samples (distribution, and percentile of reg) are skipped
+class StreamAnalysis(Analysis):
+    def __init__(self, sketch, method, outdir, render_queue=None):
+        print('\n\n###### Preparing for Analysis ######\n\n')
+        self.sketch = sketch
+        self.tools = sketch.tools
+        print("Drop {} samples with no phenotype".format(sketch.n - sketch.n_pheno))
+
+        # checking method
+        if method not in ['clf', 'reg']:
+            print('Method must be clf or reg')
+            sys.exit()
+        self.method = method
+
+        # checking outdir
+        self.outdir = outdir
+        if not os.path.isdir(self.outdir):
+            os.mkdir(self.outdir)
+
+        # figures
+        self.render_queue = render_queue
+
+
+    def AnaCLF(self):
+        ##### ROC, PRC
+        print('Calculating metrics auROC and auPRC ...')
+        self.results = dict()
+        curves = self.sketch.curves()
+        self.results['ROC'] = self._roc_plot(curves, self.tools, title='ROC', figfile='{}/ROC.png'.format(self.outdir))
+        self.results['PRC'] = self._prc_plot(curves, self.tools, title='PRC', figfile='{}/PRC.png'.format(self.outdir))
+        json.dump(self.results, open('{}/performance.json'.format(self.outdir), 'w'))
+
+        ##### percentile
+        print('Calculating percentile distribution ...')
+        self.percentile_df = self._or_table(self.tools, *self.sketch.percentile_counts())
+        self.percentile_df.to_csv('{}/percentile.csv'.format(self.outdir), index=False)
+        self.queue.submit(draw_or_percentile, self.percentile_df, self.style, title='percentile of OR', figfile='{}/ORpercentile.png'.format(self.outdir))
+
+
+    def AnaREG(self):
+        ##### Pearson and Spearman
+        print('Calculating metrics Pearson and Spearman correlation ...')
+        self.results = dict()
+        self.results['Pearson'], self.results['Spearman'] = self.sketch.correlations()
+        json.dump(self.results, open('{}/performance.json'.format(self.outdir), 'w'))
+
+        # plot
+        self.queue.submit(draw_bar, self.results, 'Pearson', self.style, figfile='{}/pearson.png'.format(self.outdir))
+        self.queue.submit(draw_bar, self.results, 'Spearman', self.style, figfile='{}/spearman.png'.format(self.outdir))
+
+        ##### percentile: the figure of all samples is skipped
+        print('Calculating percentile distribution ...')
+        self.sketch.write_percentile('{}/percentile.csv'.format(self.outdir))
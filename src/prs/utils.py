@@ -1,6 +1,7 @@
 #!/usr/bin/python3
 
 import sys, os, random, json, pyreadr, joblib, copy
+import multiprocessing as mp
 import numpy as np
 import pandas as pd
 import sklearn.metrics as metrics
@@ -13,63 +14,72 @@ import matplotlib.patches as mpatches
 import seaborn as sns
 from collections import OrderedDict
 from glob import glob
+from render import RenderQueue
+from plinkio import read_bim, read_fam, read_profile
 
 
-# build the beta dataframe from all PRS algorithms except GenEpi (self.ss_df)
+# build the beta (weight) matrix from all PRS algorithms except GenEpi
+# variants are indexed by their rows in the bim; betas of the dense algorithms are aligned into a float32 matrix (self.beta),
+# and those of C+T and PRSice2, mostly zero after clumping, are kept as sparse (index, value) vectors (self.sparse_beta)
 class Weights():
+    meta_cols = ['CHR', 'POS', 'ID', 'REF', 'ALT', 'A1', 'P', 'LOG10_P', 'BETA']
+    all_tools = ['CandT', 'PRSice2', 'Lassosum', 'LDpred2', 'PRScs']
+    flip_tools = ['Lassosum', 'LDpred2', 'PRScs'] # betas of these tools are relative to ALT
+    sparse_tools = ['CandT', 'PRSice2']
+
     def __init__(self, bfile, ss_file, prs_dir):
         self.basename = bfile.split('/')[-1]
         self.prs_dir = prs_dir
 
         # bim_df
-        self.bim_df = pd.read_csv('{}.bim'.format(bfile), sep='\s+', names=['CHR', 'ID', 'CM', 'POS', 'ALT', 'REF'])
+        self.bim_df = read_bim('{}.bim'.format(bfile)).rename(columns={'A1': 'ALT', 'A2': 'REF'})
         self.bim_df = self.bim_df[['CHR', 'POS', 'ID', 'REF', 'ALT']]
-
-        # ss_df
-        self.ss_df = pd.read_csv(ss_file, sep='\s+')
-        self.ss_df = self.ss_df[['#CHROM','POS','ID','REF','ALT','A1','P','LOG10_P', 'BETA']]
-        self.ss_df = self.bim_df.merge(self.ss_df[['ID', 'A1', 'P', 'LOG10_P', 'BETA']], on='ID', how='left')
-
-        # fill NA
-        self.ss_df.fillna(0, inplace=True)
+        self.variant_ids = self.bim_df['ID'].to_numpy()
+        self.n_variants = self.bim_df.shape[0]
+
+        # summary statistics aligned to the bim; variants not in the summary statistics are 0
+        ss_df = pd.read_csv(ss_file, sep='\s+', usecols=['ID', 'A1', 'P', 'LOG10_P', 'BETA'], dtype={'ID': str, 'A1': str})
+        idx = self._lookup(ss_df['ID'])
+        found = idx >= 0
+        self.A1 = np.full(self.n_variants, '0', dtype=object)
+        self.A1[found] = ss_df['A1'].to_numpy()[idx[found]]
+        self.A1[pd.isna(self.A1)] = '0'
+        self.ss = dict()
+        for col in ['P', 'LOG10_P', 'BETA']:
+            values = np.zeros(self.n_variants, dtype=np.float64)
+            values[found] = ss_df[col].to_numpy(dtype=np.float64)[idx[found]]
+            values[np.isnan(values)] = 0
+            self.ss[col] = values
+
+        # betas, filled by __call__
+        self.beta = np.zeros((self.n_variants, len(self.all_tools)), dtype=np.float32)
+        self.dense_tools = list() # columns of self.beta
+        self.sparse_beta = dict() # tool: (index, value)
+        self.tools = list()
 
 
     def __call__(self):
         print('\n\n###### Building Beta (Weight) Dataframe ######\n\n')
         ### C+T
         # threshold
-        try:
-            with open('{}/CandT/best_pvalue_range'.format(self.prs_dir), 'r') as f:
-                threshold = f.readlines()[0].split()[0]
-        except:
-            threshold = 0
-            pass
+        threshold = self._get_threshold('{}/CandT/best_pvalue_range'.format(self.prs_dir))
 
         # beta
         snp_file = '{}/CandT/{}.valid.snp'.format(self.prs_dir, self.basename)
         if os.path.isfile(snp_file):
             print('Loading C+T ...')
-            with open(snp_file, 'r') as f:
-                snp_list = ''.join(f.readlines()).split()
-            self._get_ct_beta('CandT', snp_list, float(threshold))
+            self._get_ct_beta('CandT', self._read_ids(snp_file), threshold)
 
 
         ### PRSice2
         # threshold
-        try:
-            with open('{}/PRSice2/best_pvalue_range'.format(self.prs_dir), 'r') as f:
-                threshold = f.readlines()[0].split()[0]
-        except:
-            threshold = 0
-            pass
+        threshold = self._get_threshold('{}/PRSice2/best_pvalue_range'.format(self.prs_dir))
 
         # beta
         snp_file = '{}/PRSice2/{}.valid.snp'.format(self.prs_dir, self.basename)
         if os.path.isfile(snp_file):
             print('Loading PRSice2 ...')
-            with open(snp_file, 'r') as f:
-                snp_list = ''.join(f.readlines()).split()
-            self._get_ct_beta('PRSice2', snp_list, float(threshold))
+            self._get_ct_beta('PRSice2', self._read_ids(snp_file), threshold)
         
 
         ### Lassosum
@@ -77,10 +87,8 @@ class Weights():
         if os.path.isfile(beta_file):
             print('Loading Lassosum ...')
             with open(beta_file, 'r') as f:
-                beta_list = ''.join(f.readlines()).split()
-                beta_list = list(map(float, beta_list))
-            self.ss_df['Lassosum'] = beta_list
-            self.ss_df.loc[self.ss_df['A1']!=self.ss_df['ALT'], 'Lassosum'] *= -1
+                beta = np.array(f.read().split(), dtype=np.float32)
+            self._column('Lassosum')[:] = beta
         
 
         ### LDpred2
@@ -88,7 +96,6 @@ class Weights():
         if os.path.isfile('{}.beta.rds'.format(beta_prefix)):
             print('Loading LDpred2 ...')
             self._get_ldpred2_beta(beta_prefix)
-            self.ss_df.loc[self.ss_df['A1']!=self.ss_df['ALT'], 'LDpred2'] *= -1
         
 
         ### PRScs
@@ -96,34 +103,108 @@ class Weights():
         if os.path.isfile(beta_file):
             print('Loading PRScs ...')
             self._get_prscs_beta(beta_file)
-            self.ss_df.loc[self.ss_df['A1']!=self.ss_df['ALT'], 'PRScs'] *= -1
 
 
+        ### allele orientation: flip betas relative to ALT when A1 != ALT, in one pass
+        cols = [self.dense_tools.index(tool) for tool in self.flip_tools if tool in self.dense_tools]
+        if len(cols) > 0:
+            flip = self.A1 != self.bim_df['ALT'].to_numpy()
+            self.beta[np.ix_(flip, cols)] *= -1
+
         ### fill NA
-        self.ss_df.fillna(0, inplace=True)
+        self.beta = self.beta[:, :len(self.dense_tools)]
+        self.beta[np.isnan(self.beta)] = 0
 
         print('\n\n###### Complete ######\n\n')
-        
+
+
+    @property
+    def ss_df(self):
+        # the beta dataframe: ['CHR', 'POS', 'ID', 'REF', 'ALT', 'A1', 'P', 'LOG10_P', 'BETA', ALGO_1, ALGO_2, ...]
+        df = self.bim_df.copy()
+        df['A1'] = self.A1
+        for col in ['P', 'LOG10_P', 'BETA']:
+            df[col] = self.ss[col]
+        for tool in self.tools:
+            df[tool] = self.values(tool)
+        return df
+
+
+    def values(self, tool):
+        # dense betas of a tool
+        if tool in self.sparse_beta:
+            idx, value = self.sparse_beta[tool]
+            beta = np.zeros(self.n_variants, dtype=np.float32)
+            beta[idx] = value
+            return beta
+        return self.beta[:, self.dense_tools.index(tool)]
+
+
+    def nonzero(self, tool):
+        # sparse (index, value) betas of a tool
+        if tool in self.sparse_beta:
+            return self.sparse_beta[tool]
+        beta = self.beta[:, self.dense_tools.index(tool)]
+        idx = np.flatnonzero(beta)
+        return idx, beta[idx]
+
+
+    def drop(self, tool):
+        self.tools.remove(tool)
+        if tool in self.sparse_beta:
+            del self.sparse_beta[tool]
+        else:
+            i = self.dense_tools.index(tool)
+            self.beta = np.delete(self.beta, i, axis=1)
+            self.dense_tools.pop(i)
+
+
+    def _lookup(self, ids):
+        # for each bim variant, its position in ids (first occurrence); -1 if absent
+        ids = pd.Index(ids)
+        if not ids.is_unique:
+            ids = ids.drop_duplicates(keep='first')
+        return ids.get_indexer(self.variant_ids)
+
+
+    def _column(self, tool):
+        self.tools.append(tool)
+        self.dense_tools.append(tool)
+        return self.beta[:, len(self.dense_tools)-1]
+
+
+    def _get_threshold(self, file):
+        try:
+            with open(file, 'r') as f:
+                return float(f.readlines()[0].split()[0])
+        except:
+            return 0
+
+
+    def _read_ids(self, file):
+        with open(file, 'r') as f:
+            return np.array(f.read().split(), dtype=object)
+
 
     def _get_ct_beta(self, col_name, snp_list, threshold=1):
-        self.ss_df[col_name] = self.ss_df['BETA']
-        self.ss_df.loc[~self.ss_df['ID'].isin(snp_list), col_name] = 0
-        self.ss_df.loc[self.ss_df['P'] > threshold, col_name] = 0
+        selected = (self._lookup(snp_list) >= 0) & (self.ss['P'] <= threshold) & (self.ss['BETA'] != 0)
+        idx = np.flatnonzero(selected)
+        self.tools.append(col_name)
+        self.sparse_beta[col_name] = (idx, self.ss['BETA'][idx].astype(np.float32))
 
     
     def _get_ldpred2_beta(self, prefix):
         df = pyreadr.read_r('{}.snp.rds'.format(prefix))[None]
-        df['beta_modify'] = pyreadr.read_r('{}.beta.rds'.format(prefix))[None]
-        df['_NUM_ID_'] = df['_NUM_ID_'] - 1
-        self.ss_df['LDpred2'] = 0
-        idx = self.ss_df.iloc[df['_NUM_ID_']].index
-        self.ss_df.loc[idx, 'LDpred2'] = df['beta_modify'].to_numpy()
+        beta = pyreadr.read_r('{}.beta.rds'.format(prefix))[None]
+        idx = df['_NUM_ID_'].to_numpy(dtype=np.int64) - 1
+        self._column('LDpred2')[idx] = np.asarray(beta, dtype=np.float32).ravel()
 
 
     def _get_prscs_beta(self, file):
-        df = pd.read_csv(file, sep='\s+', names=['CHR', 'ID', 'POS', 'A1', 'A2', 'PRScs'])
-        self.ss_df = self.ss_df.merge(df[['ID', 'PRScs']], on='ID', how='left')
-        self.ss_df['PRScs'].fillna(0, inplace=True)
+        df = pd.read_csv(file, sep='\s+', names=['CHR', 'ID', 'POS', 'A1', 'A2', 'PRScs'], dtype={'ID': str})
+        idx = self._lookup(df['ID'])
+        found = idx >= 0
+        self._column('PRScs')[found] = df['PRScs'].to_numpy(dtype=np.float32)[idx[found]]
 
 
 
@@ -133,7 +214,7 @@ class PRSResults():
         self.bfile_prefix = bfile_prefix
         self.pred_prefix = pred_prefix
         self.method = method
-        self.df = pd.read_csv('{}.fam'.format(bfile_prefix), sep='\s+', names=['FID', 'IID', 'father', 'mother', 'sex', 'phenotype'])
+        self.df = read_fam('{}.fam'.format(bfile_prefix))
         self.df = self.df[['FID', 'IID', 'phenotype']]
         if self.method == 'clf':
             self.df['phenotype'] = self.df['phenotype'].apply(lambda x: x - 1 if (x == 1) | (x == 2) else x) # control = 0, case = 1
@@ -175,8 +256,11 @@ class PRSResults():
     def _append_score(self, df, file, post_col, sep='\s+', prev_col='SCORESUM'):
         if not os.path.isfile(file):
             return df
-        pred_df = pd.read_csv(file, sep=sep)
-        pred_df = pred_df[['FID', 'IID', prev_col]]
+        # IDs are strings as the fam
+        if sep == '\s+':
+            pred_df = read_profile(file, usecols=['FID', 'IID', prev_col])
+        else:
+            pred_df = pd.read_csv(file, sep=sep, usecols=['FID', 'IID', prev_col], dtype={'FID': str, 'IID': str})
         pred_df = pred_df.rename(columns={prev_col: post_col})
         df = df.merge(pred_df, on=['FID', 'IID'], how='left')
         return df
@@ -209,72 +293,130 @@ class CovResults():
     def Train(self):
         print('\n\n###### Training Regression Models with Covariates ######\n\n')
 
-        # define functions
-        scaler = StandardScaler()
-        if self.method == 'clf':
-            reg = LogisticRegression()
-        else:
-            reg = LinearRegression()
-
         # prediction dataframe
         self.df = self.df.dropna(subset=['phenotype'], axis=0) # drop NA for building regression model
         pred_df = self.df.loc[:, ['FID', 'IID', 'phenotype']]
-        y = self.df['phenotype'].to_numpy()
+        y = self.df['phenotype'].to_numpy().astype(float)
+        tools = ['cov'] + self.tools
+
+        # numerical columns and the scaler (as StandardScaler): shared covariates are standardized once, each PRS column by itself
+        # only applied on numerical features; NA is filled with 0 (mean of scaler = 0)
+        cov_x, cov_numerical, cov_mean, cov_scale = self._standardize(self.covs)
+        prs_x, prs_numerical, prs_mean, prs_scale = self._standardize(self.tools)
+        cov_idx = np.flatnonzero(cov_numerical).tolist()
+
+        # regression: covariates only, then each PRS with covariates
+        print('Training covariates only ...')
+        for tool in self.tools:
+            print('Training {} with covariates ...'.format(tool))
+        if self.method == 'clf':
+            cov_coef, cov_intercept, coefs, intercepts = self._fit_logistic(prs_x, cov_x, y)
+        else:
+            cov_coef, cov_intercept, coefs, intercepts = self._fit_linear(prs_x, cov_x, y)
 
-        # apply regression
+        # models and predictions
         model_dict = dict()
-        tools = ['cov'] + self.tools
-        for tool in tools:
-            model_dict[tool] = dict() # columns, numerical_columns, scaler_mean, scaler_scale, reg_coef, reg_intercept
-            
-            # columns
+        for i, tool in enumerate(tools):
+            # columns, numerical_columns, scaler_mean, scaler_scale, reg_coef, reg_intercept
             if tool == 'cov':
-                print('Training covariates only ...')
-                cols = self.covs
-            else:
-                print('Training {} with covariates ...'.format(tool))
-                cols = [tool] + self.covs
-            model_dict[tool]['columns'] = cols
-
-            # numerical columns
-            numerical_cols = list()
-            for i in range(len(cols)):
-                if self.df[cols[i]].dropna().unique().shape[0] > 2:
-                    numerical_cols.append(i)
-            model_dict[tool]['numerical_columns'] = numerical_cols
-
-            # scaler: only applied on numerical features
-            x = self.df[cols].to_numpy()
-            scaler_mean = 0 
-            scaler_scale = 0
-            if len(numerical_cols) > 0:
-                x[:, numerical_cols] = scaler.fit_transform(x[:, numerical_cols])
-                scaler_mean = scaler.mean_.tolist()
-                scaler_scale = scaler.scale_.tolist()
-                
-            model_dict[tool]['scaler_mean'] = scaler_mean
-            model_dict[tool]['scaler_scale'] = scaler_scale
-            
-            # regression
-            x = np.nan_to_num(x) # fill NA with 0 (mean of scaler = 0)
-            reg.fit(x, y)
-            if self.method == 'clf':
-                pred = reg.predict_proba(x)[:,1]
-                model_dict[tool]['reg_coef'] = reg.coef_.tolist()[0]
-                model_dict[tool]['reg_intercept'] = reg.intercept_[0]
+                cols, x = self.covs, cov_x
+                numerical_cols = cov_idx
+                scaler_mean, scaler_scale = cov_mean[cov_idx].tolist(), cov_scale[cov_idx].tolist()
+                reg_coef, reg_intercept = cov_coef, cov_intercept
             else:
-                pred = reg.predict(x)
-                model_dict[tool]['reg_coef'] = reg.coef_.tolist()
-                model_dict[tool]['reg_intercept'] = reg.intercept_
-            
+                cols, x = [tool] + self.covs, np.column_stack([prs_x[:, i-1], cov_x])
+                prs_idx = [i-1] if prs_numerical[i-1] else []
+                numerical_cols = [0] * len(prs_idx) + [j + 1 for j in cov_idx]
+                scaler_mean = prs_mean[prs_idx].tolist() + cov_mean[cov_idx].tolist()
+                scaler_scale = prs_scale[prs_idx].tolist() + cov_scale[cov_idx].tolist()
+                reg_coef, reg_intercept = coefs[i-1], intercepts[i-1]
+            model_dict[tool] = {
+                'columns': cols,
+                'numerical_columns': numerical_cols,
+                'scaler_mean': scaler_mean if len(numerical_cols) > 0 else 0,
+                'scaler_scale': scaler_scale if len(numerical_cols) > 0 else 0,
+                'reg_coef': np.asarray(reg_coef).tolist(),
+                'reg_intercept': float(reg_intercept)
+            }
 
             # prediction
-            pred_df[tool] = pred
-        
+            pred = np.matmul(x, reg_coef) + reg_intercept
+            pred_df[tool] = 1 / (1 + np.exp(-pred)) if self.method == 'clf' else pred
+
         print('\n\n###### Complete ######\n\n')
         return pred_df, model_dict
 
 
+    def _standardize(self, cols):
+        # (samples, cols) matrix; numerical columns (> 2 unique values) are standardized as StandardScaler, and NA is filled with 0
+        # return the matrix, whether each column is numerical, and the mean and scale of each column (NA for non-numerical)
+        x = self.df[cols].to_numpy().astype(float).reshape(self.df.shape[0], len(cols))
+        numerical = np.array([self.df[col].dropna().unique().shape[0] > 2 for col in cols], dtype=bool)
+        mean = np.full(len(cols), np.nan)
+        scale = np.full(len(cols), np.nan)
+        if numerical.any():
+            mean[numerical] = np.nanmean(x[:, numerical], axis=0)
+            scale[numerical] = np.nanstd(x[:, numerical], axis=0)
+            scale[numerical & (scale < 10 * np.finfo(float).eps)] = 1.0
+            x[:, numerical] = (x[:, numerical] - mean[numerical]) / scale[numerical]
+        return np.nan_to_num(x), numerical, mean, scale
+
+
+    def _fit_linear(self, prs_x, cov_x, y):
+        # ordinary least squares of y ~ cov and y ~ prs + cov for all PRS columns at once
+        # the covariate Gram matrix is factorized once; each PRS is added as a rank-one update (Frisch-Waugh)
+        p = cov_x.shape[1]
+        y_mean = y.mean()
+        yc = y - y_mean
+        cov_mean = cov_x.mean(axis=0)
+        cc = cov_x - cov_mean
+        prs_mean = prs_x.mean(axis=0)
+        pc = prs_x - prs_mean
+
+        gram = cc.T @ cc
+        full_rank = p == 0 or np.linalg.matrix_rank(gram) == p
+        if full_rank:
+            chol = np.linalg.cholesky(gram) if p > 0 else np.zeros((0, 0))
+            solve = lambda b: np.linalg.solve(chol.T, np.linalg.solve(chol, b)) if p > 0 else np.zeros((0,) + b.shape[1:])
+            cov_coef = solve(cc.T @ yc)
+        else:
+            cov_coef = np.linalg.lstsq(cc, yc, rcond=None)[0]
+        cov_intercept = y_mean - cov_mean @ cov_coef
+
+        # residuals of PRS and y on the covariates
+        coefs = np.zeros((pc.shape[1], p + 1))
+        if pc.shape[1] > 0:
+            proj = solve(cc.T @ pc) if full_rank else np.linalg.lstsq(cc, pc, rcond=None)[0] # (p, tools)
+            res_prs = pc - cc @ proj
+            res_y = yc - cc @ cov_coef
+            ss = np.sum(res_prs**2, axis=0)
+            prs_coef = np.divide(res_prs.T @ res_y, ss, out=np.zeros_like(ss), where=ss > 0)
+            coefs[:, 0] = prs_coef
+            coefs[:, 1:] = cov_coef[None, :] - (proj * prs_coef[None, :]).T
+
+            # collinear PRS or covariates: minimum-norm solution as LinearRegression
+            degenerate = (ss <= 1e-12 * np.sum(pc**2, axis=0)) | (not full_rank)
+            for i in np.flatnonzero(degenerate):
+                coefs[i] = np.linalg.lstsq(np.column_stack([pc[:, i], cc]), yc, rcond=None)[0]
+        intercepts = y_mean - coefs[:, 0] * prs_mean - coefs[:, 1:] @ cov_mean
+        return cov_coef, cov_intercept, coefs, intercepts
+
+
+    def _fit_logistic(self, prs_x, cov_x, y):
+        # LogisticRegression (lbfgs) of y ~ cov and y ~ prs + cov on the shared standardized matrices
+        # the solver and its tolerance are kept, so models.json is the same as fitting each model by itself
+        reg = LogisticRegression()
+        reg.fit(cov_x, y)
+        cov_coef, cov_intercept = reg.coef_[0], reg.intercept_[0]
+        coefs = np.zeros((prs_x.shape[1], cov_x.shape[1] + 1))
+        intercepts = np.zeros(prs_x.shape[1])
+        for i in range(prs_x.shape[1]):
+            reg = LogisticRegression()
+            reg.fit(np.column_stack([prs_x[:, i], cov_x]), y)
+            coefs[i], intercepts[i] = reg.coef_[0], reg.intercept_[0]
+        return cov_coef, cov_intercept, coefs, intercepts
+
+
     def Test(self, model_path):
         print('\n\n###### Predicting Risk Scores with Covariates ######\n\n')
 
@@ -282,11 +424,9 @@ class CovResults():
         model_dict = json.load(open(model_path, 'r'))
         model_tools = list(model_dict.keys())
 
-        # predict
-        pred_df = self.df.loc[:, ['FID', 'IID', 'phenotype']]
-        y = self.df['phenotype'].to_numpy()
-        tools = ['cov'] + self.tools
-        for tool in tools:
+        # models to apply
+        tools = list()
+        for tool in ['cov'] + self.tools:
             if not tool in model_tools:
                 print('Skip {} because of no available model'.format(tool))
                 continue
@@ -294,41 +434,75 @@ class CovResults():
                 print('Testing covariates only ...')
             else:
                 print('Testing {} with covariates ...'.format(tool))
+            tools.append(tool)
 
-            # model
-            cols = model_dict[tool]['columns']
-            numerical_cols = model_dict[tool]['numerical_columns']
-            scaler_mean = np.array(model_dict[tool]['scaler_mean'])
-            scaler_scale = np.array(model_dict[tool]['scaler_scale'])
-            reg_coef = np.array(model_dict[tool]['reg_coef'])
-            reg_intercept = model_dict[tool]['reg_intercept']
-            
-            # x
-            x = self.df[cols].to_numpy()
-            if len(numerical_cols) > 0:
-                x[:, numerical_cols] = (x[:, numerical_cols] - scaler_mean) / scaler_scale
+        # one feature matrix shared by all models: covariates and every PRS column
+        features = list()
+        for tool in tools:
+            features += [col for col in model_dict[tool]['columns'] if col not in features]
+        x = self.df[features].to_numpy(dtype=np.float64, copy=True)
+        weight, intercept, na_weight = self._stack_models(model_dict, tools, features)
+
+        # NA features contribute 0 after scaling: x is filled with 0 and the folded mean is added back
+        na = np.isnan(x)
+        na_cols = np.flatnonzero(na.any(axis=0))
+        if len(na_cols) > 0:
+            x[na] = 0
+        pred = np.matmul(x, weight)
+        pred += intercept
+        if len(na_cols) > 0:
+            pred += np.matmul(na[:, na_cols], na_weight[na_cols])
 
-            # regression
-            x = np.nan_to_num(x)
-            if self.method == 'clf':
-                pred = 1 / (1 + np.exp(-(np.matmul(x, reg_coef) + reg_intercept)))
-            else:
-                pred = np.matmul(x, reg_coef) + reg_intercept
+        # regression
+        if self.method == 'clf':
+            np.negative(pred, out=pred)
+            np.exp(pred, out=pred)
+            pred += 1
+            np.reciprocal(pred, out=pred)
+
+        # record
+        pred_df = pd.concat([self.df.loc[:, ['FID', 'IID', 'phenotype']].reset_index(drop=True),
+                             pd.DataFrame(pred, columns=tools)], axis=1)
+        pred_df.index = self.df.index
 
-            # record
-            pred_df[tool] = pred
-        
         print('\n\n###### Complete ######\n\n')
         return pred_df
 
 
+    @staticmethod
+    def _stack_models(model_dict, tools, features):
+        # (features, tools) coefficients with the scalers folded in: coef * (x - mean) / scale = (coef / scale) * x - coef * mean / scale
+        feature_idx = {col: i for i, col in enumerate(features)}
+        weight = np.zeros((len(features), len(tools)))
+        intercept = np.zeros(len(tools))
+        na_weight = np.zeros((len(features), len(tools))) # the folded mean of the NA features, which are 0 after scaling
+        for k, tool in enumerate(tools):
+            cols = model_dict[tool]['columns']
+            numerical_cols = model_dict[tool]['numerical_columns']
+            coef = np.array(model_dict[tool]['reg_coef'], dtype=np.float64)
+            mean = np.zeros(len(cols))
+            scale = np.ones(len(cols))
+            if len(numerical_cols) > 0:
+                mean[numerical_cols] = model_dict[tool]['scaler_mean']
+                scale[numerical_cols] = model_dict[tool]['scaler_scale']
+            idx = [feature_idx[col] for col in cols]
+            weight[idx, k] = coef / scale
+            na_weight[idx, k] = coef * mean / scale
+            intercept[k] = model_dict[tool]['reg_intercept'] - np.sum(coef * mean / scale)
+        return weight, intercept, na_weight
+
+
 
 # build population reference, including rank and histogram
+# exact: keep the sorted scores of the cohort (ExactRankRef) for exact tail ranks, instead of interpolating 104 percentiles
+# ref_state: the ExactRankRef of an existing cohort, which the predictions are merged into without the predictions of the cohort
 class CohortRef():
-    def __init__(self, pred_df, rank_ref_file=None):
+    def __init__(self, pred_df, rank_ref_file=None, exact=False, ref_state=None):
         print('\n\n###### Building Cohort Reference ######\n\n')
         ### prediction dataframe
         self.df = pred_df
+        self.exact = exact
+        self.exact_ref = None
 
         ### ranking dataframe
         if rank_ref_file:
@@ -336,11 +510,25 @@ class CohortRef():
             self.rank_ref_df = pd.read_csv(rank_ref_file, index_col=0)
             if self.rank_ref_df.index.name is not None:
                 self.rank_ref_df = pd.read_csv(rank_ref_file)
+            if exact:
+                if os.path.isfile(ExactRankRef.path(rank_ref_file)):
+                    print('Loading exact ranking reference ...')
+                    self.exact_ref = ExactRankRef.load(ExactRankRef.path(rank_ref_file))
+                else:
+                    print('No exact ranking reference; ranks are interpolated from percentiles')
+        elif ref_state is not None:
+            print('Merging into the provided reference state ...')
+            self.exact_ref = ref_state.merge(ExactRankRef({tool: self.df[tool] for tool in self.df.columns[3:]}))
+            print('Building ranking reference and histogram ...')
+            self.rank_ref_df, self.hist_ref_df = self.exact_ref.summary()
         else:
             print('Building ranking reference ...')
             self.rank_ref_df = self._build_rank_ref(self.df)
             print('Building histogram...')
             self.hist_ref_df = self._build_histogram_ref(self.df, self.rank_ref_df)
+            if exact:
+                print('Building exact ranking reference ...')
+                self.exact_ref = ExactRankRef({tool: self.df[tool] for tool in self.df.columns[3:]})
 
 
     def __call__(self):
@@ -349,6 +537,11 @@ class CohortRef():
         return self.rank_df
 
 
+    def map(self, df):
+        # ranks of other predictions by the reference, e.g. the chunks of a PredictionStream
+        return self._map_rank(df, self.rank_ref_df)
+
+
     def _build_rank_ref(self, df):
         rank_list = list(range(100)) + [99.5, 99.7, 99.9, 100]
         rank_df = pd.DataFrame(index=rank_list)
@@ -361,6 +554,9 @@ class CohortRef():
     def _map_rank(self, df, rank_ref_df):
         rank_df = df.loc[:, df.columns[:3]]
         for tool in df.columns[3:].tolist():
+            if self.exact and self.exact_ref is not None and tool in self.exact_ref.tools:
+                rank_df[tool] = self.exact_ref.rank(tool, df[tool])
+                continue
             if tool not in rank_ref_df.columns.tolist():
                 continue
             interp_rank = np.interp(df[tool], rank_ref_df[tool], rank_ref_df.index.tolist())
@@ -379,9 +575,91 @@ class CohortRef():
 
 
 
+# sorted float32 scores of a cohort per tool; the rank of a score is its position in the cohort, by binary search
+# references of cohorts merge into the reference of the union, whose rank_ref.csv, hist_ref.csv, and moments are exact
+class ExactRankRef():
+    def __init__(self, scores):
+        self.scores = dict()
+        for tool, v in scores.items():
+            v = np.asarray(v, dtype=np.float32)
+            self.scores[tool] = np.sort(v[~np.isnan(v)])
+        self.tools = list(self.scores.keys())
+        self._grid = dict()
+
+
+    @staticmethod
+    def path(rank_ref_file):
+        return '{}.npz'.format(os.path.splitext(rank_ref_file)[0])
+
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file) as npz:
+            return cls({tool: npz[tool] for tool in npz.files})
+
+
+    def save(self, file):
+        np.savez(file, **self.scores)
+
+
+    def merge(self, other):
+        # sorted runs merge in linear time by the stable sort; only the tools of both cohorts are kept
+        tools = [tool for tool in self.tools if tool in other.tools]
+        skipped = [tool for tool in self.tools + other.tools if tool not in tools]
+        if len(skipped) > 0:
+            print('Skip {} because of not in both references'.format(', '.join(sorted(set(skipped)))))
+        return ExactRankRef({tool: np.sort(np.concatenate([self.scores[tool], other.scores[tool]]), kind='stable') for tool in tools})
+
+
+    def summary(self):
+        # rank_ref and hist_ref of CohortRef
+        rank_list = list(range(100)) + [99.5, 99.7, 99.9, 100]
+        rank_df = pd.DataFrame(index=rank_list)
+        hist_df = pd.DataFrame()
+        for tool in self.tools:
+            scores = self.scores[tool].astype(np.float64)
+            rank_df[tool] = np.percentile(scores, rank_list)
+            hist, bin_edges = np.histogram(scores, bins=100, range=(rank_df.loc[0, tool], rank_df.loc[100, tool]), density=True)
+            hist_df[tool] = hist
+        return rank_df, hist_df
+
+
+    def moments(self):
+        # number, mean, and standard deviation of the scores of each tool
+        return pd.DataFrame({tool: [len(v), np.mean(v, dtype=np.float64), np.std(v, dtype=np.float64, ddof=1) if len(v) > 1 else np.nan]
+                             for tool, v in self.scores.items()}, index=['n', 'mean', 'std'])
+
+
+    def grid(self, tool):
+        # distinct scores and their ranks: the inverse of np.percentile (linear), ties at the middle of their positions
+        if tool not in self._grid:
+            scores = self.scores[tool]
+            n = len(scores)
+            value, first, count = np.unique(scores, return_index=True, return_counts=True)
+            rank = (first + (count - 1) / 2) * 100 / max(n - 1, 1)
+            self._grid[tool] = (value.astype(np.float64), rank)
+        return self._grid[tool]
+
+
+    def rank(self, tool, values):
+        # scores out of the range of the cohort are clamped to 0 and 100, as np.interp of rank_ref.csv
+        value, rank = self.grid(tool)
+        values = np.asarray(values, dtype=np.float64)
+        idx = np.clip(np.searchsorted(value, values, side='right'), 1, max(len(value) - 1, 1))
+        if len(value) == 1:
+            result = np.full(values.shape, rank[0])
+        else:
+            x0, x1 = value[idx - 1], value[idx]
+            frac = np.clip((values - x0) / (x1 - x0), 0, 1)
+            result = rank[idx - 1] + frac * (rank[idx] - rank[idx - 1])
+        return np.where(values < value[0], 0, np.where(values > value[-1], 100, result))
+
+
+
 # analyze the prediction
+# figures are rendered by a RenderQueue: the queue given is shared and closed by the caller, otherwise figures are saved in __call__
 class Analysis():
-    def __init__(self, df, method, outdir):
+    def __init__(self, df, method, outdir, render_queue=None):
         print('\n\n###### Preparing for Analysis ######\n\n')
         # preprocessing dataframe
         self.df = df
@@ -402,23 +680,34 @@ class Analysis():
         if not os.path.isdir(self.outdir):
             os.mkdir(self.outdir)
 
+        # figures
+        self.render_queue = render_queue
+
 
-    def __call__(self, percentile_num=10, fontsize=8, linewidth=1, figsize=3, dpi=200):
+    def __call__(self, percentile_num=10, fontsize=8, linewidth=1, figsize=3, dpi=200, roc_points=0, bootstrap=0, seed=0, processes=1):
         print('\n\n###### Analyzing PRS Performance ######\n\n')
         self.percentile_num = percentile_num
+        self.roc_points = roc_points # the maximum number of points of each curve in roc.json; 0 = all thresholds
+        self.bootstrap = bootstrap # the number of bootstrap replicates of the confidence intervals; 0 = no bootstrap
+        self.seed = seed
+        self.processes = processes
         self.fontsize = fontsize
         self.linewidth = linewidth
         self.figsize = figsize
         self.dpi = dpi
+        self.style = {'fontsize': fontsize, 'linewidth': linewidth, 'figsize': figsize, 'dpi': dpi}
 
-        plt.rcParams.update({'font.size': fontsize})
-
+        queue = self.render_queue if self.render_queue is not None else RenderQueue()
+        self.queue = queue
         if self.method == 'clf':
             print('Analyzing Classification ...')
             self.AnaCLF()
         elif self.method == 'reg':
             print('Analyzing Regression ...')
             self.AnaREG()
+        if self.render_queue is None:
+            print('Rendering figures ...')
+            queue.close()
         
         print('\n\n###### Complete ######\n\n')
 
@@ -427,19 +716,21 @@ class Analysis():
         ##### ROC, PRC
         print('Calculating metrics auROC and auPRC ...')
         self.results = dict()
-        self.results['ROC'] = self._roc_plot(self.df, self.tools, title='ROC', figfile='{}/ROC.png'.format(self.outdir))
-        self.results['PRC'] = self._prc_plot(self.df, self.tools, title='PRC', figfile='{}/PRC.png'.format(self.outdir))
+        curves = binary_curves(self.df['phenotype'], self.df[self.tools].to_numpy(dtype=np.float64))
+        self.results['ROC'] = self._roc_plot(curves, self.tools, title='ROC', figfile='{}/ROC.png'.format(self.outdir))
+        self.results['PRC'] = self._prc_plot(curves, self.tools, title='PRC', figfile='{}/PRC.png'.format(self.outdir))
         json.dump(self.results, open('{}/performance.json'.format(self.outdir), 'w'))
+        self._bootstrap()
 
         ##### distribution
         print('Plotting prediction distribution ...')
-        self._dist_plot(self.df, self.tools, figfile='{}/distribution.png'.format(self.outdir))
+        self.queue.submit(draw_dist, self.df[['phenotype'] + self.tools], self.tools, self.style, figfile='{}/distribution.png'.format(self.outdir))
 
         ##### percentile
         print('Calculating percentile distribution ...')
         self.percentile_df = self._percentile(self.df, self.tools, n=self.percentile_num, clf=True)
         self.percentile_df.to_csv('{}/percentile.csv'.format(self.outdir), index=False)
-        self._or_percentile_plot(self.percentile_df, title='percentile of OR', figfile='{}/ORpercentile.png'.format(self.outdir))
+        self.queue.submit(draw_or_percentile, self.percentile_df, self.style, title='percentile of OR', figfile='{}/ORpercentile.png'.format(self.outdir))
 
 
     def AnaREG(self):
@@ -463,72 +754,364 @@ class Analysis():
             spearman, pvalue = stats.spearmanr(y, pred)
             self.results['Spearman'][tool] = [spearman, pvalue]
         json.dump(self.results, open('{}/performance.json'.format(self.outdir), 'w'))
+        self._bootstrap()
         
         # plot
-        self._bar_plot(self.results, 'Pearson', figfile='{}/pearson.png'.format(self.outdir))
-        self._bar_plot(self.results, 'Spearman', figfile='{}/spearman.png'.format(self.outdir))
+        self.queue.submit(draw_bar, self.results, 'Pearson', self.style, figfile='{}/pearson.png'.format(self.outdir))
+        self.queue.submit(draw_bar, self.results, 'Spearman', self.style, figfile='{}/spearman.png'.format(self.outdir))
 
         ##### percentile
         print('Calculating percentile distribution ...')
         self.percentile_df = self._percentile(self.df, self.tools, n=self.percentile_num, clf=False)
         self.percentile_df.to_csv('{}/percentile.csv'.format(self.outdir), index=False)
-        self._percentile_plot(self.percentile_df, title='percentile', figfile='{}/percentile.png'.format(self.outdir))
+        self.queue.submit(draw_percentile, self.percentile_df, self.style, title='percentile', figfile='{}/percentile.png'.format(self.outdir))
 
 
-    def _roc_plot(self, df, tools, title=None, figfile=None):
-        # figure
-        fig, ax = plt.subplots(1, 1, figsize=(self.figsize*1.25, self.figsize), dpi=self.dpi)
+    def _bootstrap(self, level=0.95):
+        # confidence intervals of the metrics of performance.json, saved as bootstrap.json
+        if self.bootstrap <= 0:
+            return
+        print('Calculating {:.0f}% confidence intervals by {} bootstrap replicates ...'.format(level*100, self.bootstrap))
+        bootstrap = Bootstrap(self.df['phenotype'], self.df[self.tools].to_numpy(dtype=np.float64), self.tools, self.method,
+                              n_boot=self.bootstrap, seed=self.seed, processes=self.processes)
+        self.ci = bootstrap(level=level)
+        json.dump({'n_bootstrap': self.bootstrap, 'seed': self.seed, 'level': level, **self.ci},
+                  open('{}/bootstrap.json'.format(self.outdir), 'w'))
+
 
-        # calculate AUC
+    def _roc_plot(self, curves, tools, title=None, figfile=None):
+        # AUC from the curves of binary_curves
         roc_res={}
         results = dict()
-        for tool in tools:
-            pred = df[tool]
-            fpr, tpr, _ = metrics.roc_curve(df['phenotype'], pred)
-            auc = metrics.auc(fpr, tpr)
+        plot_curves = list()
+        for tool, curve in zip(tools, curves):
+            fpr, tpr, auc = curve['fpr'], curve['tpr'], curve['auc']
             results[tool] = auc
-            ax.plot(fpr, tpr, label='%s,AUC=%.3f'%(tool, auc), linewidth=self.linewidth)
+            plot_curves.append((fpr, tpr, '%s,AUC=%.3f'%(tool, auc)))
+            fpr, tpr = downsample_curve(fpr, tpr, self.roc_points)
             roc_res[tool] = {'fpr':fpr.tolist(),'tpr':tpr.tolist(),'auc':auc}
 
         # output fpr tpr to roc.json
         json.dump(roc_res, open('{}/roc.json'.format(self.outdir), 'w'))
+
+        # figure
+        if figfile:
+            self.queue.submit(draw_roc, plot_curves, self.style, title=title, figfile=figfile)
+        return results
+
+
+    def _prc_plot(self, curves, tools, title=None, figfile=None):
+        # AP from the curves of binary_curves
+        results = dict()
+        plot_curves = list()
+        for tool, curve in zip(tools, curves):
+            results[tool] = curve['ap']
+            plot_curves.append((curve['recall'], curve['precision'], '%s,AP=%.3f'%(tool, curve['ap'])))
+
+        # figure
+        if figfile:
+            self.queue.submit(draw_prc, plot_curves, self.style, title=title, figfile=figfile)
+        return results
+
+    
+    def _percentile(self, df, tools, n=10, clf=True):
+        # percentile of each rank in descending order: the first (interval + remainder) ranks are the top percentile
+        size = df.shape[0]
+        interval = int(size // n)
+        idx = np.array([(i+1)*(100/n) for i in range(n)])
+        counts = np.full(n, interval)
+        counts[-1] += size - interval*n
+        percentile_arr = np.repeat(idx[::-1], counts[::-1])
+        bin_arr = np.repeat(np.arange(n)[::-1], counts[::-1]) # index of idx
+
+        # order of each tool, descending; each sort starts from the order of the previous tool as sort_values of a DataFrame
+        phenotype = df['phenotype'].to_numpy()
+        order = np.arange(size)
+        orders = list()
+        for tool in tools:
+            order = order[self._argsort_desc(df[tool].to_numpy()[order])]
+            orders.append(order)
+
+        # regression
+        if not clf:
+            result_df = pd.DataFrame({
+                'phenotype': np.concatenate([phenotype[order] for order in orders]),
+                'PRS': np.concatenate([df[tool].to_numpy()[order] for tool, order in zip(tools, orders)]),
+                'tool': np.repeat(tools, size),
+                'percentile': np.tile(percentile_arr, len(tools)),
+            }, index=np.concatenate([df.index.to_numpy()[order] for order in orders]))
+            return result_df
+
+        # calculate OR for classification: cases and controls of each (tool, percentile) by one bincount
+        base_neg, base_pos = [int((phenotype==i).sum())//n for i in [0, 1]]
+        bins = np.concatenate([k*n + bin_arr for k in range(len(tools))])
+        sorted_phenotype = np.concatenate([phenotype[order] for order in orders])
+        pos = np.bincount(bins, weights=sorted_phenotype==1, minlength=n*len(tools)).astype(int)
+        neg = np.bincount(bins, weights=sorted_phenotype==0, minlength=n*len(tools)).astype(int)
+        return self._or_table(tools, idx, counts, pos, neg, base_pos, base_neg)
+
+
+    def _or_table(self, tools, idx, counts, pos, neg, base_pos, base_neg):
+        # OR of the cases (pos) and controls (neg) of each (tool, percentile) against the expected of a percentile
+        OR, ci_upper, ci_lower = self._cal_or(pos.astype(float), neg.astype(float), float(base_pos), float(base_neg))
+        or_df = pd.DataFrame({'tool': np.repeat(tools, len(idx)), 'percentile': np.tile(idx, len(tools)), 'OR': OR,
+                              'ci_upper': ci_upper, 'ci_lower': ci_lower, 'pos_num': pos, 'neg_num': neg})
+        # percentiles without samples (fewer samples than n) are not listed
+        return or_df[np.tile(counts > 0, len(tools))].reset_index(drop=True)
+
+
+    def _argsort_desc(self, values):
+        # the same order as sort_values(ascending=False): reversed quicksort of the reversed values, NaN last
+        mask = np.isnan(values)
+        non_nan_idx = np.flatnonzero(~mask)[::-1]
+        indexer = non_nan_idx[values[non_nan_idx].argsort(kind='quicksort')][::-1]
+        return np.concatenate([indexer, np.flatnonzero(mask)])
+
+
+    def _cal_or(self, a, b, c, d):
+        a += 0.5
+        b += 0.5
+        c += 0.5
+        d += 0.5
+        OR = (a*d) / (b*c)
+        se = np.sqrt(1/a + 1/b + 1/c + 1/d) # SE(log(OR))
+        ci_upper = np.exp(np.log(OR) + 1.96*se)
+        ci_lower = np.exp(np.log(OR) - 1.96*se)
+        return OR, ci_upper, ci_lower
+
+
+
+# ROC and PR curves of the score columns (samples, tools), each sorted once: the cumulative true and false positives at
+# the distinct thresholds give fpr, tpr, and auc as metrics.roc_curve and metrics.auc, and precision, recall, and ap
+# as metrics.precision_recall_curve and metrics.average_precision_score
+def binary_curves(y_true, scores):
+    y_true = np.asarray(y_true) == 1
+    order = np.argsort(-scores, axis=0, kind='stable')
+    sorted_scores = np.take_along_axis(scores, order, axis=0)
+    tps_all = np.cumsum(y_true[order], axis=0, dtype=np.float64)
+
+    curves = list()
+    for k in range(scores.shape[1]):
+        threshold_idxs = np.r_[np.flatnonzero(np.diff(sorted_scores[:, k])), scores.shape[0] - 1]
+        tps = tps_all[threshold_idxs, k]
+        fps = 1 + threshold_idxs.astype(np.float64) - tps
+        curves.append(threshold_curve(tps, fps))
+    return curves
+
+
+# ROC and PR curves of the cumulative true and false positives at the thresholds in descending order
+def threshold_curve(tps, fps):
+    # ROC: points collinear with their neighbours are dropped, and the curve starts at (0, 0)
+    if fps.shape[0] > 2:
+        optimal_idxs = np.flatnonzero(np.r_[True, np.logical_or(np.diff(fps, 2), np.diff(tps, 2)), True])
+        roc_fps, roc_tps = np.r_[0.0, fps[optimal_idxs]], np.r_[0.0, tps[optimal_idxs]]
+    else:
+        roc_fps, roc_tps = np.r_[0.0, fps], np.r_[0.0, tps]
+    fpr = roc_fps / roc_fps[-1] if roc_fps[-1] > 0 else np.full(roc_fps.shape, np.nan)
+    tpr = roc_tps / roc_tps[-1] if roc_tps[-1] > 0 else np.full(roc_tps.shape, np.nan)
+
+    # PR: reversed so that recall is decreasing, ending at (recall 0, precision 1)
+    ps = tps + fps
+    precision = np.zeros_like(tps)
+    np.divide(tps, ps, out=precision, where=(ps != 0))
+    recall = tps / tps[-1] if tps[-1] != 0 else np.ones_like(tps)
+    precision = np.r_[precision[::-1], 1.0]
+    recall = np.r_[recall[::-1], 0.0]
+    ap = float(max(0.0, -np.sum(np.diff(recall) * precision[:-1])))
+
+    return {'fpr': fpr, 'tpr': tpr, 'auc': metrics.auc(fpr, tpr), 'precision': precision, 'recall': recall, 'ap': ap}
+
+
+# at most n points of a curve, evenly spaced along its length and keeping both ends; n <= 0 keeps all points
+def downsample_curve(x, y, n=0):
+    if n <= 0 or len(x) <= n:
+        return x, y
+    length = np.r_[0, np.cumsum(np.hypot(np.diff(x), np.diff(y)))]
+    if length[-1] == 0:
+        return x[[0, -1]], y[[0, -1]]
+    idx = np.unique(np.r_[np.searchsorted(length / length[-1], np.linspace(0, 1, n - 1), side='left'), len(x) - 1])
+    idx = np.minimum(idx, len(x) - 1)
+    return x[idx], y[idx]
+
+
+# bootstrap confidence intervals of the metrics of all tools: a replicate resamples the samples with replacement, which
+# weights each sample by the times it is drawn; the replicates are evaluated in chunks of one integer matrix of resample
+# indices, with the metrics computed from the tie groups of each tool sorted once and the weighted moments of all tools
+# clf: ROC (Mann-Whitney U of the tie groups) and PRC (average precision); reg: Pearson and Spearman
+class Bootstrap():
+    def __init__(self, y, scores, tools, method, n_boot=1000, seed=0, processes=1, chunk_cells=250000):
+        self.y = np.asarray(y, dtype=np.float64)
+        self.scores = np.asarray(scores, dtype=np.float64)
+        self.tools = tools
+        self.method = method
+        self.n_boot = n_boot
+        self.seed = seed
+        self.processes = max(1, processes)
+        # replicates per chunk: the (replicates, samples) matrices of a chunk have at most chunk_cells cells
+        self.chunk_size = max(1, chunk_cells // max(1, self.y.shape[0]))
+
+        # tie groups of each tool in the ascending order of scores: the order, the start of each group, and the group of each sample
+        self.groups = [_tie_groups(self.scores[:, k]) for k in range(self.scores.shape[1])]
+        if method == 'reg':
+            self.y_groups = _tie_groups(self.y)
+
+
+    def __call__(self, level=0.95):
+        # each chunk has its own random stream of the seed, so the replicates do not depend on the number of processes
+        sizes = [min(self.chunk_size, self.n_boot - i) for i in range(0, self.n_boot, self.chunk_size)]
+        streams = np.random.SeedSequence(self.seed).spawn(len(sizes))
+        tasks = list(zip(sizes, streams))
+        n_workers = min(self.processes, len(tasks))
+        if n_workers == 1:
+            _init_bootstrap(self)
+            results = [_bootstrap_chunk(task) for task in tasks]
+        else:
+            with mp.Pool(n_workers, initializer=_init_bootstrap, initargs=(self,)) as pool:
+                results = pool.map(_bootstrap_chunk, tasks, chunksize=1)
+        replicates = {metric: np.concatenate([result[metric] for result in results], axis=0) for metric in results[0]}
+
+        # percentile intervals of the replicates
+        alpha = (1 - level) / 2 * 100
+        ci = OrderedDict()
+        for metric, values in replicates.items():
+            lower, upper = np.nanpercentile(values, [alpha, 100 - alpha], axis=0)
+            ci[metric] = {tool: [float(lower[k]), float(upper[k])] for k, tool in enumerate(self.tools)}
+        self.replicates = replicates
+        return ci
+
+
+    def evaluate(self, weights):
+        # metrics of the replicates (rows of weights), each as (replicates, tools)
+        if self.method == 'clf':
+            case = self.y == 1
+            auc = np.empty((weights.shape[0], len(self.tools)))
+            ap = np.empty((weights.shape[0], len(self.tools)))
+            for k, (order, starts, _) in enumerate(self.groups):
+                w = weights[:, order]
+                pos = w * case[order]
+                # weighted cases and samples of each tie group; without ties, each sample is a group
+                if starts.shape[0] < order.shape[0]:
+                    pos = np.add.reduceat(pos, starts, axis=1)
+                    w = np.add.reduceat(w, starts, axis=1)
+                neg = w - pos
+                n_pos, n_neg = pos.sum(axis=1), neg.sum(axis=1)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    # U: the weighted cases over the controls of lower scores, with ties counted half
+                    below = np.cumsum(neg, axis=1) - neg
+                    auc[:, k] = (pos * (below + 0.5 * neg)).sum(axis=1) / (n_pos * n_neg)
+                    # AP: precision at each threshold from the highest, weighted by the recall gained there;
+                    # the weights are counts, so a threshold of any sample has at least 1 sample
+                    pos = pos[:, ::-1]
+                    precision = np.cumsum(pos, axis=1) / np.maximum(np.cumsum(w[:, ::-1], axis=1), 1)
+                    ap[:, k] = (pos * precision).sum(axis=1) / n_pos
+            return {'ROC': auc, 'PRC': ap}
+        else:
+            pearson = _weighted_pearson(weights, self.scores, self.y)
+            y_rank = _weighted_ranks(weights, *self.y_groups)
+            spearman = np.empty((weights.shape[0], len(self.tools)))
+            for k, groups in enumerate(self.groups):
+                rank = _weighted_ranks(weights, *groups)
+                spearman[:, k] = _weighted_pearson_rows(weights, rank, y_rank)
+            return {'Pearson': pearson, 'Spearman': spearman}
+
+
+# the bootstrap shared by the workers
+_BOOTSTRAP = None
+
+def _init_bootstrap(bootstrap):
+    global _BOOTSTRAP
+    _BOOTSTRAP = bootstrap
+
+
+def _bootstrap_chunk(task):
+    # resample indices of the chunk as one integer matrix, counted into the weight of each sample per replicate
+    size, stream = task
+    n = _BOOTSTRAP.y.shape[0]
+    idx = np.random.default_rng(stream).integers(0, n, size=(size, n))
+    idx += np.arange(size)[:, None] * n
+    weights = np.bincount(idx.ravel(), minlength=size*n).reshape(size, n).astype(np.float64)
+    return _BOOTSTRAP.evaluate(weights)
+
+
+def _tie_groups(values):
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(sorted_values)) + 1]
+    group = np.empty(values.shape[0], dtype=np.int64)
+    group[order] = np.cumsum(np.r_[0, np.diff(sorted_values) != 0])
+    return order, starts, group
+
+
+def _weighted_ranks(weights, order, starts, group):
+    # average ranks in each replicate: a tie group of c samples drawn after m samples ranks (m + 1 + m + c) / 2
+    count = np.add.reduceat(weights[:, order], starts, axis=1)
+    rank = np.cumsum(count, axis=1) - (count - 1) / 2
+    return rank[:, group]
+
+
+def _weighted_pearson(weights, x, y):
+    # Pearson correlation of each replicate (rows of weights) and each column of x with y, by the weighted moments
+    # of the centered values; the sum of weights of a replicate is the number of samples
+    n = weights.sum(axis=1)[:, None]
+    x = x - x.mean(axis=0)
+    y = y - y.mean()
+    mx = weights @ x / n
+    my = weights @ y[:, None] / n
+    sxy = weights @ (x * y[:, None]) / n - mx * my
+    sxx = weights @ (x * x) / n - mx * mx
+    syy = weights @ (y * y)[:, None] / n - my * my
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return sxy / np.sqrt(sxx * syy)
+
+
+def _weighted_pearson_rows(weights, x, y):
+    # the same as _weighted_pearson with x and y of each replicate (rows)
+    n = weights.sum(axis=1)
+    mx = (weights * x).sum(axis=1) / n
+    my = (weights * y).sum(axis=1) / n
+    x = x - mx[:, None]
+    y = y - my[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (weights * x * y).sum(axis=1) / np.sqrt((weights * x * x).sum(axis=1) * (weights * y * y).sum(axis=1))
+
+
+# figures of Analysis, rendered by RenderQueue; style: fontsize, linewidth, figsize, and dpi
+def draw_roc(curves, style, title=None, figfile=None):
+    with plt.rc_context({'font.size': style['fontsize']}):
+        # figure
+        fig, ax = plt.subplots(1, 1, figsize=(style['figsize']*1.25, style['figsize']), dpi=style['dpi'])
+        for fpr, tpr, label in curves:
+            ax.plot(fpr, tpr, label=label, linewidth=style['linewidth'])
+
         # adjust label and legend
         ax.legend(loc='lower right', handletextpad=0.2, borderpad=0.2)
         ax.plot([0, 1], [0, 1], '--', color='black')
         ax.set_xlim([0, 1])
         ax.set_ylim([0, 1])
-        ax.set_title(title, fontsize=self.fontsize+2)
+        ax.set_title(title, fontsize=style['fontsize']+2)
         ax.set_ylabel('True Positive Rate')
         ax.set_xlabel('False Positive Rate')
         ax.tick_params(axis='both', which='major')
-        
+
         # savefig
         fig.tight_layout()
         if figfile:
             fig.savefig(figfile)
         plt.close()
 
-        return results
-
 
-    def _prc_plot(self, df, tools, title=None, figfile=None):
+def draw_prc(curves, style, title=None, figfile=None):
+    with plt.rc_context({'font.size': style['fontsize']}):
         # figure
-        fig, ax = plt.subplots(1, 1, figsize=(self.figsize*1.25, self.figsize), dpi=self.dpi)
+        fig, ax = plt.subplots(1, 1, figsize=(style['figsize']*1.25, style['figsize']), dpi=style['dpi'])
+        for recall, precision, label in curves:
+            ax.plot(recall, precision, label=label, linewidth=style['linewidth'])
 
-        # calculate AUC
-        results = dict()
-        for tool in tools:
-            pred = df[tool]
-            precision, recall, _ = metrics.precision_recall_curve(df['phenotype'], pred)
-            auc = metrics.average_precision_score(df['phenotype'], pred)
-            results[tool] = auc
-            ax.plot(recall, precision, label='%s,AP=%.3f'%(tool, auc), linewidth=self.linewidth)
-        
         # adjust label and legend
         ax.legend(loc='best', handletextpad=0.2, borderpad=0.2)
         ax.set_xlim([0, 1])
         ax.set_ylim([0, 1])
-        ax.set_title(title, fontsize=self.fontsize+2)
+        ax.set_title(title, fontsize=style['fontsize']+2)
         ax.set_xlabel('Recall')
         ax.set_ylabel('Precision')
         ax.tick_params(axis='both', which='major')
@@ -538,18 +1121,17 @@ class Analysis():
         if figfile:
             fig.savefig(figfile)
         plt.close()
-        
-        return results
 
-    
-    def _dist_plot(self, df, tools, figfile=None):
+
+def draw_dist(df, tools, style, figfile=None):
+    with plt.rc_context({'font.size': style['fontsize']}):
         # figure
         if (len(tools)==4) or (len(tools)==2):
             ncol = 2
         else:
             ncol = 3
         nrow = int(np.ceil(len(tools)/ncol))
-        fig, ax = plt.subplots(nrow, ncol, figsize=(ncol*self.figsize, (nrow/1.5)*self.figsize), dpi=self.dpi)
+        fig, ax = plt.subplots(nrow, ncol, figsize=(ncol*style['figsize'], (nrow/1.5)*style['figsize']), dpi=style['dpi'])
 
         # distribution
         for i in range(len(tools)):
@@ -577,63 +1159,11 @@ class Analysis():
             fig.savefig(figfile, bbox_inches='tight')
         plt.close()
 
-    
-    def _percentile(self, df, tools, n=10, clf=True):
-        # percentile list
-        percentile_li = list()
-        interval = int(df.shape[0] // n)
-        idx = [(i+1)*(100/n) for i in range(n)]
-        for i in idx:
-            percentile_li += [i,] * interval
-            if i == idx[-1]:
-                percentile_li += [i,] * (df.shape[0] - interval*n)
-        percentile_li = percentile_li[::-1]
-    
-        # assign percentile to each tool
-        result_df = pd.DataFrame()
-        for tool in tools:
-            df = df.sort_values(by=tool, ascending=False)
-            temp_df = df.loc[:, ['phenotype', tool]]
-            temp_df['tool'] = tool
-            temp_df['percentile'] = percentile_li
-            temp_df = temp_df.rename(columns={tool: 'PRS'})
-            result_df = pd.concat([result_df, temp_df])
-    
-        # regression
-        if not clf:
-            return result_df
-    
-        # calculate OR for classification
-        or_df = pd.DataFrame(columns=['tool', 'percentile', 'OR', 'ci_upper', 'ci_lower', 'pos_num', 'neg_num'])
-        percentile_li = sorted(set(percentile_li))
-        base_neg, base_pos = [df[df['phenotype']==i].shape[0]//n for i in [0, 1]]
-        
-        for tool in tools:
-            # OR of each percentile
-            for percentile in percentile_li:
-                temp_df = result_df[(result_df['tool']==tool) & (result_df['percentile']==percentile)]
-                neg, pos = [temp_df[temp_df['phenotype']==i].shape[0] for i in [0, 1]]
-                OR, ci_upper, ci_lower = self._cal_or(pos, neg, base_pos, base_neg)
-                or_df.loc[len(or_df)] = [tool, percentile, OR, ci_upper, ci_lower, pos, neg]
-        
-        return or_df
-
 
-    def _cal_or(self, a, b, c, d):
-        a += 0.5
-        b += 0.5
-        c += 0.5
-        d += 0.5
-        OR = (a*d) / (b*c)
-        se = np.sqrt(1/a + 1/b + 1/c + 1/d) # SE(log(OR))
-        ci_upper = np.exp(np.log(OR) + 1.96*se)
-        ci_lower = np.exp(np.log(OR) - 1.96*se)
-        return OR, ci_upper, ci_lower
-
-
-    def _or_percentile_plot(self, percentile_df, title=None, figfile=None):
+def draw_or_percentile(percentile_df, style, title=None, figfile=None):
+    with plt.rc_context({'font.size': style['fontsize']}):
         # figure
-        fig, ax = plt.subplots(1, 1, figsize=(2*self.figsize, self.figsize), dpi=self.dpi)
+        fig, ax = plt.subplots(1, 1, figsize=(2*style['figsize'], style['figsize']), dpi=style['dpi'])
 
         # point plot
         sns.pointplot(x='percentile', y='OR', hue='tool', data=percentile_df,
@@ -660,7 +1190,7 @@ class Analysis():
         yerr = np.abs(bound_arr - base_arr).T
 
         ## plot
-        ax.errorbar(x=x_coords, y=y_coords, yerr=yerr, fmt=' ', ecolor=ecolor, elinewidth=self.linewidth/4)
+        ax.errorbar(x=x_coords, y=y_coords, yerr=yerr, fmt=' ', ecolor=ecolor, elinewidth=style['linewidth']/4)
 
         # savefig
         ax.legend(loc='upper left', ncol=3)
@@ -671,12 +1201,13 @@ class Analysis():
         plt.close()
 
 
-    def _percentile_plot(self, percentile_df, title=None, figfile=None):
+def draw_percentile(percentile_df, style, title=None, figfile=None):
+    with plt.rc_context({'font.size': style['fontsize']}):
         # plot
-        fig, ax = plt.subplots(1, 1, figsize=(2*self.figsize, self.figsize), dpi=self.dpi)
+        fig, ax = plt.subplots(1, 1, figsize=(2*style['figsize'], style['figsize']), dpi=style['dpi'])
         sns.pointplot(x='percentile', y='phenotype', hue='tool', data=percentile_df,
-                      join=False, dodge=0.3, scale=0.4, errwidth=self.linewidth/4, ax=ax)
-        
+                      join=False, dodge=0.3, scale=0.4, errwidth=style['linewidth']/4, ax=ax)
+
         # savefig
         ax.legend(loc='upper left', ncol=3)
         ax.set_title(title)
@@ -686,16 +1217,17 @@ class Analysis():
         plt.close()
 
 
-    def _bar_plot(self, result_dict, metric, title=None, figfile=None):
+def draw_bar(result_dict, metric, style, title=None, figfile=None):
+    with plt.rc_context({'font.size': style['fontsize']}):
         # df
         df = pd.DataFrame(result_dict[metric]).iloc[0]
-        
+
         # plot
-        fig, ax = plt.subplots(1, 1, figsize=(self.figsize, self.figsize), dpi=self.dpi)
+        fig, ax = plt.subplots(1, 1, figsize=(style['figsize'], style['figsize']), dpi=style['dpi'])
         sns.barplot(x=df.index, y=df, ax=ax)
-        ax.set_title(title, fontsize=self.fontsize+2)
+        ax.set_title(title, fontsize=style['fontsize']+2)
         ax.set_ylabel(metric)
-        
+
         # savefig
         fig.tight_layout()
         if figfile:
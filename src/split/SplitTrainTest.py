@@ -1,9 +1,12 @@
 #!/usr/bin/python3
+import os, sys
 import pandas as pd
 import numpy as np
 import argparse
 import matplotlib.pyplot as plt
 import seaborn as sns
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'prs'))
+from plinkio import read_fam
 
 def ArgumentParser():
     parser = argparse.ArgumentParser(prog='SplitTrainTest')
@@ -45,7 +48,7 @@ if __name__=='__main__':
     print('Method: {}, DropNA: {}, Random: {}'.format(method, dropna, random_mode))
 
     # laod fam file
-    fam_df = pd.read_csv(fam_file, sep='\s+', names=['FID', 'IID', 'father', 'mother', 'sex', 'phenotype'])
+    fam_df = read_fam(fam_file)
     na_num = fam_df[fam_df['phenotype'] == -9].shape[0]
     print('The ratio of missing phenotype: {0:.2f}'.format(na_num / fam_df.shape[0]))
 
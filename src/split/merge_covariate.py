@@ -3,6 +3,8 @@
 import os, sys, argparse
 import numpy as np
 import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'prs'))
+from plinkio import read_fam
 
 
 def parse_args():
@@ -19,10 +21,8 @@ def main():
     args = parse_args()
     
     # read fam file
-    df = pd.read_csv(args.fam, sep='\s+', names=['FID', 'IID', 'father', 'mother', 'sex', 'phenotype'])
+    df = read_fam(args.fam)
     df = df[['FID', 'IID']]
-    df.FID = df.FID.astype(str)
-    df.IID = df.IID.astype(str)
 
     # read PCA file
     if args.pca != '':